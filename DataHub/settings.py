@@ -12,8 +12,10 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 import logging
 import environ
+from celery.schedules import crontab
 env = environ.Env()
 environ.Env.read_env()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -83,21 +85,29 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'authentication.audit.AuditLogMiddleware',
 ]
 
 ROOT_URLCONF = 'DataHub.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compiled templates are kept per process in production; in DEBUG every
+            # render re-reads the file so template edits show up immediately
+            'loaders': TEMPLATE_LOADERS if DEBUG else [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)],
         },
     },
 ]
@@ -119,13 +129,54 @@ SOCIALACCOUNT_FORMS = {
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Production connection handling. DB_ROLE is 'web' for gunicorn and 'worker' for
+# Celery (set in the Procfile); it picks the statement timeout and pool size and
+# tags connections in pg_stat_activity. With DB_POOL each process keeps a
+# psycopg_pool pool (psycopg[pool]); otherwise connections persist for
+# DB_CONN_MAX_AGE seconds and are health-checked before reuse. Without DB_ROLE,
+# anything but gunicorn (migrate and other management commands) is a worker,
+# since the web statement timeout is too short for them.
+DB_ROLE = os.environ.get("DB_ROLE", "web" if "gunicorn" in (sys.argv[0] if sys.argv else "") else "worker")
+DB_POOL = os.environ.get("DB_POOL", "False") == "True"
+DB_CONN_MAX_AGE = int(os.environ.get("DB_CONN_MAX_AGE", 60))
+DB_STATEMENT_TIMEOUT_MS = {
+    'web': int(os.environ.get("DB_WEB_STATEMENT_TIMEOUT_MS", 5000)),
+    'worker': int(os.environ.get("DB_WORKER_STATEMENT_TIMEOUT_MS", 60000)),
+}
+DB_IDLE_IN_TRANSACTION_TIMEOUT_MS = int(os.environ.get("DB_IDLE_IN_TRANSACTION_TIMEOUT_MS", 60000))
+# Per process: a sync gunicorn worker serves one request at a time, a Celery
+# worker runs one task per child process
+DB_POOL_OPTIONS = {
+    'web': {
+        'min_size': int(os.environ.get("DB_WEB_POOL_MIN_SIZE", 1)),
+        'max_size': int(os.environ.get("DB_WEB_POOL_MAX_SIZE", 4)),
+        'timeout': int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+    },
+    'worker': {
+        'min_size': int(os.environ.get("DB_WORKER_POOL_MIN_SIZE", 1)),
+        'max_size': int(os.environ.get("DB_WORKER_POOL_MAX_SIZE", 2)),
+        'timeout': int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+    },
+}
+
 if DEBUG:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Writers queue for the lock up front instead of failing with "database is locked"
+            # when a transaction that has already read tries to write
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
         }
     }
+    # A second SQLite file standing in for the read replica; refresh it with
+    # `python manage.py sync_sqlite_replica`
+    if os.environ.get("SQLITE_REPLICA", "False") == "True":
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.replica.sqlite3',
+            'TEST': {'MIRROR': 'default'},
+        }
 else:
     DATABASES = {
         'default': {
@@ -135,8 +186,32 @@ else:
             'PASSWORD': os.environ.get('PASSWORD'),
             'HOST': os.environ.get('HOST'),
             'PORT': os.environ.get('PORT'),
+            'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'application_name': f'datahub-{DB_ROLE}',
+                'options': (
+                    f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS[DB_ROLE]}'
+                    f' -c idle_in_transaction_session_timeout={DB_IDLE_IN_TRANSACTION_TIMEOUT_MS}'
+                ),
+                **({'pool': DB_POOL_OPTIONS[DB_ROLE]} if DB_POOL else {}),
+            },
         }
     }
+    if os.environ.get('REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.environ.get('REPLICA_HOST'),
+            'PORT': os.environ.get('REPLICA_PORT', os.environ.get('PORT')),
+            'OPTIONS': {**DATABASES['default']['OPTIONS'], 'application_name': f'datahub-{DB_ROLE}-replica'},
+            'TEST': {'MIRROR': 'default'},
+        }
+
+# Reads from replica-safe views and exports go to DATABASES['replica'] when it
+# exists (packages.replicas); a user's own order or payment write keeps their
+# reads on the primary for REPLICA_STICKY_SECONDS
+DATABASE_ROUTERS = ['packages.replicas.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get("REPLICA_STICKY_SECONDS", 15))
 
 
 AUTH_USER_MODEL = 'authentication.CustomUser'
@@ -313,8 +388,112 @@ else:
 
 TEST_SECRET_KEY = os.environ.get("TEST_SECRET_KEY")
 TEST_PUBLIC_KEY = os.environ.get("TEST_PUBLIC_KEY")    
+PAYSTACK_API_BASE_URL = os.environ.get("PAYSTACK_API_BASE_URL", "https://api.paystack.co")
+PAYSTACK_CONNECT_TIMEOUT = float(os.environ.get("PAYSTACK_CONNECT_TIMEOUT", 3.05))
+PAYSTACK_READ_TIMEOUT = float(os.environ.get("PAYSTACK_READ_TIMEOUT", 10))
+
+# Payments still pending this long after checkout are checked against Paystack
+# by system.tasks.reconcile_pending_payments, and confirmed or failed
+PAYMENT_RECONCILE_AFTER = int(os.environ.get("PAYMENT_RECONCILE_AFTER", 1800))  # seconds
+PAYMENT_RECONCILE_MAX_AGE_HOURS = int(os.environ.get("PAYMENT_RECONCILE_MAX_AGE_HOURS", 48))
+PAYMENT_RECONCILE_BATCH_SIZE = int(os.environ.get("PAYMENT_RECONCILE_BATCH_SIZE", 100))
 # settings.py
 DATAMART_API_KEY = os.environ.get("DATAMART_API_KEY")
+DATAMART_API_BASE_URL = os.environ.get("DATAMART_API_BASE_URL", "https://api.datamartgh.shop/api/developer")
+
+# DataMart HTTP client: one pooled keep-alive session per process
+DATAMART_POOL_SIZE = int(os.environ.get("DATAMART_POOL_SIZE", 10))
+DATAMART_CONNECT_TIMEOUT = float(os.environ.get("DATAMART_CONNECT_TIMEOUT", 3.05))
+DATAMART_READ_TIMEOUT = float(os.environ.get("DATAMART_READ_TIMEOUT", 15))
+DATAMART_MAX_RETRIES = int(os.environ.get("DATAMART_MAX_RETRIES", 2))
+DATAMART_BACKOFF_FACTOR = float(os.environ.get("DATAMART_BACKOFF_FACTOR", 0.3))
+# Header carrying each purchase's FulfilmentRecord key; empty to leave it out
+DATAMART_IDEMPOTENCY_HEADER = os.environ.get("DATAMART_IDEMPOTENCY_HEADER", "Idempotency-Key")
+
+# Circuit breakers and bulkheads around provider calls (packages.circuit).
+# A provider's circuit opens for CIRCUIT_OPEN_SECONDS once CIRCUIT_MIN_CALLS
+# or more calls in the last CIRCUIT_WINDOW seconds include CIRCUIT_FAILURE_RATE
+# failures or CIRCUIT_SLOW_CALL_RATE calls slower than its slow_call_ms.
+# max_concurrent caps its in-flight calls across all processes; a slot is
+# reclaimed after BULKHEAD_LEASE_SECONDS if its holder dies.
+CIRCUIT_WINDOW = int(os.environ.get("CIRCUIT_WINDOW", 60))
+CIRCUIT_MIN_CALLS = int(os.environ.get("CIRCUIT_MIN_CALLS", 10))
+CIRCUIT_FAILURE_RATE = float(os.environ.get("CIRCUIT_FAILURE_RATE", 0.5))
+CIRCUIT_SLOW_CALL_RATE = float(os.environ.get("CIRCUIT_SLOW_CALL_RATE", 0.8))
+CIRCUIT_OPEN_SECONDS = int(os.environ.get("CIRCUIT_OPEN_SECONDS", 30))
+BULKHEAD_LEASE_SECONDS = int(os.environ.get("BULKHEAD_LEASE_SECONDS", 60))
+CIRCUIT_BREAKERS = {
+    'paystack': {
+        'slow_call_ms': int(os.environ.get("PAYSTACK_SLOW_CALL_MS", 3000)),
+        'max_concurrent': int(os.environ.get("PAYSTACK_MAX_CONCURRENT", 10)),
+    },
+    'datamart': {
+        'slow_call_ms': int(os.environ.get("DATAMART_SLOW_CALL_MS", 8000)),
+        'max_concurrent': int(os.environ.get("DATAMART_MAX_CONCURRENT", 16)),
+    },
+}
+
+# Deferred DataMart purchases (circuit open) are retried this many at a time by a beat job
+FULFILMENT_RESUME_BATCH_SIZE = int(os.environ.get("FULFILMENT_RESUME_BATCH_SIZE", 50))
+
+# DataMart status poller: one periodic sweep instead of a task per order
+DATAMART_POLL_INTERVAL = int(os.environ.get("DATAMART_POLL_INTERVAL", 30))  # seconds before the first check
+DATAMART_POLL_MAX_INTERVAL = int(os.environ.get("DATAMART_POLL_MAX_INTERVAL", 900))
+DATAMART_POLL_MAX_ATTEMPTS = int(os.environ.get("DATAMART_POLL_MAX_ATTEMPTS", 20))
+DATAMART_POLL_MAX_AGE_HOURS = int(os.environ.get("DATAMART_POLL_MAX_AGE_HOURS", 48))
+DATAMART_POLL_BATCH_SIZE = int(os.environ.get("DATAMART_POLL_BATCH_SIZE", 100))
+DATAMART_POLL_CONCURRENCY = int(os.environ.get("DATAMART_POLL_CONCURRENCY", 8))
+DATAMART_POLL_SWEEP_LIMIT = int(os.environ.get("DATAMART_POLL_SWEEP_LIMIT", 2000))
+DATAMART_POLL_LOCK_TIMEOUT = int(os.environ.get("DATAMART_POLL_LOCK_TIMEOUT", 300))
+
+
+# Cache: shared Redis when REDIS_URL is set, otherwise per-process memory
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a process trusts its copy of SystemConfiguration before re-checking the shared version
+CONFIG_LOCAL_TTL = float(os.environ.get("CONFIG_LOCAL_TTL", 1.0))
+
+# Upper bound on a cached bundle catalog's lifetime; saves invalidate it sooner
+CATALOG_CACHE_TIMEOUT = int(os.environ.get("CATALOG_CACHE_TIMEOUT", 3600))
+
+# Short-lived cache for admin list breakdowns (packages.facets)
+FACET_CACHE_TIMEOUT = int(os.environ.get("FACET_CACHE_TIMEOUT", 30))
+
+# Template fragment caches ({% cache %}): admin dashboard panels built from the
+# rollups. Storefront catalog fragments are keyed on the catalog version and
+# use CATALOG_CACHE_TIMEOUT.
+DASHBOARD_FRAGMENT_CACHE_TIMEOUT = int(os.environ.get("DASHBOARD_FRAGMENT_CACHE_TIMEOUT", 60))
+
+# OTP abuse throttling (authentication.ratelimit): (attempts, window seconds)
+# per email address, client IP and client /24 network, for each OTP type.
+# 'otp_verify' limits code submissions.
+OTP_RATE_LIMIT_ENABLED = os.environ.get("OTP_RATE_LIMIT_ENABLED", "True") == "True"
+OTP_RATE_LIMITS = {
+    'email_verification': {'email': (3, 600), 'ip': (10, 3600), 'subnet': (30, 3600)},
+    'login_verification': {'email': (5, 600), 'ip': (20, 3600), 'subnet': (60, 3600)},
+    'password_reset': {'email': (3, 3600), 'ip': (10, 3600), 'subnet': (30, 3600)},
+    'otp_verify': {'email': (10, 600), 'ip': (30, 600), 'subnet': (100, 600)},
+}
+# Reverse proxies in front of the app that append to X-Forwarded-For (Railway's
+# edge in production). The limiter keys on the entry the outermost one added;
+# with 0 it uses REMOTE_ADDR.
+TRUSTED_PROXY_COUNT = int(os.environ.get("TRUSTED_PROXY_COUNT", 0 if DEBUG else 1))
+
+# Key for OTP hashes (authentication.models.hash_otp); falls back to SECRET_KEY.
+# Changing it invalidates outstanding codes, which expire within minutes anyway.
+OTP_HASH_SECRET = os.environ.get("OTP_HASH_SECRET")
 
 
 # settings.py
@@ -329,6 +508,50 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Provider calls run on dedicated workers: celery -A DataHub worker -Q fulfilment
+CELERY_TASK_ROUTES = {
+    'system.tasks.fulfil_order': {'queue': 'fulfilment'},
+    'system.tasks.poll_datamart_orders': {'queue': 'fulfilment'},
+    'system.tasks.recheck_datamart_status': {'queue': 'fulfilment'},
+    'system.tasks.reconcile_pending_payments': {'queue': 'fulfilment'},
+    'system.tasks.resume_deferred_fulfilments': {'queue': 'fulfilment'},
+    # Outbound mail gets its own workers so a slow SMTP relay never delays fulfilment: -Q email
+    'authentication.tasks.send_queued_emails': {'queue': 'email'},
+}
+
+# Periodic jobs, run with: celery -A DataHub beat
+CELERY_BEAT_SCHEDULE = {
+    'poll-datamart-orders': {
+        'task': 'system.tasks.poll_datamart_orders',
+        'schedule': 30.0,
+    },
+    'reconcile-pending-payments': {
+        'task': 'system.tasks.reconcile_pending_payments',
+        'schedule': 300.0,
+    },
+    'resume-deferred-fulfilments': {
+        'task': 'system.tasks.resume_deferred_fulfilments',
+        'schedule': 60.0,
+    },
+    'maintain-audit-log-partitions': {
+        'task': 'authentication.tasks.maintain_audit_log_partitions',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    'reconcile-metric-rollups': {
+        'task': 'management.tasks.reconcile_metric_rollups',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'run-system-health-checks': {
+        'task': 'management.tasks.run_system_health_checks',
+        'schedule': float(os.environ.get("HEALTH_CHECK_INTERVAL", 300)),
+    },
+    'send-queued-emails': {
+        'task': 'authentication.tasks.send_queued_emails',
+        'schedule': 60.0,
+        'kwargs': {'purge': True},
+    },
+}
+
 
 CSRF_TRUSTED_ORIGINS = [
     'https://datamart.up.railway.app',
@@ -339,5 +562,37 @@ CSRF_TRUSTED_ORIGINS = [
 
 SENDGRID_API_KEY = os.environ.get("SENDGRID_API_KEY")
 
+# Audit log writer: entries are buffered and written with bulk_create
+AUDIT_LOG_BUFFER_SIZE = int(os.environ.get("AUDIT_LOG_BUFFER_SIZE", 100))
+AUDIT_LOG_FLUSH_INTERVAL_MS = int(os.environ.get("AUDIT_LOG_FLUSH_INTERVAL_MS", 500))  # outside of requests
+AUDIT_LOG_SLOW_FLUSH_MS = int(os.environ.get("AUDIT_LOG_SLOW_FLUSH_MS", 250))
+AUDIT_LOG_SLOW_BACKOFF_SECONDS = int(os.environ.get("AUDIT_LOG_SLOW_BACKOFF_SECONDS", 30))
+
+# Audit log retention, applied by authentication.tasks.maintain_audit_log_partitions
+AUDIT_LOG_RETENTION_DAYS = int(os.environ.get("AUDIT_LOG_RETENTION_DAYS", 365))
+AUDIT_LOG_ARCHIVE_EXPIRED = os.environ.get("AUDIT_LOG_ARCHIVE_EXPIRED", "False") == "True"  # detach instead of drop (PostgreSQL)
+AUDIT_LOG_PARTITION_MONTHS_AHEAD = int(os.environ.get("AUDIT_LOG_PARTITION_MONTHS_AHEAD", 3))
+AUDIT_LOG_PURGE_BATCH_SIZE = int(os.environ.get("AUDIT_LOG_PURGE_BATCH_SIZE", 5000))
+
+# Dashboard rollups: days recomputed from the source tables by the nightly reconcile
+METRICS_RECONCILE_DAYS = int(os.environ.get("METRICS_RECONCILE_DAYS", 3))
+
+# Background consistency checks shown on the admin dashboard
+HEALTH_CHECK_SAMPLE_SIZE = int(os.environ.get("HEALTH_CHECK_SAMPLE_SIZE", 20))  # offending ids kept per check
+HEALTH_CHECK_FULFILMENT_GRACE_MINUTES = int(os.environ.get("HEALTH_CHECK_FULFILMENT_GRACE_MINUTES", 15))
+# How long a process serves the stored report before re-reading it; one check interval
+HEALTH_REPORT_CACHE_TIMEOUT = int(os.environ.get("HEALTH_CHECK_INTERVAL", 300))
+
+# Admin exports: rows fetched per cursor round trip, and the selection size
+# above which an export is written to storage in the background instead
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 2000))
+EXPORT_ASYNC_THRESHOLD = int(os.environ.get("EXPORT_ASYNC_THRESHOLD", 100000))
+
 EMAIL_TIMEOUT = 30
+
+# Outbound email queue (authentication.mail), delivered by Celery workers
+EMAIL_QUEUE_BATCH_SIZE = int(os.environ.get("EMAIL_QUEUE_BATCH_SIZE", 50))  # messages per SMTP connection
+EMAIL_QUEUE_MAX_ATTEMPTS = int(os.environ.get("EMAIL_QUEUE_MAX_ATTEMPTS", 6))  # then dead-lettered
+EMAIL_QUEUE_RETRY_DELAY = int(os.environ.get("EMAIL_QUEUE_RETRY_DELAY", 30))  # seconds, doubled per attempt
+EMAIL_QUEUE_RETENTION_DAYS = int(os.environ.get("EMAIL_QUEUE_RETENTION_DAYS", 7))
 SERVER_EMAIL = DEFAULT_FROM_EMAIL
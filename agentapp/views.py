@@ -10,7 +10,7 @@ from django.contrib import messages
 from django.db.models import Count, Q
 from django.views.generic import ListView
 from django.views.generic import TemplateView
-from django.core.paginator import Paginator
+from packages.pagination import CursorPaginator
 from authentication.models import *
 from django.shortcuts import render
 from django.views.generic import TemplateView
@@ -24,6 +24,7 @@ from django.views.generic import View, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from authentication.models import Bundle, DataBundleOrder, Payment
 from system.services import initialize_paystack_payment, verify_paystack_payment
+from system.catalog import AGENT, get_catalog
 import logging
 from django.conf import settings
 logger = logging.getLogger(__name__)
@@ -50,37 +51,23 @@ class AgentHomeView(LoginRequiredMixin, TemplateView):
         """
         context = super().get_context_data(**kwargs)
         
-        bundles = Bundle.objects.select_related('telco').filter(is_agent_bundle=True).order_by('telco__name', 'size_mb')
-        data_plans = {}
+        catalog = get_catalog(AGENT)
 
-        orders = DataBundleOrder.objects.filter(user=self.request.user).order_by('-created_at')
-        paginator = Paginator(orders, 15)  # 15 per page
-        page_number = self.request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+        orders = DataBundleOrder.objects.filter(user=self.request.user).select_related('telco', 'bundle', 'payment')
+        page_obj = CursorPaginator(orders, 15).page(  # 15 per page
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+        )
 
-        today = timezone.now().date()
-        rec_orders = DataBundleOrder.objects.filter(created_at__date=today).order_by('-created_at')
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        rec_orders = orders.filter(created_at__gte=today).order_by('-created_at')
 
-        for bundle in bundles:
-            size_display = f"{bundle.size_mb // 1000}GB" if bundle.size_mb >= 1000 else f"{bundle.size_mb}MB"
-            validity = "Non-Expiry" if bundle.telco.name.lower() in ['mtn', 'telecel'] else "30 days"
-
-            provider_name = bundle.telco.name
-            if provider_name not in data_plans:
-                data_plans[provider_name] = []
-
-            data_plans[provider_name].append({
-                'id': bundle.id,
-                'size': size_display,
-                'price': f"{bundle.price:.2f}",  # Keep price as string for display
-                'validity': validity,
-                'code': bundle.telco.code
-            })
-        
-        context['data_plans'] = data_plans
+        context['data_plans'] = catalog['data_plans']
+        context['catalog_version'] = catalog['built_at']  # Catalog fragments in the template are cached per catalog build
+        context['catalog_cache_timeout'] = settings.CATALOG_CACHE_TIMEOUT
         context['paystack_public_key'] = settings.TEST_PUBLIC_KEY  # Use the test public key for client-side integration
         context['user'] = self.request.user 
-        context['orders'] = orders  # Include user's past orders for display
+        context['orders'] = page_obj.object_list  # One page of the user's past orders
         context['rec_orders'] = rec_orders  # Include recent orders for display
         context['page_obj'] = page_obj  # Pass the paginated orders to the template 
  # Pass the user object to the template for
@@ -3,13 +3,14 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Count, Q
 from django.contrib.admin import SimpleListFilter
-from django.http import HttpResponse
-import csv
+from django.conf import settings
 import json
 from datetime import timedelta
 from django.contrib.admin.models import LogEntry
+from django.utils.decorators import method_decorator
 
 from .models import (
     CustomUser,
@@ -19,9 +20,18 @@ from .models import (
     DataBundleOrder,
     Payment,
     AuditLog,
+    OutboundEmail,
+    FulfilmentRecord,
     SystemConfiguration
 )
 from .signals import set_request_context, log_custom_action
+from . import exports
+from .exports import StreamingExportMixin
+from .tasks import maintain_audit_log_partitions, send_queued_emails
+from .transitions import transition_all
+from system.catalog import invalidate_catalog
+from management.tasks import queue_rollup_reconcile
+from packages.replicas import replica_safe
 
 
 # --- General Admin Configuration ---
@@ -145,7 +155,7 @@ class PaymentInline(admin.StackedInline):
 
 # --- Custom User Admin ---
 @admin.register(CustomUser)
-class CustomUserAdmin(BaseUserAdmin):
+class CustomUserAdmin(StreamingExportMixin, BaseUserAdmin):
     list_display = (
         'email', 'full_name', 'phone_number', 'role',
         'account_status_badge', 'email_verified_badge',
@@ -203,7 +213,9 @@ class CustomUserAdmin(BaseUserAdmin):
     )
 
     inlines = [OTPInline]
-    actions = ['verify_email', 'activate_accounts', 'deactivate_accounts', 'unlock_accounts', 'export_users']
+    actions = ['verify_email', 'activate_accounts', 'deactivate_accounts', 'unlock_accounts', 'export_users',
+               'export_csv_gzip', 'export_ndjson_gzip']
+    export_spec = exports.USERS
 
     def account_status_badge(self, obj):
         colors = {
@@ -247,6 +259,7 @@ class CustomUserAdmin(BaseUserAdmin):
             email_verified=True,
             is_active=True
         )
+        queue_rollup_reconcile(queryset)
         self.message_user(request, f'Activated {updated} accounts.')
     activate_accounts.short_description = "Activate selected accounts"
 
@@ -255,6 +268,7 @@ class CustomUserAdmin(BaseUserAdmin):
             account_status='deactivated',
             is_active=False
         )
+        queue_rollup_reconcile(queryset)
         self.message_user(request, f'Deactivated {updated} accounts.')
     deactivate_accounts.short_description = "Deactivate selected accounts"
 
@@ -267,29 +281,7 @@ class CustomUserAdmin(BaseUserAdmin):
     unlock_accounts.short_description = "Unlock selected accounts"
 
     def export_users(self, request, queryset):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="users_export.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow([
-            'ID', 'Email', 'Full Name', 'Phone', 'Role', 'Account Status',
-            'Email Verified', 'Created At', 'Last Login'
-        ])
-
-        for user in queryset:
-            writer.writerow([
-                user.id, user.email, user.full_name, user.phone_number,
-                user.role, user.account_status, user.email_verified,
-                user.created_at, user.last_login
-            ])
-
-        log_custom_action(
-            action='users_exported',
-            details={'count': queryset.count()},
-            request=request
-        )
-
-        return response
+        return self.export(request, queryset)
     export_users.short_description = "Export selected users to CSV"
 
     def get_queryset(self, request):
@@ -363,6 +355,7 @@ class OTPAdmin(admin.ModelAdmin):
 
     def invalidate_otps(self, request, queryset):
         updated = queryset.filter(status='active').update(status='invalidated')
+        queue_rollup_reconcile(queryset)
         self.message_user(request, f'Invalidated {updated} OTPs.')
     invalidate_otps.short_description = "Invalidate selected OTPs"
 
@@ -406,11 +399,13 @@ class TelcoAdmin(admin.ModelAdmin):
 
     def activate_telcos(self, request, queryset):
         updated = queryset.update(is_active=True)
+        transaction.on_commit(invalidate_catalog)
         self.message_user(request, f'Activated {updated} telcos.')
     activate_telcos.short_description = "Activate selected telcos"
 
     def deactivate_telcos(self, request, queryset):
         updated = queryset.update(is_active=False)
+        transaction.on_commit(invalidate_catalog)
         self.message_user(request, f'Deactivated {updated} telcos.')
     deactivate_telcos.short_description = "Deactivate selected telcos"
 
@@ -496,21 +491,25 @@ class BundleAdmin(admin.ModelAdmin):
 
     def mark_in_stock(self, request, queryset):
         updated = queryset.update(is_instock=True, is_out_of_stock=False)
+        transaction.on_commit(invalidate_catalog)
         self.message_user(request, f'Marked {updated} bundles as in stock.')
     mark_in_stock.short_description = "Mark as in stock"
 
     def mark_out_of_stock(self, request, queryset):
         updated = queryset.update(is_instock=False, is_out_of_stock=True)
+        transaction.on_commit(invalidate_catalog)
         self.message_user(request, f'Marked {updated} bundles as out of stock.')
     mark_out_of_stock.short_description = "Mark as out of stock"
 
     def activate_bundles(self, request, queryset):
         updated = queryset.update(is_active=True)
+        transaction.on_commit(invalidate_catalog)
         self.message_user(request, f'Activated {updated} bundles.')
     activate_bundles.short_description = "Activate selected bundles"
 
     def deactivate_bundles(self, request, queryset):
         updated = queryset.update(is_active=False)
+        transaction.on_commit(invalidate_catalog)
         self.message_user(request, f'Deactivated {updated} bundles.')
     deactivate_bundles.short_description = "Deactivate selected bundles"
 
@@ -539,7 +538,7 @@ class BundleAdmin(admin.ModelAdmin):
 
 # --- Order Admin ---
 @admin.register(DataBundleOrder)
-class DataBundleOrderAdmin(admin.ModelAdmin):
+class DataBundleOrderAdmin(StreamingExportMixin, admin.ModelAdmin):
     list_display = (
         'id', 'user_email', 'phone_number', 'bundle_info',
         'status_badge', 'payment_status', 'created_at'
@@ -551,7 +550,8 @@ class DataBundleOrderAdmin(admin.ModelAdmin):
     )
     ordering = ('-created_at',)
     inlines = [PaymentInline]
-    actions = ['mark_processing', 'mark_completed', 'mark_failed', 'export_orders']
+    actions = ['mark_processing', 'mark_completed', 'mark_failed', 'export_orders', 'export_csv_gzip', 'export_ndjson_gzip']
+    export_spec = exports.ORDERS
 
     fieldsets = (
         ('Order Details', {
@@ -611,44 +611,22 @@ class DataBundleOrderAdmin(admin.ModelAdmin):
     payment_status.short_description = 'Payment'
 
     def mark_processing(self, request, queryset):
-        updated = queryset.filter(status='pending').update(status='processing')
+        updated = transition_all(queryset, 'processing', from_statuses=('pending',))
         self.message_user(request, f'Marked {updated} orders as processing.')
     mark_processing.short_description = "Mark as processing"
 
     def mark_completed(self, request, queryset):
-        updated = queryset.filter(status__in=['pending', 'processing']).update(status='completed')
+        updated = transition_all(queryset, 'completed', from_statuses=('pending', 'processing'))
         self.message_user(request, f'Marked {updated} orders as completed.')
     mark_completed.short_description = "Mark as completed"
 
     def mark_failed(self, request, queryset):
-        updated = queryset.exclude(status__in=['completed', 'failed']).update(status='failed')
+        updated = transition_all(queryset, 'failed', from_statuses=('pending', 'processing'))
         self.message_user(request, f'Marked {updated} orders as failed.')
     mark_failed.short_description = "Mark as failed"
 
     def export_orders(self, request, queryset):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="orders_export.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow([
-            'Order ID', 'Customer Email', 'Phone Number', 'Telco', 'Bundle',
-            'Bundle Size (MB)', 'Price', 'Status', 'Payment Status', 'Created At'
-        ])
-
-        for order in queryset.select_related('user', 'telco', 'bundle').prefetch_related('payment'):
-            payment_status = 'No Payment'
-            try:
-                payment_status = order.payment.status
-            except Payment.DoesNotExist:
-                pass
-
-            writer.writerow([
-                order.id, order.user.email, order.phone_number,
-                order.telco.name, order.bundle.name, order.bundle.size_mb,
-                order.bundle.price, order.status, payment_status, order.created_at
-            ])
-
-        return response
+        return self.export(request, queryset)
     export_orders.short_description = "Export selected orders to CSV"
 
     def get_queryset(self, request):
@@ -659,7 +637,7 @@ class DataBundleOrderAdmin(admin.ModelAdmin):
 
 # --- Payment Admin ---
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(StreamingExportMixin, admin.ModelAdmin):
     list_display = (
         'id', 'order_id', 'customer_email', 'amount',
         'status_badge', 'reference', 'paid_at', 'created_at'
@@ -671,7 +649,8 @@ class PaymentAdmin(admin.ModelAdmin):
         'ip_address', 'user_agent'
     )
     ordering = ('-created_at',)
-    actions = ['mark_success', 'mark_failed', 'export_payments']
+    actions = ['mark_success', 'mark_failed', 'export_payments', 'export_csv_gzip', 'export_ndjson_gzip']
+    export_spec = exports.PAYMENTS
 
     fieldsets = (
         ('Payment Details', {
@@ -714,36 +693,17 @@ class PaymentAdmin(admin.ModelAdmin):
     status_badge.short_description = 'Status'
 
     def mark_success(self, request, queryset):
-        updated = queryset.filter(status='pending').update(
-            status='success',
-            paid_at=timezone.now()
-        )
+        updated = transition_all(queryset, 'success', paid_at=timezone.now())
         self.message_user(request, f'Marked {updated} payments as successful.')
     mark_success.short_description = "Mark as successful"
 
     def mark_failed(self, request, queryset):
-        updated = queryset.filter(status='pending').update(status='failed')
+        updated = transition_all(queryset, 'failed')
         self.message_user(request, f'Marked {updated} payments as failed.')
     mark_failed.short_description = "Mark as failed"
 
     def export_payments(self, request, queryset):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="payments_export.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow([
-            'Payment ID', 'Order ID', 'Customer Email', 'Amount',
-            'Reference', 'Status', 'Paid At', 'Created At'
-        ])
-
-        for payment in queryset.select_related('order__user'):
-            writer.writerow([
-                payment.id, payment.order.id, payment.order.user.email,
-                payment.amount, payment.reference, payment.status,
-                payment.paid_at, payment.created_at
-            ])
-
-        return response
+        return self.export(request, queryset)
     export_payments.short_description = "Export selected payments to CSV"
 
     def get_queryset(self, request):
@@ -755,7 +715,7 @@ class PaymentAdmin(admin.ModelAdmin):
 
 # --- Audit Log Admin ---
 @admin.register(AuditLog)
-class AuditLogAdmin(admin.ModelAdmin):
+class AuditLogAdmin(StreamingExportMixin, admin.ModelAdmin):
     list_display = (
         'id', 'user_email', 'action', 'created_at', 'ip_address'
     )
@@ -763,7 +723,8 @@ class AuditLogAdmin(admin.ModelAdmin):
     search_fields = ('user__email', 'action', 'ip_address')
     readonly_fields = ('id', 'user', 'action', 'details', 'ip_address', 'user_agent', 'created_at')
     ordering = ('-created_at',)
-    actions = ['export_audit_logs', 'cleanup_old_logs']
+    actions = ['export_audit_logs', 'export_csv_gzip', 'export_ndjson_gzip', 'cleanup_old_logs']
+    export_spec = exports.AUDIT_LOGS
 
     fieldsets = (
         ('Audit Details', {
@@ -790,28 +751,13 @@ class AuditLogAdmin(admin.ModelAdmin):
     details_formatted.short_description = 'Details'
 
     def export_audit_logs(self, request, queryset):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="audit_logs_export.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow([
-            'ID', 'User Email', 'Action', 'IP Address', 'Created At', 'Details'
-        ])
-
-        for log in queryset.select_related('user'):
-            details = json.dumps(log.details, indent=2, default=str) if log.details else 'No details'
-            writer.writerow([
-                log.id, log.user.email if log.user else 'System', log.action,
-                log.ip_address, log.created_at, details
-            ])
-        return response
+        return self.export(request, queryset)
     export_audit_logs.short_description = "Export selected audit logs to CSV"
 
     def cleanup_old_logs(self, request, queryset):
-        cutoff_date = timezone.now() - timedelta(days=365)
-        deleted_count, _ = AuditLog.objects.filter(created_at__lt=cutoff_date).delete()
-        self.message_user(request, f'Cleaned up {deleted_count} old audit logs.')
-    cleanup_old_logs.short_description = "Cleanup audit logs older than 1 year"
+        maintain_audit_log_partitions.delay()
+        self.message_user(request, f'Audit log cleanup queued (retention: {settings.AUDIT_LOG_RETENTION_DAYS} days).')
+    cleanup_old_logs.short_description = "Cleanup audit logs past the retention period"
 
     def has_add_permission(self, request):
         return False
@@ -824,9 +770,63 @@ class AuditLogAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user')
+
+    @method_decorator(replica_safe)
+    def changelist_view(self, request, extra_context=None):
+        return super().changelist_view(request, extra_context)
     
 
 
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'category', 'recipient', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status', 'category')
+    search_fields = ('recipient', 'subject')
+    readonly_fields = (
+        'id', 'category', 'recipient', 'subject', 'status', 'attempts', 'last_error',
+        'next_attempt_at', 'created_at', 'updated_at', 'sent_at',
+    )
+    exclude = ('body', 'html_body')  # may contain OTP codes
+    ordering = ('-created_at',)
+    actions = ['requeue']
+
+    def requeue(self, request, queryset):
+        updated = queryset.filter(status='dead').update(status='queued', attempts=0, next_attempt_at=timezone.now())
+        transaction.on_commit(send_queued_emails.delay)
+        self.message_user(request, f'Requeued {updated} dead-lettered emails.')
+    requeue.short_description = "Requeue selected dead-lettered emails"
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(FulfilmentRecord)
+class FulfilmentRecordAdmin(admin.ModelAdmin):
+    list_display = ('order', 'status', 'claimed_by', 'provider_order_id', 'created_at', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('order__id', 'provider_order_id', 'idempotency_key')
+    readonly_fields = (
+        'id', 'order', 'idempotency_key', 'status', 'claimed_by', 'provider_order_id',
+        'last_error', 'created_at', 'updated_at',
+    )
+    ordering = ('-created_at',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Deleting a record allows another purchase for its order; never for one DataMart accepted
+        if obj is not None and obj.status == 'sent':
+            return False
+        return super().has_delete_permission(request, obj)
+
+    def get_actions(self, request):
+        # Bulk delete would skip the per-record check above
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+
 @admin.register(SystemConfiguration)
 class SystemConfigurationAdmin(admin.ModelAdmin):
     list_display = ['key', 'value', 'updated_by', 'updated_at']
@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+# Per-thread buffer of unsaved AuditLog instances
+_local = threading.local()
+
+# Process-wide: while set in the future, flushes go to the Celery queue instead of the DB
+_slow_until = 0.0
+
+
+def _state():
+    if not hasattr(_local, 'entries'):
+        _local.entries = []
+        _local.first_recorded = None
+        _local.depth = 0
+        _local.in_task = False
+    return _local
+
+
+def serialize_entry(entry):
+    """JSON-safe representation of an unsaved AuditLog for the Celery fallback."""
+    return {
+        'id': entry.id,
+        'user_id': entry.user_id,
+        'action': entry.action,
+        'details': entry.details,
+        'ip_address': entry.ip_address,
+        'user_agent': entry.user_agent,
+        'created_at': entry.created_at.isoformat(),
+    }
+
+
+def record(**fields):
+    """
+    Buffer an audit entry instead of inserting it immediately.
+
+    Inside a buffered() scope (every request, via AuditLogMiddleware) entries
+    are written when the scope exits. In Celery tasks (see task_started) the
+    buffer is flushed when the task ends, once it reaches
+    AUDIT_LOG_BUFFER_SIZE entries, or once its oldest entry is
+    AUDIT_LOG_FLUSH_INTERVAL_MS old. Anywhere else (management commands, the
+    shell) nothing would flush the buffer before the process exits, so
+    entries are written straight away.
+    """
+    state = _state()
+    state.entries.append(AuditLog(**fields))
+    if state.first_recorded is None:
+        state.first_recorded = time.monotonic()
+
+    if len(state.entries) >= settings.AUDIT_LOG_BUFFER_SIZE:
+        flush()
+    elif state.depth == 0:
+        age_ms = (time.monotonic() - state.first_recorded) * 1000
+        if not state.in_task or age_ms >= settings.AUDIT_LOG_FLUSH_INTERVAL_MS:
+            flush()
+
+
+def flush():
+    """Write all buffered entries with one bulk_create. Returns the number handed off."""
+    global _slow_until
+
+    state = _state()
+    entries, state.entries = state.entries, []
+    state.first_recorded = None
+    if not entries:
+        return 0
+
+    if time.monotonic() < _slow_until:
+        _enqueue(entries)
+        return len(entries)
+
+    started = time.monotonic()
+    try:
+        with transaction.atomic():
+            AuditLog.objects.bulk_create(entries)
+    except DatabaseError as e:
+        logger.warning(f"Audit log flush of {len(entries)} entries failed, queueing them instead: {str(e)}")
+        _enqueue(entries)
+        return len(entries)
+
+    elapsed_ms = (time.monotonic() - started) * 1000
+    if elapsed_ms > settings.AUDIT_LOG_SLOW_FLUSH_MS:
+        logger.warning(
+            f"Audit log flush took {elapsed_ms:.0f}ms, routing audit writes through the queue "
+            f"for {settings.AUDIT_LOG_SLOW_BACKOFF_SECONDS}s"
+        )
+        _slow_until = time.monotonic() + settings.AUDIT_LOG_SLOW_BACKOFF_SECONDS
+    return len(entries)
+
+
+def _enqueue(entries):
+    from .tasks import write_audit_logs
+
+    try:
+        write_audit_logs.delay([serialize_entry(entry) for entry in entries])
+    except Exception as e:
+        logger.error(f"Failed to queue {len(entries)} audit log entries, dropping them: {str(e)}")
+
+
+def task_started():
+    """Buffer this thread's entries until task_finished() (Celery task_prerun)."""
+    _state().in_task = True
+
+
+def task_finished():
+    state = _state()
+    state.in_task = False
+    flush()
+
+
+@contextmanager
+def buffered():
+    """Collect audit entries for the duration of the block and flush them at the end."""
+    state = _state()
+    state.depth += 1
+    try:
+        yield
+    finally:
+        state.depth -= 1
+        if state.depth == 0:
+            flush()
+
+
+class AuditLogMiddleware:
+    """Buffers the audit entries written while handling a request into one INSERT."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with buffered():
+            return self.get_response(request)
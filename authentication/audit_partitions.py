@@ -0,0 +1,172 @@
+"""
+Monthly range partitions for the audit log on PostgreSQL.
+
+Migration 0014 turns authentication_auditlog into a table partitioned by
+created_at, with one partition per month (``authentication_auditlog_pYYYYMM``)
+for the rows that existed at the time as well as later ones, and a default
+partition as a safety net. On other databases (SQLite in development) the table stays a plain
+table and retention falls back to batched deletes.
+"""
+import logging
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = AuditLog._meta.db_table
+DEFAULT_PARTITION = f'{PARENT_TABLE}_default'
+
+_BOUND_RE = re.compile(r"FROM \((?P<lower>[^)]*)\) TO \((?P<upper>[^)]*)\)")
+
+
+def month_start(value):
+    value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(value, months):
+    month_index = value.month - 1 + months
+    return value.replace(year=value.year + month_index // 12, month=month_index % 12 + 1)
+
+
+def partition_name(month):
+    return f'{PARENT_TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned():
+    """Whether the audit log table is a partitioned table on this database."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = %s AND pg_table_is_visible(c.oid)
+            """,
+            [PARENT_TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def _parse_bound(value):
+    value = value.strip()
+    if value == 'MINVALUE':
+        return None
+    return datetime.fromisoformat(value.strip("'")).astimezone(dt_timezone.utc)
+
+
+def list_partitions():
+    """Attached partitions as (name, lower, upper); None bounds mean unbounded/default."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = %s AND pg_table_is_visible(p.oid)
+            """,
+            [PARENT_TABLE],
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_RE.search(bound)
+        if match is None:  # DEFAULT partition
+            partitions.append((name, None, None))
+        else:
+            partitions.append((name, _parse_bound(match.group('lower')), _parse_bound(match.group('upper'))))
+    return partitions
+
+
+def ensure_partitions(months_ahead=None, now=None):
+    """Create the monthly partitions for the current month and the next few."""
+    if not is_partitioned():
+        return []
+
+    months_ahead = settings.AUDIT_LOG_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(now or timezone.now())
+    existing = list_partitions()
+    qn = connection.ops.quote_name
+
+    created = []
+    for offset in range(months_ahead + 1):
+        lower = add_months(current, offset)
+        upper = add_months(lower, 1)
+        covered = any(
+            (start is None or start <= lower) and end is not None and end >= upper
+            for _, start, end in existing
+        )
+        if covered:
+            continue
+
+        name = partition_name(lower)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {qn(name)} PARTITION OF {qn(PARENT_TABLE)} "
+                    f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+                )
+            created.append(name)
+        except Exception as e:
+            # Usually rows for this month already landed in the default partition
+            logger.error(f"Could not create audit log partition {name}: {str(e)}")
+    if created:
+        logger.info(f"Created audit log partitions: {', '.join(created)}")
+    return created
+
+
+def _delete_in_batches(cutoff, batch_size):
+    deleted = 0
+    while True:
+        ids = list(
+            AuditLog.objects.filter(created_at__lt=cutoff).values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        count, _ = AuditLog.objects.filter(pk__in=ids, created_at__lt=cutoff).delete()
+        deleted += count
+
+
+def purge_expired_audit_logs(retention_days=None, archive=None, batch_size=None, now=None):
+    """
+    Remove audit logs older than the retention period.
+
+    Partitions that lie entirely before the cutoff are detached and dropped
+    (or kept as ``*_archive_*`` tables when archiving); rows in a partition
+    that straddles the cutoff, and everything on non-partitioned databases,
+    are deleted in small batches so no single statement holds locks for long.
+    """
+    retention_days = settings.AUDIT_LOG_RETENTION_DAYS if retention_days is None else retention_days
+    archive = settings.AUDIT_LOG_ARCHIVE_EXPIRED if archive is None else archive
+    batch_size = batch_size or settings.AUDIT_LOG_PURGE_BATCH_SIZE
+    cutoff = (now or timezone.now()) - timedelta(days=retention_days)
+
+    result = {'cutoff': cutoff.isoformat(), 'dropped': [], 'archived': [], 'deleted_rows': 0}
+
+    if is_partitioned():
+        qn = connection.ops.quote_name
+        for name, lower, upper in list_partitions():
+            if upper is None or upper > cutoff:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE {qn(PARENT_TABLE)} DETACH PARTITION {qn(name)}")
+                if archive:
+                    archive_name = name.replace(PARENT_TABLE, f'{PARENT_TABLE}_archive', 1)
+                    cursor.execute(f"ALTER TABLE {qn(name)} RENAME TO {qn(archive_name)}")
+                    result['archived'].append(archive_name)
+                else:
+                    cursor.execute(f"DROP TABLE {qn(name)}")
+                    result['dropped'].append(name)
+
+    result['deleted_rows'] = _delete_in_batches(cutoff, batch_size)
+    logger.info(f"Audit log retention finished: {result}")
+    return result
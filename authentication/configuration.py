@@ -0,0 +1,122 @@
+"""
+Cached access to SystemConfiguration flags.
+
+Every known key is registered here with its type and default. Values are read
+from a per-process copy that is trusted for CONFIG_LOCAL_TTL seconds; after
+that the process compares its version with the one in the shared cache (Redis
+in production) and reloads only when an admin save or delete has bumped it.
+The steady state therefore costs no database queries and at most one cache
+read per process per second.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'system_config:version'
+VALUES_KEY = 'system_config:values'
+
+
+@dataclass(frozen=True)
+class ConfigOption:
+    key: str
+    default: bool
+    type: type = bool
+    description: str = ''
+
+
+REGISTRY = {
+    option.key: option
+    for option in (
+        ConfigOption('auto_api_trigger', True, description='Send paid orders to DataMart automatically.'),
+        ConfigOption('maintenance_mode', False, description='Take the storefront offline for maintenance.'),
+        ConfigOption('email_notifications', True, description='Send transactional emails to users.'),
+    )
+}
+
+_lock = threading.Lock()
+_local = {'values': None, 'version': None, 'checked_at': 0.0}
+
+
+def _load_from_db():
+    """Read every flag in one query, creating rows for registered keys that are missing."""
+    from .models import SystemConfiguration
+
+    values = dict(SystemConfiguration.objects.values_list('key', 'value'))
+    missing = [
+        SystemConfiguration(key=option.key, value=option.default, description=option.description)
+        for option in REGISTRY.values()
+        if option.key not in values
+    ]
+    if missing:
+        SystemConfiguration.objects.bulk_create(missing, ignore_conflicts=True)
+        values.update({config.key: config.value for config in missing})
+    return values
+
+
+def _shared_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # First process after a cache flush; add() keeps concurrent starters consistent
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _refresh():
+    version = _shared_version()
+    if version is None or version != _local['version']:
+        cached = cache.get(VALUES_KEY)
+        if cached is not None and cached[0] == version:
+            values = cached[1]
+        else:
+            values = _load_from_db()
+            cache.set(VALUES_KEY, (version, values), None)
+        _local['values'] = values
+        _local['version'] = version
+    _local['checked_at'] = time.monotonic()
+
+
+def get_all():
+    """All configuration values as {key: value}."""
+    if time.monotonic() - _local['checked_at'] >= settings.CONFIG_LOCAL_TTL or _local['values'] is None:
+        with _lock:
+            if time.monotonic() - _local['checked_at'] >= settings.CONFIG_LOCAL_TTL or _local['values'] is None:
+                try:
+                    _refresh()
+                except Exception as e:
+                    # Keep serving the last known values if the cache or database is unavailable
+                    logger.error(f"Failed to refresh system configuration: {str(e)}")
+                    if _local['values'] is None:
+                        return {}
+                    _local['checked_at'] = time.monotonic()
+    return _local['values']
+
+
+def get(key, default=None):
+    """Value of a configuration flag, coerced to its registered type."""
+    option = REGISTRY.get(key)
+    if default is None and option is not None:
+        default = option.default
+    value = get_all().get(key, default)
+    if option is not None and value is not None:
+        value = option.type(value)
+    return value
+
+
+def invalidate():
+    """Make every process reload the configuration on its next check."""
+    try:
+        # A timestamp rather than a counter, so an evicted key can never reuse an old version
+        cache.set(VERSION_KEY, time.time_ns(), None)
+        cache.delete(VALUES_KEY)
+    except Exception as e:
+        logger.error(f"Failed to invalidate system configuration cache: {str(e)}")
+    # The saving process sees its own change immediately
+    _local['version'] = None
+    _local['checked_at'] = 0.0
@@ -0,0 +1,275 @@
+"""
+Streaming exports for the admin.
+
+An ExportSpec lists the columns of one export as `values_list` lookups, so rows
+are read as plain tuples in chunks of EXPORT_CHUNK_SIZE from a server-side
+cursor and never as model instances. stream() turns a queryset into a
+StreamingHttpResponse of CSV or NDJSON, optionally gzipped; write() produces
+the same bytes into a file, which is what the background export task uses for
+selections larger than EXPORT_ASYNC_THRESHOLD rows, passed to it as primary keys.
+"""
+import csv
+import json
+import logging
+import zlib
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from packages.replicas import on_replica
+
+logger = logging.getLogger(__name__)
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+CONTENT_TYPES = {CSV: 'text/csv', NDJSON: 'application/x-ndjson'}
+
+EXPORT_DIRECTORY = 'exports'
+
+
+@dataclass(frozen=True)
+class Column:
+    header: str
+    field: str  # a values_list lookup, also the NDJSON key
+    empty: object = None  # written instead of None
+
+
+@dataclass(frozen=True)
+class ExportSpec:
+    name: str
+    columns: tuple
+    json_fields: tuple = ()  # nested objects in NDJSON, compact JSON text in CSV
+
+    @property
+    def fields(self):
+        return [column.field for column in self.columns]
+
+
+USERS = ExportSpec('users', (
+    Column('ID', 'id'),
+    Column('Email', 'email'),
+    Column('Full Name', 'full_name'),
+    Column('Phone', 'phone_number'),
+    Column('Role', 'role'),
+    Column('Account Status', 'account_status'),
+    Column('Email Verified', 'email_verified'),
+    Column('Created At', 'created_at'),
+    Column('Last Login', 'last_login'),
+))
+
+ORDERS = ExportSpec('orders', (
+    Column('Order ID', 'id'),
+    Column('Customer Email', 'user__email'),
+    Column('Phone Number', 'phone_number'),
+    Column('Telco', 'telco__name'),
+    Column('Bundle', 'bundle__name'),
+    Column('Bundle Size (MB)', 'bundle__size_mb'),
+    Column('Price', 'bundle__price'),
+    Column('Status', 'status'),
+    Column('Payment Status', 'payment__status', empty='No Payment'),
+    Column('Created At', 'created_at'),
+))
+
+PAYMENTS = ExportSpec('payments', (
+    Column('Payment ID', 'id'),
+    Column('Order ID', 'order_id'),
+    Column('Customer Email', 'order__user__email'),
+    Column('Amount', 'amount'),
+    Column('Reference', 'reference'),
+    Column('Status', 'status'),
+    Column('Paid At', 'paid_at'),
+    Column('Created At', 'created_at'),
+))
+
+AUDIT_LOGS = ExportSpec('audit_logs', (
+    Column('ID', 'id'),
+    Column('User Email', 'user__email', empty='System'),
+    Column('Action', 'action'),
+    Column('IP Address', 'ip_address'),
+    Column('Created At', 'created_at'),
+    Column('Details', 'details'),
+), json_fields=('details',))
+
+SPECS = {spec.name: spec for spec in (USERS, ORDERS, PAYMENTS, AUDIT_LOGS)}
+
+
+class _Echo:
+    """A file-like object whose write() returns what it was given, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _rows(spec, queryset):
+    empties = [column.empty for column in spec.columns]
+    # A list of querysets (see selected()) is read one after another
+    for part in [queryset] if isinstance(queryset, QuerySet) else queryset:
+        # No model instances, so nothing to select or prefetch
+        part = part.select_related(None).prefetch_related(None)
+        rows = part.values_list(*spec.fields).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+        for row in rows:
+            yield [empty if value is None else value for value, empty in zip(row, empties)]
+
+
+def _csv_lines(spec, queryset):
+    writer = csv.writer(_Echo())
+    json_indexes = {spec.fields.index(field) for field in spec.json_fields}
+    yield writer.writerow([column.header for column in spec.columns])
+    for row in _rows(spec, queryset):
+        for index in json_indexes:
+            if row[index] is not None:
+                row[index] = json.dumps(row[index], separators=(',', ':'), cls=DjangoJSONEncoder)
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(spec, queryset):
+    fields = spec.fields
+    for row in _rows(spec, queryset):
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def generate(spec, queryset, fmt=CSV, compress=False):
+    """Yield the export as encoded chunks of up to EXPORT_CHUNK_SIZE rows."""
+    lines = _csv_lines(spec, queryset) if fmt == CSV else _ndjson_lines(spec, queryset)
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= settings.EXPORT_CHUNK_SIZE:
+            data = ''.join(batch).encode('utf-8')
+            batch = []
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = ''.join(batch).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def filename(spec, fmt=CSV, compress=False):
+    return f"{spec.name}_export.{fmt}{'.gz' if compress else ''}"
+
+
+def stream(spec, queryset, fmt=CSV, compress=False):
+    """A download response that is produced while the client reads it."""
+    response = StreamingHttpResponse(
+        generate(spec, queryset, fmt, compress),
+        content_type='application/gzip' if compress else CONTENT_TYPES[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename(spec, fmt, compress)}"'
+    return response
+
+
+def write(spec, queryset, fileobj, fmt=CSV, compress=False):
+    """Write the export to an open binary file, returning the bytes written."""
+    written = 0
+    for chunk in generate(spec, queryset, fmt, compress):
+        fileobj.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def selection(queryset):
+    """The primary keys and field ordering of an admin selection, as JSON task arguments."""
+    ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+    return list(queryset.values_list('pk', flat=True)), ordering
+
+
+def selected(model, pks, ordering=()):
+    """Querysets of `pks`, EXPORT_CHUNK_SIZE at a time, that export in the order they were selected."""
+    size = settings.EXPORT_CHUNK_SIZE
+    # Chunked so no single IN list outgrows the database's parameter limit
+    return [
+        model.objects.filter(pk__in=pks[start:start + size]).order_by(*ordering)
+        for start in range(0, len(pks), size)
+    ]
+
+
+def new_export_path(spec, fmt=CSV, compress=False):
+    stamp = timezone.now().strftime('%Y%m%d%H%M%S')
+    # The random part keeps the download URL unguessable
+    name = f"{spec.name}_export_{stamp}_{get_random_string(12)}.{fmt}{'.gz' if compress else ''}"
+    return f'{EXPORT_DIRECTORY}/{name}'
+
+
+class StreamingExportMixin:
+    """
+    ModelAdmin mixin adding CSV / NDJSON (gzip) export actions for `export_spec`.
+
+    Selections above EXPORT_ASYNC_THRESHOLD rows are written to storage by a
+    background task instead, and the requesting admin is emailed a download
+    link served by this admin.
+    """
+    export_spec = None
+
+    def export(self, request, queryset, fmt=CSV, compress=False):
+        from .signals import log_custom_action
+        from .tasks import export_to_file
+
+        spec = self.export_spec
+        queryset = on_replica(queryset)
+        count = queryset.count()
+        log_custom_action(
+            action=f'{spec.name}_exported',
+            details={'count': count, 'format': fmt, 'compressed': compress},
+            request=request
+        )
+
+        if count <= settings.EXPORT_ASYNC_THRESHOLD:
+            return stream(spec, queryset, fmt, compress)
+
+        export_path = new_export_path(spec, fmt, compress)
+        download_url = request.build_absolute_uri(reverse(
+            f'admin:{self.opts.app_label}_{self.opts.model_name}_export_download',
+            args=[export_path.rsplit('/', 1)[-1]],
+        ))
+        pks, ordering = selection(queryset)
+        export_to_file.delay(
+            spec.name, self.opts.label, pks, export_path, ordering=ordering,
+            fmt=fmt, compress=compress, notify_email=request.user.email, download_url=download_url,
+        )
+        self.message_user(
+            request,
+            f'{count} rows is too many to download directly; the export is being written in the '
+            f'background and a download link will be emailed to {request.user.email}.',
+            messages.INFO,
+        )
+        return None
+
+    def export_csv_gzip(self, request, queryset):
+        return self.export(request, queryset, CSV, compress=True)
+    export_csv_gzip.short_description = "Export selected rows to CSV (gzip)"
+
+    def export_ndjson_gzip(self, request, queryset):
+        return self.export(request, queryset, NDJSON, compress=True)
+    export_ndjson_gzip.short_description = "Export selected rows to NDJSON (gzip)"
+
+    def get_urls(self):
+        urls = [
+            path(
+                'exports/<str:name>/',
+                self.admin_site.admin_view(self.export_download_view),
+                name=f'{self.opts.app_label}_{self.opts.model_name}_export_download',
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def export_download_view(self, request, name):
+        spec = self.export_spec
+        if not self.has_view_permission(request) or not name.startswith(f'{spec.name}_export_') or '/' in name:
+            raise Http404
+        export_path = f'{EXPORT_DIRECTORY}/{name}'
+        if not default_storage.exists(export_path):
+            raise Http404("This export does not exist or is still being written.")
+        return FileResponse(default_storage.open(export_path, 'rb'), as_attachment=True, filename=name)
@@ -0,0 +1,192 @@
+"""
+Outbound email queue.
+
+Views call queue_email(), which renders the message, stores it as an
+OutboundEmail row and returns; once the surrounding transaction commits a
+Celery task (authentication.tasks.send_queued_emails) delivers everything
+that is due over one reused EMAIL_BACKEND connection, in batches of
+EMAIL_QUEUE_BATCH_SIZE. Failed messages are retried with exponential backoff
+and dead-lettered after EMAIL_QUEUE_MAX_ATTEMPTS; a beat job picks up retries
+and anything a crashed worker left in 'sending'. Because delivery goes through
+get_connection(), the locmem and console backends work unchanged.
+
+An HTML template is rendered once per message; its plain-text part comes from
+the sibling .txt template when there is one (e.g. otp_login_email.txt), and
+from strip_tags on the rendered HTML otherwise.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template, render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# A worker that died mid-batch leaves rows in 'sending'; they are retried after this long
+STALE_SENDING = timedelta(minutes=10)
+MAX_BACKOFF = timedelta(hours=1)
+
+
+def _text_template(template):
+    """The .txt sibling of an .html email template, or None."""
+    name, _, extension = template.rpartition('.')
+    if extension != 'html':
+        return None
+    try:
+        # The cached loader remembers misses too, so this is a dict lookup after the first call
+        return get_template(f'{name}.txt')
+    except TemplateDoesNotExist:
+        return None
+
+
+def queue_email(category, recipient, subject, template=None, context=None, body=None):
+    """
+    Queue one email. Pass an HTML `template` (with `context`), or a plain
+    `body`. The text version of a template is its .txt sibling rendered with
+    the same context, falling back to strip_tags of the HTML.
+    """
+    html_body = ''
+    if template:
+        html_body = render_to_string(template, context or {})
+        if body is None:
+            text_template = _text_template(template)
+            body = text_template.render(context or {}) if text_template else strip_tags(html_body)
+
+    email = OutboundEmail.objects.create(
+        category=category,
+        recipient=recipient,
+        subject=subject,
+        body=body if body is not None else '',
+        html_body=html_body,
+    )
+
+    from .tasks import send_queued_emails
+    transaction.on_commit(send_queued_emails.delay)
+    return email
+
+
+def _claim(batch_size):
+    """Mark up to `batch_size` due messages as 'sending' and return them."""
+    now = timezone.now()
+    OutboundEmail.objects.filter(status='sending', updated_at__lt=now - STALE_SENDING).update(status='queued')
+
+    with transaction.atomic():
+        ids = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        OutboundEmail.objects.filter(pk__in=ids).update(status='sending', attempts=F('attempts') + 1, updated_at=now)
+    return list(OutboundEmail.objects.filter(pk__in=ids).order_by('next_attempt_at'))
+
+
+def _message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[email.recipient],
+        reply_to=[settings.DEFAULT_FROM_EMAIL],
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def _failed(email, error):
+    now = timezone.now()
+    if email.attempts >= settings.EMAIL_QUEUE_MAX_ATTEMPTS:
+        OutboundEmail.objects.filter(pk=email.pk).update(status='dead', last_error=str(error), updated_at=now)
+        logger.error(f"Dead-lettered {email.category} email {email.pk} after {email.attempts} attempts: {str(error)}")
+        return
+    backoff = min(timedelta(seconds=settings.EMAIL_QUEUE_RETRY_DELAY * 2 ** (email.attempts - 1)), MAX_BACKOFF)
+    OutboundEmail.objects.filter(pk=email.pk).update(
+        status='queued', last_error=str(error), next_attempt_at=now + backoff, updated_at=now,
+    )
+    logger.warning(f"Email {email.pk} failed (attempt {email.attempts}), retrying in {backoff}: {str(error)}")
+
+
+def deliver_batch(batch_size=None):
+    """Send one batch of due messages over a single connection; returns how many were claimed."""
+    emails = _claim(batch_size or settings.EMAIL_QUEUE_BATCH_SIZE)
+    if not emails:
+        return 0
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            _failed(email, e)
+        return len(emails)
+
+    try:
+        for email in emails:
+            try:
+                connection.send_messages([_message(email, connection)])
+            except Exception as e:
+                _failed(email, e)
+                # The relay may have dropped us; later messages get a fresh connection
+                connection.close()
+                continue
+            now = timezone.now()
+            # Clear the bodies: they can hold OTP codes
+            OutboundEmail.objects.filter(pk=email.pk).update(
+                status='sent', sent_at=now, updated_at=now, body='', html_body='', last_error='',
+            )
+            logger.info(
+                f"Sent {email.category} email {email.pk} "
+                f"({(now - email.created_at).total_seconds() * 1000:.0f}ms after queueing)"
+            )
+    finally:
+        connection.close()
+    return len(emails)
+
+
+def deliver_pending():
+    """Deliver batches until nothing is due."""
+    total = 0
+    while True:
+        claimed = deliver_batch()
+        total += claimed
+        if claimed < settings.EMAIL_QUEUE_BATCH_SIZE:
+            return total
+
+
+def purge_sent():
+    """Delete sent messages older than EMAIL_QUEUE_RETENTION_DAYS; dead letters are kept for inspection."""
+    cutoff = timezone.now() - timedelta(days=settings.EMAIL_QUEUE_RETENTION_DAYS)
+    deleted, _ = OutboundEmail.objects.filter(status='sent', sent_at__lt=cutoff).delete()
+    return deleted
+
+
+def delivery_stats(window=timedelta(hours=1)):
+    """Queue depth, dead letters and queue-to-send latency (ms) over the last `window`."""
+    since = timezone.now() - window
+    latencies = sorted(
+        (sent_at - created_at).total_seconds() * 1000
+        for created_at, sent_at in OutboundEmail.objects.filter(status='sent', sent_at__gte=since)
+        .order_by('-sent_at')
+        .values_list('created_at', 'sent_at')[:1000]
+    )
+
+    def percentile(pct):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]) if latencies else None
+
+    return {
+        'queued': OutboundEmail.objects.filter(status__in=['queued', 'sending']).count(),
+        'dead': OutboundEmail.objects.filter(status='dead').count(),
+        'sent': OutboundEmail.objects.filter(status='sent', sent_at__gte=since).count(),
+        'latency_p50_ms': percentile(50),
+        'latency_p95_ms': percentile(95),
+    }
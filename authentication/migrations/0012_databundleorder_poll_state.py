@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0011_alter_auditlog_action'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='databundleorder',
+            name='next_poll_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='databundleorder',
+            name='poll_attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='databundleorder',
+            index=models.Index(condition=models.Q(('next_poll_at__isnull', False)), fields=['next_poll_at'], name='order_next_poll_idx'),
+        ),
+    ]
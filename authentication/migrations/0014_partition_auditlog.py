@@ -0,0 +1,105 @@
+from datetime import datetime, timezone
+
+from django.db import migrations
+
+
+TABLE = 'authentication_auditlog'
+UNPARTITIONED = 'authentication_auditlog_unpartitioned'
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(value, months):
+    month_index = value.month - 1 + months
+    return value.replace(year=value.year + month_index // 12, month=month_index % 12 + 1)
+
+
+def partition_auditlog(apps, schema_editor):
+    """
+    Convert the audit log into a table range-partitioned by month on PostgreSQL.
+
+    Existing rows are copied into one partition per month they span, so the
+    retention job can drop them month by month like newer ones, and the old
+    table is dropped. Partitions for the next three months and a default
+    partition are created too. Other databases keep the plain table.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    qn = schema_editor.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [TABLE],
+        )
+        if cursor.fetchone():
+            return
+
+        # Copying the largest table outlasts any role's statement timeout
+        cursor.execute("SET LOCAL statement_timeout = 0")
+
+        cursor.execute(f"SELECT min(created_at), max(created_at) FROM {qn(TABLE)}")
+        oldest, newest = cursor.fetchone()
+        now = datetime.now(timezone.utc)
+        first = month_start(min(now, oldest) if oldest else now)
+        last = add_months(month_start(max(now, newest) if newest else now), 4)
+
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'",
+            [TABLE],
+        )
+        pkey_name = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE tablename = %s AND indexname <> %s AND indexdef NOT LIKE 'CREATE UNIQUE%%'",
+            [TABLE, pkey_name],
+        )
+        indexes = cursor.fetchall()
+
+        # Free the table, primary key and index names for the partitioned parent
+        cursor.execute(f"ALTER TABLE {qn(TABLE)} RENAME TO {qn(UNPARTITIONED)}")
+        cursor.execute(f"ALTER TABLE {qn(UNPARTITIONED)} DROP CONSTRAINT {qn(pkey_name)}")
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX {qn(name)}")
+
+        cursor.execute(
+            f"CREATE TABLE {qn(TABLE)} (LIKE {qn(UNPARTITIONED)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE (created_at)"
+        )
+        # The partition key has to be part of the primary key
+        cursor.execute(f"ALTER TABLE {qn(TABLE)} ADD CONSTRAINT {qn(pkey_name)} PRIMARY KEY (id, created_at)")
+        for name, definition in indexes:
+            cursor.execute(f"CREATE INDEX {qn(name)} ON {qn(TABLE)} USING {definition.split(' USING ', 1)[1]}")
+        cursor.execute(
+            f"ALTER TABLE {qn(TABLE)} ADD CONSTRAINT {qn(TABLE + '_user_id_fk')} "
+            f"FOREIGN KEY (user_id) REFERENCES {qn('authentication_customuser')} (id) DEFERRABLE INITIALLY DEFERRED"
+        )
+
+        lower = first
+        while lower < last:
+            upper = add_months(lower, 1)
+            cursor.execute(
+                f"CREATE TABLE {qn(f'{TABLE}_p{lower:%Y%m}')} PARTITION OF {qn(TABLE)} "
+                f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+            )
+            lower = upper
+        cursor.execute(f"CREATE TABLE {qn(TABLE + '_default')} PARTITION OF {qn(TABLE)} DEFAULT")
+
+        cursor.execute(f"INSERT INTO {qn(TABLE)} SELECT * FROM {qn(UNPARTITIONED)}")
+        cursor.execute(f"DROP TABLE {qn(UNPARTITIONED)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0013_auditlog_created_at_default'),
+    ]
+
+    operations = [
+        # Not reversed: Django reads and writes the partitioned table like the plain one
+        migrations.RunPython(partition_auditlog, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('authentication', '0014_partition_auditlog'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(condition=models.Q(('email_verified', False)), fields=['account_status'], name='user_unverified_status_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0015_customuser_unverified_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='databundleorder',
+            index=models.Index(fields=['created_at', 'id'], name='order_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='databundleorder',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0016_databundleorder_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bundle',
+            index=models.Index(fields=['size_mb'], name='authenticat_size_mb_55cfdc_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:01
+
+import authentication.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0019_payment_pending_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FulfilmentRecord',
+            fields=[
+                ('id', models.CharField(default=authentication.models.generate_fulfilment_id, editable=False, max_length=20, primary_key=True, serialize=False, unique=True)),
+                ('idempotency_key', models.CharField(editable=False, max_length=64, unique=True)),
+                ('status', models.CharField(choices=[('claimed', 'Claimed'), ('sent', 'Sent'), ('failed', 'Failed'), ('unknown', 'Unknown')], default='claimed', max_length=10)),
+                ('claimed_by', models.CharField(max_length=255)),
+                ('provider_order_id', models.CharField(blank=True, max_length=100)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, related_name='fulfilment', to='authentication.databundleorder')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='authenticat_status_f820dc_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0020_fulfilmentrecord'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fulfilmentrecord',
+            name='status',
+            field=models.CharField(choices=[('claimed', 'Claimed'), ('sent', 'Sent'), ('failed', 'Failed'), ('unknown', 'Unknown'), ('deferred', 'Deferred')], default='claimed', max_length=10),
+        ),
+    ]
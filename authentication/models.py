@@ -1,6 +1,7 @@
 from django.db import models
 
 # Create your models here.
+import re
 import uuid
 import secrets
 import string
@@ -10,8 +11,10 @@ from django.db import models, IntegrityError, transaction
 from django.conf import settings
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from django.contrib.auth.hashers import make_password, check_password
+from django.contrib.auth.hashers import check_password
+from django.utils.crypto import constant_time_compare, salted_hmac
 from .managers import CustomUserManager
+from packages.field_tracker import FieldTrackerMixin
 
 
 # ---------- Helper Functions ----------
@@ -23,13 +26,34 @@ def generate_secure_otp(length=6):
     """Generate a cryptographically secure OTP."""
     return ''.join(secrets.choice(string.digits) for _ in range(length))
 
+# OTPs are short-lived, attempt-limited and rate limited, so a slow password
+# hasher buys nothing over a keyed HMAC; the key keeps a leaked table from
+# being brute-forced over the 10^6 code space without the server secret.
+OTP_HASH_ALGORITHM = 'hmac_sha256'
+OTP_HASH_VERSION = '1'
+
+def _otp_digest(otp, salt):
+    return salted_hmac(
+        f'authentication.otp.v{OTP_HASH_VERSION}', f'{salt}${otp}',
+        secret=settings.OTP_HASH_SECRET or settings.SECRET_KEY, algorithm='sha256',
+    ).hexdigest()
+
 def hash_otp(otp):
-    """Hash OTP for secure storage."""
-    return make_password(otp)
+    """Hash OTP for secure storage, as hmac_sha256$<version>$<salt>$<digest>."""
+    salt = secrets.token_hex(8)
+    return f"{OTP_HASH_ALGORITHM}${OTP_HASH_VERSION}${salt}${_otp_digest(otp, salt)}"
 
 def verify_otp(otp, hashed_otp):
-    """Verify OTP against hashed version."""
-    return check_password(otp, hashed_otp)
+    """Verify OTP against hashed version, including codes hashed with make_password before the HMAC scheme."""
+    if not hashed_otp.startswith(f'{OTP_HASH_ALGORITHM}$'):
+        return check_password(otp, hashed_otp)
+    try:
+        _, version, salt, digest = hashed_otp.split('$')
+    except ValueError:
+        return False
+    if version != OTP_HASH_VERSION:
+        return False
+    return constant_time_compare(_otp_digest(otp, salt), digest)
 
 
 # ---------- ID Generators ----------
@@ -57,9 +81,15 @@ def generate_otp_id():
 def generate_audit_id():
     return generate_custom_id("AUD")
 
+def generate_email_id():
+    return generate_custom_id("EML")
+
+def generate_fulfilment_id():
+    return generate_custom_id("FUL")
+
 
 # ---------- Custom User Model ----------
-class CustomUser(AbstractUser):
+class CustomUser(FieldTrackerMixin, AbstractUser):
     id = models.CharField(primary_key=True, unique=True, max_length=20, default=generate_user_id, editable=False)
     username = None 
 
@@ -103,6 +133,8 @@ class CustomUser(AbstractUser):
             models.Index(fields=['phone_number']),
             models.Index(fields=['account_status']),
             models.Index(fields=['created_at']),
+            # Small by design: backs the 'active but unverified' health check
+            models.Index(fields=['account_status'], name='user_unverified_status_idx', condition=models.Q(email_verified=False)),
         ]
 
     def __str__(self):
@@ -190,7 +222,7 @@ class CustomUser(AbstractUser):
 
 
 # ---------- OTP Model ----------
-class OTP(models.Model):
+class OTP(FieldTrackerMixin, models.Model):
     id = models.CharField(primary_key=True, unique=True, max_length=20, default=generate_otp_id, editable=False)
     
     OTP_TYPE_CHOICES = [
@@ -236,6 +268,11 @@ class OTP(models.Model):
         """Check if OTP has expired."""
         return timezone.now() > self.expires_at
 
+    @property
+    def validity_minutes(self):
+        """How long the code was issued for, for the OTP emails."""
+        return round((self.expires_at - self.created_at).total_seconds() / 60)
+
     @property
     def is_valid(self):
         """Check if OTP is valid for use."""
@@ -248,13 +285,21 @@ class OTP(models.Model):
     @classmethod
     def generate_otp(cls, user, otp_type, validity_minutes=10, ip_address=None, user_agent=None):
         """Generate a new OTP for a user."""
+        from management import rollups
+
         with transaction.atomic():
             # Invalidate previous active OTPs of the same type
-            cls.objects.filter(
+            previous = list(cls.objects.select_for_update().filter(
                 user=user, 
                 otp_type=otp_type, 
                 status='active'
-            ).update(status='invalidated')
+            ))
+            if previous:
+                cls.objects.filter(pk__in=[otp.pk for otp in previous]).update(status='invalidated')
+                # update() sends no post_save, so move them in the dashboard rollups here
+                for otp in previous:
+                    otp.status = 'invalidated'
+                    rollups.record_change(otp, update_fields=['status'])
             
             # Generate new OTP
             code = generate_secure_otp()
@@ -297,14 +342,20 @@ class OTP(models.Model):
     @classmethod
     def cleanup_expired_otps(cls):
         """Clean up expired and old OTPs - should be run as a periodic task."""
+        from management.tasks import queue_rollup_reconcile
+
         cutoff_time = timezone.now() - timedelta(days=7)  # Keep records for 7 days
         cls.objects.filter(created_at__lt=cutoff_time).delete()
         
         # Mark expired OTPs
-        cls.objects.filter(
-            expires_at__lt=timezone.now(),
-            status='active'
-        ).update(status='expired')
+        with transaction.atomic():
+            expired = cls.objects.filter(
+                expires_at__lt=timezone.now(),
+                status='active'
+            )
+            # Reads the days now and reconciles them once the update commits
+            queue_rollup_reconcile(expired)
+            expired.update(status='expired')
 
     def save(self, *args, **kwargs):
         if not self.id:
@@ -313,7 +364,7 @@ class OTP(models.Model):
 
 
 # ---------- Existing Models (Enhanced with Security) ----------
-class Telco(models.Model):
+class Telco(FieldTrackerMixin, models.Model):
     id = models.CharField(primary_key=True,unique=True, max_length=20, default=generate_telco_id, editable=False)
     name = models.CharField(max_length=50)
     code = models.CharField(max_length=20, unique=True)
@@ -340,7 +391,7 @@ class Telco(models.Model):
         super().save(*args, **kwargs)
 
 
-class Bundle(models.Model):
+class Bundle(FieldTrackerMixin, models.Model):
     id = models.CharField(primary_key=True,unique=True, max_length=20, default=generate_bundle_id, editable=False)
 
     NAME_CHOICES = [
@@ -367,6 +418,7 @@ class Bundle(models.Model):
         indexes = [
             models.Index(fields=['telco', 'is_active']),
             models.Index(fields=['is_instock']),
+            models.Index(fields=['size_mb']),
         ]
 
     def __str__(self):
@@ -380,6 +432,30 @@ class Bundle(models.Model):
             is_active=True
         ).order_by('size_mb')
 
+    @staticmethod
+    def search_filter(query):
+        """
+        A filter for the admin bundle search. Every word of `query` has to match
+        a telco name or code, a bundle name, or a size ("1GB", "500 MB",
+        "1000"); each resolves to an equality or IN lookup on an indexed
+        column rather than a LIKE over the bundle table.
+        """
+        query = re.sub(r'(\d)\s+(gb|mb)\b', r'\1\2', query, flags=re.IGNORECASE)
+        condition = models.Q()
+        for term in query.split():
+            lowered = term.lower()
+            term_condition = models.Q(
+                telco__in=Telco.objects.filter(models.Q(name__icontains=term) | models.Q(code__iexact=term))
+            ) | models.Q(
+                name__in=[value for value, label in Bundle.NAME_CHOICES if lowered in value or lowered in label.lower()]
+            )
+            size = re.fullmatch(r'(\d+(?:\.\d+)?)(gb|mb)?', lowered)
+            if size:
+                size_mb = float(size.group(1)) * (1000 if size.group(2) == 'gb' else 1)
+                term_condition |= models.Q(size_mb=int(size_mb))
+            condition &= term_condition
+        return condition
+
     def save(self, *args, **kwargs):
         if not self.id:
             self.id = generate_bundle_id()
@@ -394,7 +470,7 @@ class Bundle(models.Model):
         self.save(update_fields=['is_active'])
 
 
-class DataBundleOrder(models.Model):
+class DataBundleOrder(FieldTrackerMixin, models.Model):
     id = models.CharField(primary_key=True,unique=True, max_length=20, default=generate_order_id, editable=False)
 
     STATUS_CHOICES = [
@@ -412,6 +488,8 @@ class DataBundleOrder(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     provider_order_id = models.CharField(max_length=100, blank=True, null=True)
     provider_status = models.CharField(max_length=20, blank=True, null=True)
+    poll_attempts = models.PositiveIntegerField(default=0)
+    next_poll_at = models.DateTimeField(null=True, blank=True)  # None = not awaiting a provider status
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -423,6 +501,10 @@ class DataBundleOrder(models.Model):
             models.Index(fields=['user', 'status']),
             models.Index(fields=['status', 'created_at']),
             models.Index(fields=['phone_number']),
+            # Keyset pagination of order lists (packages.pagination)
+            models.Index(fields=['created_at', 'id'], name='order_created_id_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_id_idx'),
+            models.Index(fields=['next_poll_at'], name='order_next_poll_idx', condition=models.Q(next_poll_at__isnull=False)),
         ]
 
     def __str__(self):
@@ -438,7 +520,7 @@ class DataBundleOrder(models.Model):
         super().save(*args, **kwargs)
 
 
-class Payment(models.Model):
+class Payment(FieldTrackerMixin, models.Model):
     id = models.CharField(primary_key=True, unique=True, max_length=20, default=generate_payment_id, editable=False)
 
     PAYMENT_STATUS = [
@@ -464,6 +546,8 @@ class Payment(models.Model):
             models.Index(fields=['reference']),
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
+            # Pending payments awaiting reconciliation (system.services.sweep_pending_payments)
+            models.Index(fields=['created_at'], name='payment_pending_idx', condition=models.Q(status='pending')),
         ]
 
     def __str__(self):
@@ -508,7 +592,7 @@ class AuditLog(models.Model):
     details = models.JSONField(default=dict, blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True,null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)  # set when recorded, not when the buffer is flushed
 
     class Meta:
         ordering = ['-created_at']
@@ -522,6 +606,83 @@ class AuditLog(models.Model):
     
 
 
+# ---------- Outbound Email Queue ----------
+class OutboundEmail(models.Model):
+    """
+    A message waiting for, or done with, delivery by authentication.mail.
+    Bodies are cleared once sent, since they can carry OTP codes.
+    """
+    id = models.CharField(primary_key=True, unique=True, max_length=20, default=generate_email_id, editable=False)
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead'),
+    ]
+
+    category = models.CharField(max_length=50)
+    recipient = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['next_attempt_at'], name='email_pending_idx', condition=models.Q(status='queued')),
+            models.Index(fields=['status', 'updated_at']),
+            models.Index(fields=['sent_at'], name='email_sent_idx', condition=models.Q(status='sent')),
+        ]
+
+    def __str__(self):
+        return f"{self.category} to {self.recipient} - {self.status}"
+
+
+# ---------- DataMart Fulfilment Ledger ----------
+class FulfilmentRecord(models.Model):
+    """
+    The one DataMart purchase an order may make (see system.fulfilment).
+    The row is committed before the purchase is sent, so a second attempt
+    for the same order fails on the unique order instead of buying again.
+    """
+    id = models.CharField(primary_key=True, unique=True, max_length=20, default=generate_fulfilment_id, editable=False)
+
+    STATUS_CHOICES = [
+        ('claimed', 'Claimed'),    # purchase being sent, or the sender died mid-call
+        ('sent', 'Sent'),          # DataMart accepted the purchase
+        ('failed', 'Failed'),      # DataMart never received or refused the purchase
+        ('unknown', 'Unknown'),    # sent, but the outcome was lost; check with DataMart
+        ('deferred', 'Deferred'),  # not sent while DataMart's circuit was open; retried later
+    ]
+
+    order = models.OneToOneField(DataBundleOrder, on_delete=models.PROTECT, related_name='fulfilment')
+    idempotency_key = models.CharField(max_length=64, unique=True, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='claimed')
+    claimed_by = models.CharField(max_length=255)
+    provider_order_id = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"Fulfilment of {self.order_id} - {self.status}"
+
+
+
 # Add this to your models.py
 
 class SystemConfiguration(models.Model):
@@ -557,13 +718,8 @@ class SystemConfiguration(models.Model):
     @classmethod
     def get_config_value(cls, key, default=True):
         """Get configuration value by key, with fallback to default."""
-        try:
-            config = cls.objects.get(key=key)
-            return config.value
-        except cls.DoesNotExist:
-            # Create the config with default value if it doesn't exist
-            cls.objects.create(key=key, value=default)
-            return default
+        from .configuration import get as get_config
+        return get_config(key, default)
     
     @classmethod
     def is_auto_api_trigger_enabled(cls):
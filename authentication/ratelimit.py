@@ -0,0 +1,211 @@
+"""
+Sliding-window rate limits for OTP issuance and verification.
+
+Every attempt is checked against three budgets before any user lookup,
+hashing or email work is done: the email address, the client IP, and the
+client's /24 (IPv4) or /64 (IPv6) network. Budgets are configured per OTP
+type in OTP_RATE_LIMITS as (limit, window seconds); 'otp_verify' covers code
+submissions.
+
+With the Redis cache backend the windows are sorted sets updated by one Lua
+script, so concurrent web workers share them and an attempt is only recorded
+when every budget has room. Without Redis, or while it is unreachable, each
+process keeps its own in-memory windows, which is weaker but never fails open
+entirely. Blocked attempts are counted per OTP type and scope for the admin
+dashboard.
+
+The client IP is REMOTE_ADDR, or with TRUSTED_PROXY_COUNT proxies in front
+of the app, the X-Forwarded-For entry the outermost of them appended. Entries
+further left are written by the client and are never trusted.
+"""
+import hashlib
+import ipaddress
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+VERIFY = 'otp_verify'
+SCOPES = ('email', 'ip', 'subnet')
+BLOCKED_KEY = 'ratelimit:blocked'
+LOCAL_MAX_KEYS = 10000
+
+# KEYS are the windows; ARGV is now, member, then (window, limit) per key.
+# Returns {0, 0} when allowed, else {index of the full window, seconds until it frees up}.
+_SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[1 + 2 * i])
+    local limit = tonumber(ARGV[2 + 2 * i])
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= limit then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        return {i, math.ceil(tonumber(oldest[2]) + window - now)}
+    end
+end
+for i, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[2])
+    redis.call('EXPIRE', key, math.ceil(tonumber(ARGV[1 + 2 * i])))
+end
+return {0, 0}
+"""
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    scope: str = None
+    retry_after: int = 0
+
+
+_lock = threading.Lock()
+_local_windows = defaultdict(deque)
+_local_blocked = defaultdict(int)
+
+
+def client_ip(request):
+    """The address the request came from, as seen by our outermost trusted proxy."""
+    remote_addr = request.META.get('REMOTE_ADDR')
+    ip = remote_addr
+    count = settings.TRUSTED_PROXY_COUNT
+    if count:
+        forwarded = [entry.strip() for entry in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if entry.strip()]
+        # Fewer entries than proxies: the request did not come through all of them
+        if len(forwarded) >= count:
+            ip = forwarded[-count]
+    try:
+        return str(ipaddress.ip_address(ip))
+    except (TypeError, ValueError):
+        if ip != remote_addr:
+            logger.warning(f"Ignoring malformed X-Forwarded-For entry {ip!r}")
+        return remote_addr
+
+
+def _subnet(ip):
+    try:
+        address = ipaddress.ip_address(ip)
+    except (TypeError, ValueError):
+        return None
+    prefix = 24 if address.version == 4 else 64
+    return str(ipaddress.ip_network(f'{address}/{prefix}', strict=False))
+
+
+def _identities(request, email):
+    ip = client_ip(request)
+    digest = hashlib.sha256((email or '').strip().lower().encode()).hexdigest()[:32] if email else None
+    return {'email': digest, 'ip': ip, 'subnet': _subnet(ip)}
+
+
+def _windows(otp_type, identities):
+    budgets = settings.OTP_RATE_LIMITS.get(otp_type, {})
+    windows = []
+    for scope in SCOPES:
+        if scope in budgets and identities[scope]:
+            limit, window = budgets[scope]
+            windows.append((scope, f'ratelimit:{otp_type}:{scope}:{identities[scope]}', limit, window))
+    return windows
+
+
+def _hit_redis(windows, now):
+    client = caches['default']._cache.get_client(write=True)
+    args = [now, uuid.uuid4().hex]
+    for _, _, limit, window in windows:
+        args += [window, limit]
+    index, retry_after = client.eval(_SLIDING_WINDOW_SCRIPT, len(windows), *[key for _, key, _, _ in windows], *args)
+    if index:
+        return RateLimitResult(False, windows[int(index) - 1][0], int(retry_after))
+    return RateLimitResult(True)
+
+
+def _hit_local(windows, now):
+    with _lock:
+        for scope, key, limit, window in windows:
+            hits = _local_windows[key]
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) >= limit:
+                return RateLimitResult(False, scope, int(hits[0] + window - now) + 1)
+        for _, key, _, _ in windows:
+            _local_windows[key].append(now)
+        if len(_local_windows) > LOCAL_MAX_KEYS:
+            _sweep_local(now)
+    return RateLimitResult(True)
+
+
+def _sweep_local(now):
+    # Forget identities whose newest attempt is outside every window
+    horizon = max(window for budgets in settings.OTP_RATE_LIMITS.values() for _, window in budgets.values())
+    for key in [key for key, hits in _local_windows.items() if not hits or hits[-1] <= now - horizon]:
+        del _local_windows[key]
+
+
+def _record_block(otp_type, scope):
+    key = f'{BLOCKED_KEY}:{otp_type}:{scope}'
+    try:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+    except Exception:
+        with _lock:
+            _local_blocked[key] += 1
+
+
+def hit(request, otp_type, email=None):
+    """
+    Record an attempt of `otp_type` ('email_verification', 'login_verification',
+    'password_reset' or VERIFY) for `email` from the request's client, unless
+    a budget is exhausted. Check `.allowed` on the result.
+    """
+    if not settings.OTP_RATE_LIMIT_ENABLED:
+        return RateLimitResult(True)
+
+    windows = _windows(otp_type, _identities(request, email))
+    if not windows:
+        return RateLimitResult(True)
+
+    now = time.time()
+    result = None
+    if isinstance(caches['default'], RedisCache):
+        try:
+            result = _hit_redis(windows, now)
+        except Exception as e:
+            logger.warning(f"Rate limiter falling back to local windows: {str(e)}")
+    if result is None:
+        result = _hit_local(windows, now)
+
+    if not result.allowed:
+        _record_block(otp_type, result.scope)
+        logger.warning(
+            f"Rate limited {otp_type} by {result.scope} from {client_ip(request)} "
+            f"(retry in {result.retry_after}s)"
+        )
+    return result
+
+
+def blocked_counts():
+    """Blocked attempts since the last cache flush, as {(otp_type, scope): count}."""
+    counts = {}
+    for otp_type in settings.OTP_RATE_LIMITS:
+        for scope in SCOPES:
+            key = f'{BLOCKED_KEY}:{otp_type}:{scope}'
+            try:
+                count = cache.get(key) or 0
+            except Exception:
+                count = 0
+            count += _local_blocked.get(key, 0)
+            if count:
+                counts[(otp_type, scope)] = count
+    return counts
+
+
+def describe(result):
+    """A user-facing message for a blocked attempt."""
+    minutes = max(1, -(-result.retry_after // 60))
+    return f"Too many attempts. Please wait {minutes} minute{'s' if minutes != 1 else ''} and try again."
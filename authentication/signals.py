@@ -1,25 +1,28 @@
 import logging
-from django.db.models.signals import post_save, post_delete, pre_save
+from django.db.models.signals import post_save, post_delete
 from django.contrib.auth.signals import user_logged_in, user_logged_out, user_login_failed
 from django.dispatch import receiver
+from django.db import transaction
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from threading import local
-from system.services import handle_successful_payment
+from system.tasks import fulfil_order
+from system.catalog import invalidate_catalog
+from packages.replicas import pin_to_primary
 
+from . import audit, configuration
 from .models import (
     AuditLog, 
     OTP, 
     DataBundleOrder, 
     Payment, 
     Bundle, 
-    Telco
+    Telco,
+    SystemConfiguration
 )
 
-# Thread-local storage for request context and model instance cache
+# Thread-local storage for request context
 _thread_locals = local()
-_original_instances = local()
-_original_instances.cache = {}
 
 # Logger for signal errors
 logger = logging.getLogger(__name__)
@@ -51,7 +54,7 @@ def clear_request_context():
 
 # ---------- Helper Functions ----------
 def create_audit_log(action, user=None, details=None, ip_address=None, user_agent=None):
-    """Create an audit log entry with error handling."""
+    """Buffer an audit log entry (see authentication.audit) with error handling."""
     try:
         context = get_request_context()
         
@@ -60,7 +63,7 @@ def create_audit_log(action, user=None, details=None, ip_address=None, user_agen
         if log_user and not isinstance(log_user, User):
             log_user = None
 
-        AuditLog.objects.create(
+        audit.record(
             user=log_user,
             action=action,
             details=details or {},
@@ -70,54 +73,26 @@ def create_audit_log(action, user=None, details=None, ip_address=None, user_agen
     except Exception as e:
         logger.error(f"Failed to create audit log for action '{action}': {str(e)}")
 
-def get_model_changes(instance, original_instance=None):
-    """Get changed fields between model instances."""
-    if not original_instance:
-        return {}
-    
+def get_model_changes(instance, update_fields=None):
+    """Get fields changed by the current save, from the instance's in-memory snapshot."""
     changes = {}
-    for field in instance._meta.fields:
-        field_name = field.name
-        old_value = getattr(original_instance, field_name, None)
-        new_value = getattr(instance, field_name, None)
-        
+    for field_name, (old_value, new_value) in instance.get_field_changes(update_fields).items():
         # Skip sensitive fields
         if field_name in ['password', 'hashed_code']:
             continue
-            
-        if old_value != new_value:
-            changes[field_name] = {
-                'old': str(old_value) if old_value is not None else None,
-                'new': str(new_value) if new_value is not None else None
-            }
-    
-    return changes
 
+        changes[field_name] = {
+            'old': str(old_value) if old_value is not None else None,
+            'new': str(new_value) if new_value is not None else None
+        }
 
-# ---------- Pre-Save Handlers to Cache Original Instances ----------
-@receiver(pre_save, sender=User)
-@receiver(pre_save, sender=Bundle)
-@receiver(pre_save, sender=Telco)
-@receiver(pre_save, sender=DataBundleOrder)
-@receiver(pre_save, sender=Payment)
-def cache_original_instance(sender, instance, **kwargs):
-    """Caches the original instance before a save operation for change tracking."""
-    if not hasattr(_original_instances, 'cache'):
-        _original_instances.cache = {}
-        
-    if instance.pk:
-        try:
-            _original_instances.cache[instance.pk] = sender.objects.get(pk=instance.pk)
-        except sender.DoesNotExist:
-            _original_instances.cache[instance.pk] = None
+    return changes
 
 
-# ---------- Post-Save Handlers (Updated for Caching) ----------
+# ---------- Post-Save Handlers ----------
 @receiver(post_save, sender=User)
-def user_post_save_handler(sender, instance, created, **kwargs):
+def user_post_save_handler(sender, instance, created, update_fields=None, **kwargs):
     """Handle user creation and updates."""
-    original = _original_instances.cache.pop(instance.pk, None)
-    
     if created:
         create_audit_log(
             action='user_created',
@@ -130,8 +105,8 @@ def user_post_save_handler(sender, instance, created, **kwargs):
                 'account_status': instance.account_status
             }
         )
-    elif original:
-        changes = get_model_changes(instance, original)
+    else:
+        changes = get_model_changes(instance, update_fields)
         if changes:
             if 'email_verified' in changes and changes['email_verified']['new'] == 'True':
                 create_audit_log(
@@ -283,9 +258,10 @@ def otp_post_save_handler(sender, instance, created, **kwargs):
 
 # ---------- Order-Related Signals ----------
 @receiver(post_save, sender=DataBundleOrder)
-def order_post_save_handler(sender, instance, created, **kwargs):
+def order_post_save_handler(sender, instance, created, update_fields=None, **kwargs):
     """Handle order creation and updates."""
-    original = _original_instances.cache.pop(instance.pk, None)
+    # The user's next pages should show this write, not a lagging replica
+    pin_to_primary(instance.user_id)
 
     if created:
         create_audit_log(
@@ -301,25 +277,33 @@ def order_post_save_handler(sender, instance, created, **kwargs):
             ip_address=instance.ip_address,
             user_agent=instance.user_agent
         )
-    elif original and original.status != instance.status:
-        create_audit_log(
-            action='order_status_changed',
-            user=instance.user,
-            details={
-                'order_id': instance.id,
-                'old_status': original.status,
-                'new_status': instance.status,
-                'phone_number': instance.phone_number,
-                'provider_order_id': instance.provider_order_id
-            }
-        )
+    else:
+        changes = instance.get_field_changes(update_fields)
+        if 'status' in changes:
+            create_audit_log(
+                action='order_status_changed',
+                user=instance.user,
+                details={
+                    'order_id': instance.id,
+                    'old_status': changes['status'][0],
+                    'new_status': instance.status,
+                    'phone_number': instance.phone_number,
+                    'provider_order_id': instance.provider_order_id
+                }
+            )
 
 
 # ---------- Payment-Related Signals ----------
+def enqueue_fulfilment(order_id):
+    """Queue DataMart fulfilment once the payment write has committed."""
+    transaction.on_commit(lambda: fulfil_order.delay(order_id))
+
+
 @receiver(post_save, sender=Payment)
-def payment_post_save_handler(sender, instance, created, **kwargs):
+def payment_post_save_handler(sender, instance, created, update_fields=None, **kwargs):
     """Handle payment creation, updates, and DataMart purchases."""
-    original = _original_instances.cache.pop(instance.pk, None)
+    changes = {} if created else instance.get_field_changes(update_fields)
+    pin_to_primary(instance.order.user_id)
 
     # ===== CASE 1: New payment created =====
     if created:
@@ -340,10 +324,10 @@ def payment_post_save_handler(sender, instance, created, **kwargs):
         
         if instance.status == "success":
             print(f"[Datamart Trigger] New successful payment: {instance.id}")
-            handle_successful_payment(instance.order_id)
+            enqueue_fulfilment(instance.order_id)
 
     # ===== CASE 2: Existing payment updated =====
-    elif original and original.status != instance.status:
+    elif 'status' in changes:
         action_map = {
             'success': 'payment_completed',
             'failed': 'payment_failed',
@@ -361,7 +345,7 @@ def payment_post_save_handler(sender, instance, created, **kwargs):
                 'order_id': instance.order.id,
                 'amount': str(instance.amount),
                 'reference': instance.reference,
-                'old_status': original.status,
+                'old_status': changes['status'][0],
                 'new_status': instance.status,
                 'paid_at': str(instance.paid_at) if instance.paid_at else None
             }
@@ -370,15 +354,14 @@ def payment_post_save_handler(sender, instance, created, **kwargs):
         
         if instance.status == "success":
             print(f"[Datamart Trigger] Payment status changed to success: {instance.id}")
-            handle_successful_payment(instance.order_id)
+            enqueue_fulfilment(instance.order_id)
 
 # ---------- Bundle & Telco Signals ----------
 @receiver(post_save, sender=Bundle)
-def bundle_post_save_handler(sender, instance, created, **kwargs):
+def bundle_post_save_handler(sender, instance, created, update_fields=None, **kwargs):
     """Handle bundle creation and updates."""
     context = get_request_context()
-    original = _original_instances.cache.pop(instance.pk, None)
-    
+
     if created:
         create_audit_log(
             action='bundle_created',
@@ -391,8 +374,8 @@ def bundle_post_save_handler(sender, instance, created, **kwargs):
                 'price': str(instance.price)
             }
         )
-    elif original:
-        changes = get_model_changes(instance, original)
+    else:
+        changes = get_model_changes(instance, update_fields)
         
         if 'price' in changes:
             create_audit_log(
@@ -421,11 +404,10 @@ def bundle_post_save_handler(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=Telco)
-def telco_post_save_handler(sender, instance, created, **kwargs):
+def telco_post_save_handler(sender, instance, created, update_fields=None, **kwargs):
     """Handle telco creation and updates."""
     context = get_request_context()
-    original = _original_instances.cache.pop(instance.pk, None)
-    
+
     if created:
         create_audit_log(
             action='telco_created',
@@ -436,7 +418,7 @@ def telco_post_save_handler(sender, instance, created, **kwargs):
                 'code': instance.code
             }
         )
-    elif original and original.is_active != instance.is_active:
+    elif 'is_active' in instance.get_field_changes(update_fields):
         action = 'telco_activated' if instance.is_active else 'telco_deactivated'
         create_audit_log(
             action=action,
@@ -478,23 +460,22 @@ def log_custom_action(action, user=None, details=None, request=None):
         details=details or {},
         ip_address=ip_address,
         user_agent=user_agent
-    )            
+    )
 
-# ---------- Cleanup Signal (Optional) ----------
-@receiver(post_save, sender=AuditLog)
-def audit_log_cleanup_handler(sender, instance, created, **kwargs):
-    """
-    Optional: Trigger cleanup of old audit logs.
-    You might want to run this as a periodic task instead.
-    """
-    if created:
-        import random
-        if random.randint(1, 100) == 1:
-            try:
-                cutoff_date = timezone.now() - timezone.timedelta(days=365)
-                old_logs_count = AuditLog.objects.filter(created_at__lt=cutoff_date).count()
-                if old_logs_count > 0:
-                    AuditLog.objects.filter(created_at__lt=cutoff_date).delete()
-                    logger.info(f"Cleaned up {old_logs_count} old audit log entries")
-            except Exception as e:
-                logger.error(f"Failed to cleanup old audit logs: {str(e)}")
\ No newline at end of file
+
+# ---------- System Configuration Cache ----------
+@receiver(post_save, sender=SystemConfiguration)
+@receiver(post_delete, sender=SystemConfiguration)
+def invalidate_system_configuration(sender, instance, **kwargs):
+    """Bump the shared config version once the change is committed."""
+    transaction.on_commit(configuration.invalidate)
+
+
+# ---------- Bundle Catalog Cache ----------
+@receiver(post_save, sender=Bundle)
+@receiver(post_delete, sender=Bundle)
+@receiver(post_save, sender=Telco)
+@receiver(post_delete, sender=Telco)
+def invalidate_bundle_catalog(sender, instance, **kwargs):
+    """Rebuild the storefront catalog after bundle or telco changes are committed."""
+    transaction.on_commit(invalidate_catalog)
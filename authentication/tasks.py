@@ -0,0 +1,100 @@
+import tempfile
+
+from celery import shared_task
+from celery.signals import task_postrun, task_prerun
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.mail import send_mail
+from django.db import DatabaseError, IntegrityError, transaction
+from django.utils.dateparse import parse_datetime
+from .models import AuditLog
+from . import audit, exports, mail
+from .audit_partitions import ensure_partitions, purge_expired_audit_logs
+from packages.replicas import on_replica
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=30, ignore_result=True)
+def write_audit_logs(self, entries):
+    """Durable fallback for audit entries the request path could not write."""
+    logs = []
+    for entry in entries:
+        entry = dict(entry)
+        entry['created_at'] = parse_datetime(entry['created_at'])
+        logs.append(AuditLog(**entry))
+
+    try:
+        with transaction.atomic():
+            AuditLog.objects.bulk_create(logs, ignore_conflicts=True)
+    except IntegrityError:
+        # One bad row (e.g. a user that was rolled back) must not sink the batch
+        for log in logs:
+            try:
+                with transaction.atomic():
+                    AuditLog.objects.bulk_create([log], ignore_conflicts=True)
+            except IntegrityError as e:
+                logger.error(f"Dropping audit log {log.id} ({log.action}): {str(e)}")
+    except DatabaseError as e:
+        raise self.retry(exc=e)
+
+
+@shared_task(ignore_result=True)
+def maintain_audit_log_partitions():
+    """Pre-create upcoming monthly partitions, then apply the retention policy."""
+    ensure_partitions()
+    purge_expired_audit_logs()
+
+
+@shared_task(ignore_result=True)
+def export_to_file(spec_name, model_label, pks, export_path, ordering=(), fmt=exports.CSV, compress=False,
+                   notify_email=None, download_url=None):
+    """
+    Write an admin export too large to stream to a browser into default
+    storage, then email the requester where to download it.
+    """
+    spec = exports.SPECS[spec_name]
+    querysets = [on_replica(queryset) for queryset in exports.selected(apps.get_model(model_label), pks, ordering)]
+
+    with tempfile.TemporaryFile() as spool:
+        size = exports.write(spec, querysets, spool, fmt=fmt, compress=compress)
+        spool.seek(0)
+        # Saved only once complete, so the download link never serves a partial file
+        saved_path = default_storage.save(export_path, File(spool))
+    logger.info(f"Wrote {spec_name} export to {saved_path} ({size} bytes)")
+
+    if notify_email:
+        send_mail(
+            f"Your {spec_name.replace('_', ' ')} export is ready",
+            f"Download it from {download_url}\n\nThe link requires an admin login.",
+            settings.DEFAULT_FROM_EMAIL,
+            [notify_email],
+            fail_silently=True,
+        )
+    return saved_path
+
+
+@shared_task(ignore_result=True)
+def send_queued_emails(purge=False):
+    """
+    Deliver every due message in the outbound email queue. Queued right after
+    each queue_email() commit, and from beat for retries (with purge=True to
+    also drop old sent messages).
+    """
+    mail.deliver_pending()
+    if purge:
+        mail.purge_sent()
+
+
+@task_prerun.connect
+def start_audit_buffer(**kwargs):
+    audit.task_started()
+
+
+@task_postrun.connect
+def flush_audit_buffer(**kwargs):
+    """Write whatever audit entries a task left in the worker's buffer."""
+    audit.task_finished()
@@ -1,3 +1,61 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
 
-# Create your tests here.
+from authentication import ratelimit
+
+LIMITS = {
+    'login_verification': {'email': (5, 600), 'ip': (20, 3600), 'subnet': (60, 3600)},
+}
+
+
+@override_settings(OTP_RATE_LIMIT_ENABLED=True, OTP_RATE_LIMITS=LIMITS, TRUSTED_PROXY_COUNT=0)
+class OTPRateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit._local_windows.clear()
+        ratelimit._local_blocked.clear()
+        self.factory = RequestFactory()
+
+    def request(self, remote_addr='198.51.100.7', forwarded_for=None):
+        meta = {'REMOTE_ADDR': remote_addr}
+        if forwarded_for is not None:
+            meta['HTTP_X_FORWARDED_FOR'] = forwarded_for
+        return self.factory.post('/login/', **meta)
+
+    def test_sixth_otp_request_for_an_email_is_refused(self):
+        for _ in range(5):
+            self.assertTrue(ratelimit.hit(self.request(), 'login_verification', 'user@example.com').allowed)
+
+        result = ratelimit.hit(self.request(), 'login_verification', 'User@Example.com ')
+        self.assertFalse(result.allowed)
+        self.assertEqual(result.scope, 'email')
+        self.assertGreater(result.retry_after, 0)
+        self.assertTrue(ratelimit.hit(self.request(), 'login_verification', 'other@example.com').allowed)
+
+    def test_spoofed_forwarded_for_from_untrusted_peer_is_ignored(self):
+        request = self.request(forwarded_for='203.0.113.50')
+        self.assertEqual(ratelimit.client_ip(request), '198.51.100.7')
+
+        # Rotating the header does not buy a fresh IP budget
+        for n in range(20):
+            request = self.request(forwarded_for=f'203.0.113.{n}')
+            self.assertTrue(ratelimit.hit(request, 'login_verification', f'user{n}@example.com').allowed)
+        result = ratelimit.hit(self.request(forwarded_for='203.0.113.99'), 'login_verification', 'new@example.com')
+        self.assertFalse(result.allowed)
+        self.assertEqual(result.scope, 'ip')
+
+    @override_settings(TRUSTED_PROXY_COUNT=1)
+    def test_behind_a_proxy_only_the_entry_it_appended_is_used(self):
+        request = self.request(remote_addr='10.0.0.2', forwarded_for='1.2.3.4, 203.0.113.9')
+        self.assertEqual(ratelimit.client_ip(request), '203.0.113.9')
+
+    @override_settings(TRUSTED_PROXY_COUNT=1)
+    def test_malformed_forwarded_for_falls_back_to_the_peer(self):
+        request = self.request(remote_addr='10.0.0.2', forwarded_for='not-an-ip')
+        self.assertEqual(ratelimit.client_ip(request), '10.0.0.2')
+        self.assertEqual(ratelimit._identities(request, 'user@example.com')['subnet'], '10.0.0.0/24')
+
+    @override_settings(TRUSTED_PROXY_COUNT=2)
+    def test_fewer_entries_than_proxies_falls_back_to_the_peer(self):
+        request = self.request(remote_addr='10.0.0.2', forwarded_for='203.0.113.9')
+        self.assertEqual(ratelimit.client_ip(request), '10.0.0.2')
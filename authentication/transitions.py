@@ -0,0 +1,134 @@
+"""
+Order and payment status transitions.
+
+Status is only ever changed through transition() or transition_all(), which
+check the move against ORDER_TRANSITIONS / PAYMENT_TRANSITIONS and apply it
+as a compare-and-set:
+
+    UPDATE ... SET status = 'completed', ... WHERE id = %s AND status = 'pending'
+
+No row lock is taken. If another writer got there first the UPDATE matches
+nothing; the current status is re-read once and, if the move is still
+allowed from it, tried again. The caller learns whether its transition won,
+so a webhook, a retried task and the poller racing on one order cannot
+overwrite each other or fulfil it twice.
+
+A winning transition updates the instance and sends post_save with
+update_fields, so audit logs, dashboard rollups, read-replica pinning and
+fulfilment react exactly as they do to save().
+
+An order is 'completed' once paid and handed to DataMart; DataMart's own
+progress can still move it to processing, failed or cancelled. Cancelled
+orders, and cancelled and refunded payments, are final. Failed ones are
+final too unless the caller names 'failed' in from_statuses, which only
+confirm_paystack_charge does: a charge Paystack confirms after its payment
+was given up on makes the payment successful and reopens the order.
+"""
+import logging
+
+from django.db import router
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .models import DataBundleOrder, Payment
+
+logger = logging.getLogger(__name__)
+
+ORDER_TRANSITIONS = {
+    'pending': ('processing', 'completed', 'failed', 'cancelled'),
+    'processing': ('completed', 'failed', 'cancelled'),
+    'completed': ('processing', 'failed', 'cancelled'),
+    'failed': ('pending',),
+    'cancelled': (),
+}
+
+PAYMENT_TRANSITIONS = {
+    'pending': ('success', 'failed', 'cancelled'),
+    'success': ('refunded',),
+    'failed': ('success',),
+    'cancelled': (),
+    'refunded': (),
+}
+
+TRANSITIONS = {DataBundleOrder: ORDER_TRANSITIONS, Payment: PAYMENT_TRANSITIONS}
+
+# Left out of a transition's sources unless named in from_statuses
+REOPENED_STATUSES = ('failed',)
+
+# One retry covers a writer that changed the status between our read and our UPDATE
+MAX_ATTEMPTS = 2
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def allowed_sources(model, to_status, from_statuses=None):
+    """Statuses `model` may move to `to_status` from, optionally narrowed to `from_statuses`."""
+    table = TRANSITIONS[model]
+    if to_status not in table:
+        raise InvalidTransition(f"{model.__name__} has no status '{to_status}'")
+    sources = tuple(status for status, targets in table.items() if to_status in targets)
+    if from_statuses is None:
+        sources = tuple(status for status in sources if status not in REOPENED_STATUSES)
+    else:
+        sources = tuple(status for status in sources if status in from_statuses)
+    if not sources:
+        raise InvalidTransition(f"No {model.__name__} may move to '{to_status}' from {from_statuses}")
+    return sources
+
+
+def _compare_and_set(instance, observed, values, db):
+    model = type(instance)
+    if not model.objects.using(db).filter(pk=instance.pk, status=observed).update(**values):
+        return False
+
+    # Signal receivers diff against the snapshot, so it must hold the status we replaced
+    instance._loaded_values['status'] = observed
+    for name, value in values.items():
+        setattr(instance, name, value)
+    instance._state.db = db
+    update_fields = frozenset(values)
+    post_save.send(sender=model, instance=instance, created=False, update_fields=update_fields, raw=False, using=db)
+    instance._snapshot_fields(update_fields)
+    return True
+
+
+def transition(instance, to_status, from_statuses=None, **fields):
+    """
+    Move a DataBundleOrder or Payment to `to_status`, writing `fields` in the
+    same UPDATE. Returns True if this call made the change, False if the
+    row's status does not allow it (the instance's status is then refreshed).
+
+        if transition(order, 'completed'):
+            trigger_datamart_api(order)
+    """
+    model = type(instance)
+    sources = allowed_sources(model, to_status, from_statuses)
+    values = {'status': to_status, 'updated_at': timezone.now(), **fields}
+    # Like save(): the primary, even for an instance read from the replica, which is
+    # also where the status is re-read so replica lag cannot hide the winning write
+    db = router.db_for_write(model, instance=instance)
+
+    observed = instance.status
+    for _ in range(MAX_ATTEMPTS):
+        if observed not in sources:
+            break
+        if _compare_and_set(instance, observed, values, db):
+            return True
+        observed = model.objects.using(db).filter(pk=instance.pk).values_list('status', flat=True).first()
+
+    if observed is not None and observed != instance.status:
+        instance.status = observed
+        instance._snapshot_fields(['status'])
+    logger.info(f"{model.__name__} {instance.pk} not moved to '{to_status}': status is '{observed}'")
+    return False
+
+
+def transition_all(queryset, to_status, from_statuses=None, **fields):
+    """Apply transition() to each row of `queryset` that may move to `to_status`; returns how many moved."""
+    sources = allowed_sources(queryset.model, to_status, from_statuses)
+    return sum(
+        transition(instance, to_status, from_statuses=sources, **fields)
+        for instance in queryset.filter(status__in=sources)
+    )
@@ -72,14 +72,19 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import Count, Sum, Avg, Q
 from django.db.models.functions import TruncMonth
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from packages.pagination import CursorPaginator
+from packages.replicas import replica_safe
+from django.utils.decorators import method_decorator
 from django.shortcuts import render
 from django.utils import timezone
 from datetime import datetime, timedelta
 from .models import CustomUser, DataBundleOrder, Bundle
 import logging
+from .signals import create_audit_log
+from . import ratelimit
+from .mail import queue_email
 
 logger = logging.getLogger(__name__)
-from django.core.mail import EmailMessage
 
 
 class RegisterView(View):
@@ -88,6 +93,12 @@ class RegisterView(View):
         return render(request, 'authentication/registration/register.html', {'form': form})
 
     def post(self, request):
+        # Throttle before the form hashes a password or an OTP is issued
+        limited = ratelimit.hit(request, 'email_verification', request.POST.get('email'))
+        if not limited.allowed:
+            messages.error(request, ratelimit.describe(limited))
+            return redirect('register')
+
         form = CustomUserCreationForm(request.POST)
         if form.is_valid():
             try:
@@ -104,28 +115,17 @@ class RegisterView(View):
                     user_agent=request.META.get('HTTP_USER_AGENT', '')
                 )
                 
-                # 3. Send OTP to user's email
-                subject = 'DataHub - Confirm Your Email'
-                html_message = render_to_string(
-                    'authentication/emails/register_otp.html', 
-                    {'user': user, 'otp_code': otp_code}
+                # 3. Queue the OTP email; a worker sends it after this transaction commits
+                queue_email(
+                    'register_otp',
+                    user.email,
+                    'DataHub - Confirm Your Email',
+                    template='authentication/emails/register_otp.html',
+                    context={'user': user, 'otp_code': otp_code, 'validity_minutes': otp_instance.validity_minutes},
                 )
-                plain_message = strip_tags(html_message)
-                from_email = settings.DEFAULT_FROM_EMAIL
-                to_email = user.email
-                
-                email = EmailMessage(
-                        subject=subject,
-                        body=plain_message,  # Plain text version
-                        from_email=from_email,
-                        to=[to_email],
-                        reply_to=[from_email],  # Optional: set reply-to
-                    )
-                email.attach_alternative(html_message, "text/html")
-                email.send(fail_silently=False)
 
                 # 4. Create an audit log entry
-                AuditLog.objects.create(
+                create_audit_log(
                     user=user,
                     action='user_created',
                     details={'message': 'User account created and verification OTP sent.'},
@@ -152,7 +152,7 @@ class RegisterView(View):
                 # Log the error for debugging
                 print(f"Registration Error: {e}")
                 messages.error(request, 'An unexpected error occurred during registration. Please try again later.')
-                AuditLog.objects.create(
+                create_audit_log(
                     user=None, # User creation failed
                     action='user_created_failed', # Make sure to add this to your AuditLog.ACTION_CHOICES
                     details={'message': f'Registration failed due to an error: {str(e)}'},
@@ -205,6 +205,11 @@ class CustomConfirmEmailView(View):
         if not email:
             messages.error(request, 'Invalid access. Please register again.')
             return redirect('register')
+
+        limited = ratelimit.hit(request, ratelimit.VERIFY, email)
+        if not limited.allowed:
+            messages.error(request, ratelimit.describe(limited))
+            return redirect(f"{reverse('confirm_email')}?email={email}")
         
         # Get the user
         user = CustomUser.get_by_email(email)
@@ -240,7 +245,7 @@ class CustomConfirmEmailView(View):
                         user.verify_email()  # This method updates email_verified, account_status, etc.
                         
                         # Create audit log
-                        AuditLog.objects.create(
+                        create_audit_log(
                             user=user,
                             action='email_verified',
                             details={
@@ -278,7 +283,7 @@ class CustomConfirmEmailView(View):
                         return self._render_form_with_resend_option(request, form, email, user)
                     
                     # Create audit log for failed verification
-                    AuditLog.objects.create(
+                    create_audit_log(
                         user=user,
                         action='otp_verification_failed',
                         details={
@@ -294,7 +299,7 @@ class CustomConfirmEmailView(View):
                 messages.error(request, 'An error occurred during verification. Please try again.')
                 
                 # Log the error
-                AuditLog.objects.create(
+                create_audit_log(
                     user=user,
                     action='email_verification_error',
                     details={
@@ -336,6 +341,11 @@ class ResendVerificationOTPView(View):
         if not email:
             messages.error(request, 'Email address is required.')
             return redirect('register')
+
+        limited = ratelimit.hit(request, 'email_verification', email)
+        if not limited.allowed:
+            messages.error(request, ratelimit.describe(limited))
+            return redirect(f"{reverse('confirm_email')}?email={email}")
         
         user = CustomUser.get_by_email(email)
         if not user:
@@ -355,32 +365,17 @@ class ResendVerificationOTPView(View):
                 user_agent=request.META.get('HTTP_USER_AGENT', '')
             )
             
-            # Send email (you'll need to import the necessary modules)
-            from django.core.mail import send_mail
-            from django.template.loader import render_to_string
-            from django.utils.html import strip_tags
-            from django.conf import settings
-            
-            subject = 'DataHub - Confirm Your Email (Resent)'
-            html_message = render_to_string(
-                'authentication/emails/register_otp.html',
-                {'user': user, 'otp_code': otp_code}
+            # Queue the email
+            queue_email(
+                'register_otp',
+                user.email,
+                'DataHub - Confirm Your Email (Resent)',
+                template='authentication/emails/register_otp.html',
+                context={'user': user, 'otp_code': otp_code, 'validity_minutes': otp_instance.validity_minutes},
             )
-            plain_message = strip_tags(html_message)
-            from_email = settings.DEFAULT_FROM_EMAIL
-            
-            email = EmailMessage(
-                        subject=subject,
-                        body=plain_message,  # Plain text version
-                        from_email=from_email,
-                        to=[to_email],
-                        reply_to=[from_email],  # Optional: set reply-to
-                    )
-            email.attach_alternative(html_message, "text/html")
-            email.send(fail_silently=False)
             
             # Create audit log
-            AuditLog.objects.create(
+            create_audit_log(
                 user=user,
                 action='otp_resent',
                 details={
@@ -397,7 +392,7 @@ class ResendVerificationOTPView(View):
             messages.error(request, 'Failed to resend verification code. Please try again later.')
             
             # Log the error
-            AuditLog.objects.create(
+            create_audit_log(
                 user=user,
                 action='otp_resend_failed',
                 details={
@@ -415,7 +410,7 @@ class CustomLogoutView(View):
     def get(self, request):
         if request.user.is_authenticated:   
              user = request.user
-             AuditLog.objects.create(
+             create_audit_log(
                 user=user,
                 action='user_logout',
                 details={
@@ -471,6 +466,11 @@ class CustomLoginView(View):
             if not email:
                 email = request.session.get('otp_sent_to_email')
 
+            limited = ratelimit.hit(request, 'login_verification', email)
+            if not limited.allowed:
+                messages.error(request, ratelimit.describe(limited))
+                return redirect(reverse('login'))
+
             email_form = EmailForm({'email': email})
 
             if email_form.is_valid():
@@ -490,39 +490,15 @@ class CustomLoginView(View):
                         user_agent=request.META.get('HTTP_USER_AGENT', '')
                     )
                     
-                    # Send OTP to user's email
-                    subject = 'DataHub - Your Login OTP'
-                    html_message = render_to_string(
-                        'authentication/emails/otp_login_email.html',
-                        {'user': user, 'otp_code': otp_code}
+                    # Queue the OTP email; delivery (and retrying) happens off the request
+                    queue_email(
+                        'login_otp',
+                        user.email,
+                        'DataHub - Your Login OTP',
+                        template='authentication/emails/otp_login_email.html',
+                        context={'user': user, 'otp_code': otp_code, 'validity_minutes': otp_instance.validity_minutes},
                     )
-                    plain_message = strip_tags(html_message)
-                    #send_mail(subject, plain_message, settings.DEFAULT_FROM_EMAIL, [user.email], html_message=html_message)
-                    try:
-                        subject = 'DataHub - Your Login OTP'
-                        html_message = render_to_string(
-                            'authentication/emails/otp_login_email.html',
-                            {'user': user, 'otp_code': otp_code}
-                        )
-                        plain_message = strip_tags(html_message)
-                        from_email = settings.DEFAULT_FROM_EMAIL
-                        
-                        # Create EmailMessage for SendGrid compatibility
-                        email_msg = EmailMessage(
-                            subject=subject,
-                            body=plain_message,  # Plain text version
-                            from_email=from_email,
-                            to=[user.email],
-                            reply_to=[from_email],
-                        )
-                         # Send via SendGrid
-                        email_msg.send(fail_silently=False)
-                        
-                        logger.info(f"Login OTP email sent successfully to {user.email}")
-                    except Exception as email_error:
-                        logger.error(f"Failed to send login OTP email to {user.email}: {str(email_error)}")
-                        
-                    
+
 
                     # Store email in session to verify OTP later
                     request.session['otp_sent_to_email'] = email
@@ -532,7 +508,7 @@ class CustomLoginView(View):
 
                 except CustomUser.DoesNotExist:
                     messages.error(request, 'No account found with this email.')
-                    AuditLog.objects.create(
+                    create_audit_log(
                         user=None,
                         action='login_failed_email',
                         details={'message': f"Attempted login with non-existent email: {email}"},
@@ -549,6 +525,11 @@ class CustomLoginView(View):
         elif 'verify_otp' in request.POST:
             otp_form = OTPForm(request.POST)
             email = request.session.get('otp_sent_to_email')
+
+            limited = ratelimit.hit(request, ratelimit.VERIFY, email)
+            if not limited.allowed:
+                messages.error(request, ratelimit.describe(limited))
+                return redirect(reverse('login'))
             
             if otp_form.is_valid() and email:
                 otp_code = otp_form.cleaned_data['otp']
@@ -565,7 +546,7 @@ class CustomLoginView(View):
                     # Check if OTP is valid and not expired
                     if latest_otp and latest_otp.verify_code(otp_code):
                         auth.login(request, user, backend='django.contrib.auth.backends.ModelBackend')
-                        AuditLog.objects.create(
+                        create_audit_log(
                             user=user,
                             action='login_successful',
                             details={'message': "User logged in with OTP."},
@@ -584,7 +565,7 @@ class CustomLoginView(View):
 
                     else:
                         messages.error(request, 'Invalid or expired OTP. Please try again.')
-                        AuditLog.objects.create(
+                        create_audit_log(
                             user=user,
                             action='login_failed_otp',
                             details={'message': "Invalid or expired OTP entered."},
@@ -603,6 +584,7 @@ class CustomLoginView(View):
     
 
 
+@method_decorator(replica_safe, name='dispatch')
 class UserProfileView(LoginRequiredMixin, View):
     def get(self, request):
         user = request.user
@@ -637,11 +619,12 @@ class UserProfileView(LoginRequiredMixin, View):
 
 
 
+@method_decorator(replica_safe, name='dispatch')
 class CustomerOrderHistory(LoginRequiredMixin, ListView):
     model = DataBundleOrder
     template_name = 'authentication/profiles/customer_order_history.html'
     context_object_name = 'orders'
-    paginate_by = 20  # Add pagination for better performance
+    page_size = 20  # keyset paginated in get_context_data
     
     def get_queryset(self):
         """Get orders for the current user with optimized queries"""
@@ -667,16 +650,22 @@ class CustomerOrderHistory(LoginRequiredMixin, ListView):
         try:
             customer = self.request.user
             orders = self.get_queryset()
+            total_orders_count = orders.count()
+            page_obj = CursorPaginator(orders, self.page_size, count=total_orders_count).page(
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'),
+            )
             
             # Basic order counts with safe defaults
             context.update({
                 'customer': customer,
-                'orders': orders,
-                'total_orders_count': orders.count() if orders.exists() else 0,
+                'orders': page_obj.object_list,
+                'page_obj': page_obj,
+                'total_orders_count': total_orders_count,
             })
             
             # Only calculate additional statistics if orders exist
-            if orders.exists():
+            if total_orders_count:
                 context.update(self._get_order_statistics(orders))
                 context.update(self._get_monthly_analysis(orders))
                 context.update(self._get_additional_analytics(orders))
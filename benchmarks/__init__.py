@@ -0,0 +1,10 @@
+"""
+Benchmarks for the purchase funnel.
+
+    python -m benchmarks.seed --dataset 10k
+    python -m benchmarks.run --dataset 10k --scenarios login,home,funnel
+
+Both commands use benchmarks.settings: a separate SQLite database per dataset
+(or the configured DATABASES with BENCH_DATABASE=default), eager Celery and
+in-process fake Paystack and DataMart servers. See benchmarks/README.md.
+"""
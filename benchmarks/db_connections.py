@@ -0,0 +1,92 @@
+"""
+Per-request database connection overhead.
+
+    BENCH_DATABASE=default python -m benchmarks.db_connections --requests 500
+
+Each simulated request does what Django does around a view: close stale
+connections when the request starts, run --queries small queries, and close
+or keep the connection when it finishes. The same loop runs with a new
+connection per request (CONN_MAX_AGE=0, the old production setting), with a
+persistent health-checked connection (DB_CONN_MAX_AGE), and, on PostgreSQL
+with psycopg_pool installed, with a connection pool (DB_POOL). Point
+BENCH_DATABASE=default at the production Postgres to see real connect costs;
+on the SQLite benchmark database, opening a file is nearly free.
+"""
+import argparse
+import copy
+import time
+
+from .run import percentile
+from .seed import configure
+
+
+def wrapper_for(mode):
+    """A standalone DatabaseWrapper for the default database, configured for `mode`."""
+    from django.conf import settings
+    from django.db import connections
+    from django.db.utils import load_backend
+
+    settings_dict = copy.deepcopy(connections.settings['default'])
+    options = settings_dict['OPTIONS']
+    options.pop('pool', None)
+    if mode == 'connect':
+        settings_dict.update(CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False)
+    elif mode == 'persistent':
+        settings_dict.update(CONN_MAX_AGE=settings.DB_CONN_MAX_AGE, CONN_HEALTH_CHECKS=True)
+    else:
+        settings_dict.update(CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False)
+        options['pool'] = settings.DB_POOL_OPTIONS['web']
+
+    backend = load_backend(settings_dict['ENGINE'])
+    return backend.DatabaseWrapper(settings_dict, alias=f'bench_{mode}')
+
+
+def measure(wrapper, requests, queries):
+    """Wall-clock milliseconds for each of `requests` simulated requests."""
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        wrapper.close_if_unusable_or_obsolete()
+        for _ in range(queries):
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+        wrapper.close_if_unusable_or_obsolete()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default='10k')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=5, help='queries per request')
+    args = parser.parse_args(argv)
+
+    configure(args.dataset)
+    from django.db import connection
+
+    modes = {'connect': 'new connection per request', 'persistent': 'persistent + health check'}
+    if connection.vendor == 'postgresql':
+        try:
+            import psycopg_pool  # noqa: F401
+            modes['pool'] = 'psycopg_pool'
+        except ImportError:
+            print("psycopg_pool is not installed; skipping the pool (pip install 'psycopg[pool]')")
+
+    print(f"{connection.vendor}, {args.requests} requests of {args.queries} queries")
+    print(f"{'mode':<28} {'p50 ms':>10} {'p99 ms':>10} {'mean ms':>10}")
+    for mode, label in modes.items():
+        wrapper = wrapper_for(mode)
+        try:
+            samples = measure(wrapper, args.requests, args.queries)
+        finally:
+            wrapper.close()
+            if mode == 'pool':
+                wrapper.close_pool()
+        mean = sum(samples) / len(samples)
+        print(f"{label:<28} {percentile(samples, 50):>10.3f} {percentile(samples, 99):>10.3f} {mean:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
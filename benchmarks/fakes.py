@@ -0,0 +1,147 @@
+"""
+In-process stand-ins for the Paystack and DataMart HTTP APIs.
+
+Each fake listens on a random localhost port and answers with the response
+shapes system.services and system.datamart_client expect. Latency is a base
+delay plus uniform jitter; error_rate is the fraction of requests answered
+with error_status instead.
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeService:
+    name = 'fake'
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, error_status=503, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.server = None
+        self.base_url = None
+
+    def start(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _dispatch(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                status, payload = service.respond(self.command, self.path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _dispatch
+            do_POST = _dispatch
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True, name=f'{self.name}-server').start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        return self.base_url
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def respond(self, method, path, body):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency_ms + self._random.uniform(0, self.jitter_ms)
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if delay:
+            time.sleep(delay / 1000)
+        if failed:
+            return self.error_status, {'status': False, 'message': 'Injected failure'}
+        return self.handle(method, path, body)
+
+    def handle(self, method, path, body):
+        raise NotImplementedError
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'latency_ms': self.latency_ms,
+            'jitter_ms': self.jitter_ms,
+            'error_rate': self.error_rate,
+        }
+
+
+class FakePaystack(FakeService):
+    name = 'paystack'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.transactions = {}
+
+    def handle(self, method, path, body):
+        if method == 'POST' and path == '/transaction/initialize':
+            reference = body.get('reference') or uuid.uuid4().hex
+            self.transactions[reference] = body.get('amount')
+            return 200, {
+                'status': True,
+                'message': 'Authorization URL created',
+                'data': {
+                    'authorization_url': f'{self.base_url}/checkout/{reference}',
+                    'access_code': uuid.uuid4().hex[:15],
+                    'reference': reference,
+                },
+            }
+        if method == 'GET' and path.startswith('/transaction/verify/'):
+            reference = path.rsplit('/', 1)[-1]
+            if reference not in self.transactions:
+                return 404, {'status': False, 'message': 'Transaction reference not found'}
+            return 200, {
+                'status': True,
+                'message': 'Verification successful',
+                'data': {'status': 'success', 'reference': reference, 'amount': self.transactions[reference]},
+            }
+        return 404, {'status': False, 'message': 'Not found'}
+
+
+class FakeDataMart(FakeService):
+    name = 'datamart'
+
+    def __init__(self, final_status='completed', **kwargs):
+        super().__init__(**kwargs)
+        self.final_status = final_status
+        self._sequence = 0
+
+    def handle(self, method, path, body):
+        if method == 'POST' and path.endswith('/purchase'):
+            with self._lock:
+                self._sequence += 1
+                reference = f'DM-BENCH-{self._sequence:08d}'
+            return 200, {
+                'status': 'success',
+                'data': {'orderReference': reference, 'orderStatus': 'pending'},
+            }
+        if method == 'GET' and '/order/' in path:
+            return 200, {
+                'status': 'success',
+                'data': {'apiResponse': {'data': {'status': self.final_status}}},
+            }
+        return 404, {'status': 'error', 'message': 'Not found'}
@@ -0,0 +1,54 @@
+"""
+CPU cost of the OTP hashing done for one login: hashing the issued code,
+then verifying the submitted one.
+
+    python -m benchmarks.otp_hashing --iterations 200
+
+Compares the make_password/check_password scheme OTPs used to be stored with
+(still accepted by verify_otp for codes issued before the switch) against the
+current keyed HMAC. Process CPU time is reported, so the numbers do not depend
+on database or email latency; use `benchmarks.run --scenarios login` for the
+end-to-end view.
+"""
+import argparse
+import time
+
+from .run import percentile
+from .seed import configure
+
+
+def measure(hash_fn, verify_fn, iterations):
+    """CPU milliseconds per login for each of `iterations` hash + verify rounds."""
+    from authentication.models import generate_secure_otp
+
+    samples = []
+    for _ in range(iterations):
+        code = generate_secure_otp()
+        started = time.process_time()
+        hashed = hash_fn(code)
+        assert verify_fn(code, hashed)
+        samples.append((time.process_time() - started) * 1000)
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    configure('10k')
+    from django.contrib.auth.hashers import check_password, make_password
+    from authentication.models import hash_otp, verify_otp
+
+    results = {
+        'make_password (before)': measure(make_password, check_password, args.iterations),
+        'hmac_sha256 (after)': measure(hash_otp, verify_otp, args.iterations),
+    }
+    print(f"{'scheme':<24} {'p50 ms':>10} {'p99 ms':>10} {'mean ms':>10}")
+    for name, samples in results.items():
+        mean = sum(samples) / len(samples)
+        print(f"{name:<24} {percentile(samples, 50):>10.3f} {percentile(samples, 99):>10.3f} {mean:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
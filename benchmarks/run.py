@@ -0,0 +1,223 @@
+"""
+Run benchmark scenarios against a seeded dataset.
+
+    python -m benchmarks.run --dataset 10k --scenarios login,home,funnel \\
+        --iterations 200 --paystack-latency-ms 150 --datamart-latency-ms 250
+
+Results are printed and written to benchmarks/results/<dataset>-<commit>-<time>.json.
+Pass --compare <older result.json> to print the change per step.
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+from .seed import configure
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(samples, errors):
+    latencies = [latency for latency, _ in samples]
+    queries = [count for _, count in samples]
+    return {
+        'count': len(samples),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'max_ms': round(max(latencies), 2),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True, check=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, dirty
+
+
+def run_scenario(scenario_class, context, iterations, warmup, concurrency):
+    from django.db import connections
+    from .scenarios import Recorder, StepFailed
+
+    recorder = Recorder()
+    warmup_recorder = Recorder()
+    warmup_recorder.enabled = False
+    failures = []
+
+    def worker(index, count, target):
+        scenario = scenario_class(context, index)
+        try:
+            for _ in range(count):
+                try:
+                    scenario.run_once(target)
+                except StepFailed as e:
+                    if target.enabled:
+                        failures.append(str(e))
+        finally:
+            connections.close_all()
+
+    worker(0, warmup, warmup_recorder)
+
+    per_worker = [iterations // concurrency + (1 if i < iterations % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker, i, count, recorder) for i, count in enumerate(per_worker)]:
+            future.result()
+    wall_s = time.perf_counter() - started
+
+    return {
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'wall_s': round(wall_s, 3),
+        'iterations_per_s': round(iterations / wall_s, 2) if wall_s else None,
+        'requests_per_s': round(sum(len(s) for s in recorder.samples.values()) / wall_s, 2) if wall_s else None,
+        'failures': failures[:10],
+        'failed_iterations': len(failures),
+        'steps': {
+            name: summarize(samples, recorder.errors.get(name, 0))
+            for name, samples in recorder.samples.items()
+        },
+    }
+
+
+def print_result(result, stream=sys.stdout):
+    stream.write(f"\ncommit {result['commit'][:12]}{' (dirty)' if result['dirty'] else ''}  dataset {result['dataset']}  "
+                 f"db {result['database']}\n")
+    header = f"{'step':<22}{'n':>7}{'err':>6}{'p50 ms':>10}{'p99 ms':>10}{'queries':>9}"
+    for name, scenario in result['scenarios'].items():
+        stream.write(f"\n{name}: {scenario['requests_per_s']} req/s, {scenario['iterations_per_s']} iterations/s "
+                     f"(concurrency {scenario['concurrency']})\n{header}\n")
+        for step, stats in scenario['steps'].items():
+            stream.write(f"{step:<22}{stats['count']:>7}{stats['errors']:>6}{stats['p50_ms']:>10.2f}"
+                         f"{stats['p99_ms']:>10.2f}{stats['queries_mean']:>9.1f}\n")
+        if scenario.get('failed_iterations'):
+            stream.write(f"{scenario['failed_iterations']} of {scenario['iterations']} iterations failed, e.g. "
+                         f"{scenario['failures'][0]}\n")
+
+
+def print_comparison(baseline, result, stream=sys.stdout):
+    stream.write(f"\nchange vs {baseline['commit'][:12]} ({baseline['dataset']})\n")
+    stream.write(f"{'step':<22}{'p50':>16}{'p99':>16}{'queries':>14}\n")
+    for name, scenario in result['scenarios'].items():
+        old_steps = baseline['scenarios'].get(name, {}).get('steps', {})
+        for step, stats in scenario['steps'].items():
+            old = old_steps.get(step)
+            if old is None:
+                continue
+
+            def delta(key, fmt):
+                change = stats[key] - old[key]
+                pct = f" ({change / old[key] * 100:+.0f}%)" if old[key] else ''
+                return f"{change:{fmt}}{pct}"
+
+            stream.write(f"{step:<22}{delta('p50_ms', '+.1f'):>16}{delta('p99_ms', '+.1f'):>16}"
+                         f"{delta('queries_mean', '+.1f'):>14}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default='10k')
+    parser.add_argument('--scenarios', default='login,home,agent_home,funnel')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='worker threads; use BENCH_DATABASE=default (PostgreSQL) for more than 1')
+    parser.add_argument('--paystack-latency-ms', type=float, default=0)
+    parser.add_argument('--datamart-latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--paystack-error-rate', type=float, default=0.0)
+    parser.add_argument('--datamart-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='result file; defaults to benchmarks/results/')
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    args = parser.parse_args(argv)
+
+    configure(args.dataset)
+
+    from django.conf import settings
+    from django.db import connection
+    from authentication.models import Bundle
+    from .fakes import FakeDataMart, FakePaystack
+    from .scenarios import SCENARIOS
+    from .seed import create_bench_users
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (available: {', '.join(SCENARIOS)})")
+
+    if not Bundle.objects.exists():
+        parser.error(f"dataset '{args.dataset}' is empty; run python -m benchmarks.seed --dataset {args.dataset} first")
+
+    paystack = FakePaystack(latency_ms=args.paystack_latency_ms, jitter_ms=args.jitter_ms,
+                            error_rate=args.paystack_error_rate, seed=args.seed)
+    datamart = FakeDataMart(latency_ms=args.datamart_latency_ms, jitter_ms=args.jitter_ms,
+                            error_rate=args.datamart_error_rate, seed=args.seed)
+    settings.PAYSTACK_API_BASE_URL = paystack.start()
+    settings.DATAMART_API_BASE_URL = datamart.start()
+
+    context = {
+        'users': create_bench_users(),
+        'customer_bundles': list(Bundle.objects.filter(is_agent_bundle=False, is_active=True)),
+        'rng': random.Random(args.seed),
+    }
+
+    commit, dirty = git_revision()
+    result = {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.now(dt_timezone.utc).isoformat(),
+        'dataset': args.dataset,
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'scenarios': {},
+    }
+    try:
+        for name in names:
+            result['scenarios'][name] = run_scenario(
+                SCENARIOS[name], context, args.iterations, args.warmup, args.concurrency
+            )
+    finally:
+        paystack.stop()
+        datamart.stop()
+    result['fakes'] = {'paystack': paystack.stats(), 'datamart': datamart.stats()}
+
+    print_result(result)
+
+    output = args.output
+    if output is None:
+        settings.BENCH_RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(dt_timezone.utc).strftime('%Y%m%dT%H%M%S')
+        output = settings.BENCH_RESULTS_DIR / f"{args.dataset}-{commit[:12]}-{stamp}.json"
+    with open(output, 'w') as handle:
+        json.dump(result, handle, indent=2)
+    sys.stdout.write(f"\nResults written to {output}\n")
+
+    if args.compare:
+        with open(args.compare) as handle:
+            print_comparison(json.load(handle), result)
+
+
+if __name__ == '__main__':
+    main()
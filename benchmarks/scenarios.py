@@ -0,0 +1,188 @@
+"""
+Benchmark scenarios.
+
+A scenario runs one iteration of a user journey with a django.test.Client,
+timing each HTTP step through Recorder.step(). Steps are timed in-process
+(URL resolution, middleware, view, template, database and the fake provider
+calls), without a network hop to the app itself.
+"""
+import hashlib
+import hmac
+import json
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core import mail
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .seed import BENCH_AGENT_EMAIL, BENCH_CUSTOMER_EMAIL
+
+OTP_RE = re.compile(r'\b(\d{6})\b')
+
+_outbox_lock = threading.Lock()
+
+
+class StepFailed(Exception):
+    pass
+
+
+class Recorder:
+    """Collects latency and query counts per step name."""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+        self.enabled = True
+
+    def step(self, name, func, ok=None):
+        ok = ok or (lambda response: response.status_code < 400)
+        started = time.perf_counter()
+        error = None
+        with CaptureQueriesContext(connection) as queries:
+            try:
+                response = func()
+            except Exception as e:
+                response, error = None, e
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        failed = error is not None or not ok(response)
+        if self.enabled:
+            with self._lock:
+                self.samples.setdefault(name, []).append((elapsed_ms, len(queries)))
+                if failed:
+                    self.errors[name] = self.errors.get(name, 0) + 1
+        if failed:
+            raise StepFailed(f"{name} failed: {error or response.status_code}")
+        return response
+
+    def fail(self, name, reason):
+        """Count a failure found after step `name` returned (e.g. no OTP email) and stop the iteration."""
+        if self.enabled:
+            with self._lock:
+                self.errors[name] = self.errors.get(name, 0) + 1
+        raise StepFailed(f"{name} failed: {reason}")
+
+
+def _take_otp(email):
+    """Pop the newest OTP email sent to `email` from the locmem outbox."""
+    with _outbox_lock:
+        for index in range(len(mail.outbox) - 1, -1, -1):
+            message = mail.outbox[index]
+            if email in message.to:
+                del mail.outbox[index]
+                match = OTP_RE.search(message.body)
+                return match.group(1) if match else None
+    return None
+
+
+def _signed_webhook(client, reference, amount):
+    body = json.dumps({
+        'event': 'charge.success',
+        'data': {'reference': reference, 'amount': amount, 'paid_at': timezone.now().isoformat()},
+    }).encode()
+    signature = hmac.new(settings.TEST_SECRET_KEY.encode(), body, hashlib.sha512).hexdigest()
+    return client.post(
+        reverse('paystack_webhook'), body, content_type='application/json',
+        HTTP_X_PAYSTACK_SIGNATURE=signature,
+    )
+
+
+class Scenario:
+    name = None
+
+    def __init__(self, context, worker):
+        self.context = context
+        self.worker = worker
+        self.client = Client()
+
+    def run_once(self, recorder):
+        raise NotImplementedError
+
+
+class LoginScenario(Scenario):
+    """CustomLoginView: request an OTP by email, then verify it."""
+    name = 'login'
+
+    def __init__(self, context, worker):
+        super().__init__(context, worker)
+        # One account per worker so concurrent workers do not invalidate each other's OTPs
+        self.email = BENCH_CUSTOMER_EMAIL if worker == 0 else f'customer{worker}@bench.datahub.test'
+
+    def run_once(self, recorder):
+        self.client = Client()
+        url = reverse('login')
+        recorder.step('login.request_otp', lambda: self.client.post(url, {'request_otp': '1', 'email': self.email}))
+        code = _take_otp(self.email)
+        if code is None:
+            recorder.fail('login.request_otp', f"no OTP email for {self.email}")
+        recorder.step(
+            'login.verify_otp',
+            lambda: self.client.post(url, {'verify_otp': '1', 'otp': code}),
+            ok=lambda response: response.status_code < 400 and '_auth_user_id' in self.client.session,
+        )
+
+
+class HomeScenario(Scenario):
+    """TestHomeView for a logged-in customer."""
+    name = 'home'
+
+    def __init__(self, context, worker):
+        super().__init__(context, worker)
+        self.client.force_login(context['users']['customer'])
+
+    def run_once(self, recorder):
+        recorder.step('home', lambda: self.client.get(reverse('home')))
+
+
+class AgentHomeScenario(Scenario):
+    """AgentHomeView for a logged-in agent."""
+    name = 'agent_home'
+
+    def __init__(self, context, worker):
+        super().__init__(context, worker)
+        self.client.force_login(context['users']['agent'])
+
+    def run_once(self, recorder):
+        recorder.step('agent_home', lambda: self.client.get(reverse('agent_home_page')))
+
+
+class FunnelScenario(Scenario):
+    """
+    Home page, PaymentView.post against the fake Paystack, the signed
+    charge.success webhook (which fulfils the order and calls the fake
+    DataMart, Celery being eager) and the Paystack redirect back.
+    """
+    name = 'funnel'
+
+    def __init__(self, context, worker):
+        super().__init__(context, worker)
+        self.client.force_login(context['users']['customer'])
+        self.bundles = context['customer_bundles']
+
+    def run_once(self, recorder):
+        bundle = self.bundles[self.context['rng'].randrange(len(self.bundles))]
+
+        recorder.step('funnel.home', lambda: self.client.get(reverse('home')))
+        response = recorder.step(
+            'funnel.checkout',
+            lambda: self.client.post(reverse('payment_initiate'), {'bundle_id': bundle.id, 'phone_number': '0241234567'}),
+            ok=lambda response: response.status_code == 200 and response.json().get('status') == 'success',
+        )
+        reference = response.json()['reference']
+
+        recorder.step('funnel.webhook', lambda: _signed_webhook(self.client, reference, int(bundle.price * 100)))
+        recorder.step(
+            'funnel.callback',
+            lambda: self.client.get(reverse('payment_callback'), {'reference': reference}),
+            ok=lambda response: response.status_code == 302 and 'payment_status=failed' not in response['Location'],
+        )
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (LoginScenario, HomeScenario, AgentHomeScenario, FunnelScenario)}
@@ -0,0 +1,244 @@
+"""
+Seed a benchmark database.
+
+    python -m benchmarks.seed --dataset 10k     # 10,000 orders
+    python -m benchmarks.seed --dataset 1m      # 1,000,000 orders
+
+Bundles come from seed_data.json; the telcos it references are created here
+since the fixture does not include them. Orders, payments and customers are
+generated deterministically (fixed random seed, sequential ids) and spread
+over the last ORDER_HISTORY_DAYS days, so two databases seeded with the same
+dataset hold the same rows.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+DATASETS = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+ORDER_HISTORY_DAYS = 90
+ORDERS_PER_CUSTOMER = 20
+BATCH_SIZE = 5000
+RANDOM_SEED = 20250812
+
+BENCH_PASSWORD = 'bench-password'
+BENCH_CUSTOMER_EMAIL = 'bench.customer@datahub.test'
+BENCH_AGENT_EMAIL = 'bench.agent@datahub.test'
+BENCH_ADMIN_EMAIL = 'bench.admin@datahub.test'
+
+# seed_data.json bundles reference these telcos by id
+SEED_TELCOS = {
+    'mtnup2u': ('MTN', 'YELLO'),
+    'telecel': ('Telecel', 'TELECEL'),
+    'atishare': ('AirtelTigo', 'AT_PREMIUM'),
+}
+
+# (order status, payment status, share of orders)
+ORDER_MIX = [
+    ('completed', 'success', 0.80),
+    ('pending', 'pending', 0.10),
+    ('failed', 'failed', 0.07),
+    ('processing', 'success', 0.03),
+]
+
+
+def dataset_size(name):
+    if name.lower() in DATASETS:
+        return DATASETS[name.lower()]
+    return int(name)
+
+
+def configure(dataset):
+    """Point Django at the benchmark settings and database for a dataset."""
+    os.environ['BENCH_DATASET'] = dataset
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+
+
+def load_catalog():
+    """Create the seed_data.json telcos and bundles if they are missing."""
+    from django.conf import settings
+    from authentication.models import Bundle, Telco
+
+    with open(settings.BASE_DIR / 'seed_data.json', encoding='utf-16') as fixture:
+        rows = [row for row in json.load(fixture) if row['model'] == 'authentication.bundle']
+
+    telcos = {}
+    for row in rows:
+        fields = row['fields']
+        if fields['telco'] in telcos:
+            continue
+        name, code = SEED_TELCOS[fields['name']]
+        telcos[fields['telco']], _ = Telco.objects.get_or_create(
+            id=fields['telco'], defaults={'name': name, 'code': code}
+        )
+
+    Bundle.objects.bulk_create(
+        [
+            Bundle(
+                id=row['pk'],
+                telco=telcos[row['fields']['telco']],
+                name=row['fields']['name'],
+                size_mb=row['fields']['size_mb'],
+                price=Decimal(row['fields']['price']),
+                is_agent_bundle=row['fields']['is_agent_bundle'],
+                is_instock=row['fields']['is_instock'],
+                is_out_of_stock=row['fields']['is_out_of_stock'],
+                is_limited=row['fields']['is_limited'],
+                is_active=row['fields']['is_active'],
+            )
+            for row in rows
+        ],
+        ignore_conflicts=True,
+    )
+    return list(Bundle.objects.select_related('telco').order_by('id'))
+
+
+def create_bench_users():
+    """Accounts the scenarios log in as."""
+    from authentication.models import CustomUser
+
+    accounts = [
+        (BENCH_CUSTOMER_EMAIL, 'customer', '0200000001'),
+        (BENCH_AGENT_EMAIL, 'agent', '0200000002'),
+        (BENCH_ADMIN_EMAIL, 'admin', '0200000003'),
+    ]
+    users = {}
+    for email, role, phone in accounts:
+        user = CustomUser.objects.filter(email=email).first()
+        if user is None:
+            user = CustomUser.objects.create_user(
+                email=email,
+                password=BENCH_PASSWORD,
+                full_name=f'Bench {role.title()}',
+                phone_number=phone,
+                role=role,
+                account_status='active',
+                email_verified=True,
+                is_staff=(role == 'admin'),
+            )
+        users[role] = user
+    return users
+
+
+def _pick_status(rng):
+    roll = rng.random()
+    for order_status, payment_status, share in ORDER_MIX:
+        if roll < share:
+            return order_status, payment_status
+        roll -= share
+    return ORDER_MIX[0][:2]
+
+
+def seed_orders(total, bundles, stdout=sys.stdout):
+    """Bulk-insert customers, orders and payments until there are `total` seeded orders."""
+    from django.contrib.auth.hashers import make_password
+    from django.db import transaction
+    from django.utils import timezone
+    from authentication.models import CustomUser, DataBundleOrder, Payment
+
+    # A range rather than startswith: SQLite's LIKE would also match live ids like 'ORD-b1...'
+    existing = DataBundleOrder.objects.filter(id__gte='ORD-B', id__lt='ORD-C').count()
+    if existing >= total:
+        stdout.write(f"Dataset already has {existing} seeded orders\n")
+        return 0
+
+    rng = random.Random(RANDOM_SEED)
+    customer_count = max(1, total // ORDERS_PER_CUSTOMER)
+    unusable = make_password(None)
+
+    with transaction.atomic():
+        CustomUser.objects.bulk_create(
+            [
+                CustomUser(
+                    id=f'USR-B{i:09d}',
+                    email=f'customer{i}@bench.datahub.test',
+                    full_name=f'Bench Customer {i}',
+                    phone_number=f'05{i:08d}',
+                    password=unusable,
+                    role='agent' if i % 25 == 0 else 'customer',
+                    account_status='active',
+                    email_verified=True,
+                )
+                for i in range(customer_count)
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    now = timezone.now()
+    started = time.monotonic()
+    per_day = total / ORDER_HISTORY_DAYS
+    for start in range(existing, total, BATCH_SIZE):
+        stop = min(start + BATCH_SIZE, total)
+        orders, payments, created = [], [], {}
+        for i in range(start, stop):
+            bundle = bundles[rng.randrange(len(bundles))]
+            order_status, payment_status = _pick_status(rng)
+            order = DataBundleOrder(
+                id=f'ORD-B{i:09d}',
+                user_id=f'USR-B{rng.randrange(customer_count):09d}',
+                telco_id=bundle.telco_id,
+                bundle=bundle,
+                phone_number=f'024{rng.randrange(10 ** 7):07d}',
+                status=order_status,
+                provider_order_id=f'DM-SEED-{i:09d}' if order_status == 'completed' else None,
+                provider_status='completed' if order_status == 'completed' else None,
+            )
+            orders.append(order)
+            payments.append(Payment(
+                id=f'PAY-B{i:09d}',
+                order=order,
+                amount=bundle.price,
+                reference=str(uuid.UUID(int=rng.getrandbits(128))),
+                status=payment_status,
+            ))
+            # Oldest first, so order ids follow creation time like real traffic
+            created[order.id] = now - timedelta(days=ORDER_HISTORY_DAYS) + timedelta(days=i / per_day)
+
+        with transaction.atomic():
+            DataBundleOrder.objects.bulk_create(orders)
+            Payment.objects.bulk_create(payments)
+            # auto_now_add ignores explicit values, so backdate in one UPDATE per day
+            by_day = {}
+            for order_id, created_at in created.items():
+                by_day.setdefault(created_at.replace(hour=12, minute=0, second=0, microsecond=0), []).append(order_id)
+            for created_at, ids in by_day.items():
+                DataBundleOrder.objects.filter(id__in=ids).update(created_at=created_at, updated_at=created_at)
+                Payment.objects.filter(order_id__in=ids).update(created_at=created_at, updated_at=created_at)
+
+        stdout.write(f"  {stop}/{total} orders ({time.monotonic() - started:.1f}s)\n")
+    return total - existing
+
+
+def seed(dataset, stdout=sys.stdout):
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+    bundles = load_catalog()
+    create_bench_users()
+    created = seed_orders(dataset_size(dataset), bundles, stdout=stdout)
+    # Bulk inserts bypass the signals that maintain the dashboard rollups
+    from management.rollups import reconcile
+    reconcile()
+    stdout.write(f"Seeded {created} orders into dataset '{dataset}'\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default='10k', help=f"one of {', '.join(DATASETS)} or an order count")
+    args = parser.parse_args(argv)
+
+    configure(args.dataset)
+    seed(args.dataset)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Settings for the benchmark harness, layered over the project settings."""
+import os
+
+from DataHub.settings import *  # noqa: F401,F403
+from DataHub.settings import BASE_DIR, SECRET_KEY
+
+BENCH_DATA_DIR = BASE_DIR / 'benchmarks' / '.data'
+BENCH_RESULTS_DIR = BASE_DIR / 'benchmarks' / 'results'
+BENCH_DATASET = os.environ.get("BENCH_DATASET", "10k")
+
+# Keep benchmark data out of the development database unless asked otherwise
+if os.environ.get("BENCH_DATABASE") != "default":
+    BENCH_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BENCH_DATA_DIR / f'bench-{BENCH_DATASET}.sqlite3',
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+        }
+    }
+
+SECRET_KEY = SECRET_KEY or 'bench-insecure-secret-key'
+DEBUG = False
+ALLOWED_HOSTS = ['testserver', 'localhost', '127.0.0.1']
+
+# Run fulfilment inline so a webhook request covers the whole provider round trip
+CELERY_TASK_ALWAYS_EAGER = True
+CELERY_TASK_EAGER_PROPAGATES = False
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+# Every simulated login comes from one client address and would exhaust its OTP budget
+OTP_RATE_LIMIT_ENABLED = False
+
+TEST_SECRET_KEY = os.environ.get("TEST_SECRET_KEY") or 'sk_bench_secret'
+TEST_PUBLIC_KEY = os.environ.get("TEST_PUBLIC_KEY") or 'pk_bench_public'
+DATAMART_API_KEY = os.environ.get("DATAMART_API_KEY") or 'bench-datamart-key'
+
+# Overwritten at runtime with the fake servers' addresses
+PAYSTACK_API_BASE_URL = 'http://127.0.0.1:9'
+DATAMART_API_BASE_URL = 'http://127.0.0.1:9'
+
+# The fakes inject errors on purpose; let them surface instead of being retried away
+DATAMART_MAX_RETRIES = int(os.environ.get("DATAMART_MAX_RETRIES", 0))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'root': {'level': 'WARNING'},
+}
@@ -0,0 +1,144 @@
+"""
+Data consistency checks for the admin dashboard.
+
+Each check is declared once with register(): the model it inspects, a filter
+that matches offending rows and a message. run_health_checks() evaluates all
+checks on a model in a single aggregate query whose WHERE clause is the OR of
+the check filters, so each filter should be selective and backed by an index.
+Failing checks then fetch a sample of offending primary keys. The report is
+saved as the single HealthReport row and cached; the dashboard reads the
+cache, falling back to the row in processes whose cache the worker cannot
+reach, and management.tasks.run_system_health_checks refreshes both on a
+schedule.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from authentication.models import CustomUser, DataBundleOrder, Payment
+
+from .models import HealthReport
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CHECK_RESULTS_KEY = 'health_checks:results'
+
+
+@dataclass(frozen=True)
+class HealthCheck:
+    name: str
+    model: type
+    predicate: object  # a Q, or a callable returning one when it depends on the current time
+    message: str  # formatted with {count}
+    severity: str = 'error'
+
+    def get_predicate(self):
+        return self.predicate() if callable(self.predicate) else self.predicate
+
+
+_registry = {}
+
+
+def register(name, model, predicate, message, severity='error'):
+    _registry[name] = HealthCheck(name, model, predicate, message, severity)
+    return _registry[name]
+
+
+def get_checks():
+    return list(_registry.values())
+
+
+register(
+    'orders_without_payment',
+    DataBundleOrder,
+    Q(status__in=['pending', 'processing'], payment__isnull=True),
+    "⚠️ {count} pending/processing orders have no associated payment record.",
+    severity='warning',
+)
+register(
+    'completed_orders_with_failed_payment',
+    Payment,
+    Q(status='failed', order__status='completed'),
+    "🚨 {count} completed orders have failed payment statuses. This indicates a data inconsistency.",
+)
+register(
+    'active_users_unverified',
+    CustomUser,
+    Q(account_status='active', email_verified=False),
+    "🚨 {count} users are marked 'active' but their email is not verified.",
+)
+register(
+    'paid_orders_not_fulfilled',
+    DataBundleOrder,
+    lambda: Q(
+        status='pending',
+        payment__status='success',
+        payment__paid_at__lt=timezone.now() - timedelta(minutes=settings.HEALTH_CHECK_FULFILMENT_GRACE_MINUTES),
+    ),
+    "⚠️ {count} paid orders are still pending fulfilment.",
+    severity='warning',
+)
+
+
+def run_health_checks(checks=None, sample_size=None):
+    """Evaluate the checks, cache the outcome and return it."""
+    checks = checks if checks is not None else get_checks()
+    sample_size = sample_size or settings.HEALTH_CHECK_SAMPLE_SIZE
+    started = time.monotonic()
+
+    by_model = {}
+    for check in checks:
+        by_model.setdefault(check.model, []).append((check, check.get_predicate()))
+
+    results = []
+    for model, model_checks in by_model.items():
+        combined = reduce(or_, (predicate for _, predicate in model_checks))
+        counts = model.objects.filter(combined).aggregate(**{
+            check.name: Count('pk', filter=predicate) for check, predicate in model_checks
+        })
+        for check, predicate in model_checks:
+            count = counts[check.name] or 0
+            sample_ids = []
+            if count:
+                sample_ids = list(model.objects.filter(predicate).values_list('pk', flat=True)[:sample_size])
+            results.append({
+                'name': check.name,
+                'model': model._meta.label,
+                'severity': check.severity,
+                'count': count,
+                'sample_ids': sample_ids,
+                'message': check.message.format(count=count) if count else '',
+            })
+
+    report = {
+        'checked_at': timezone.now(),
+        'duration_ms': round((time.monotonic() - started) * 1000, 1),
+        'results': results,
+    }
+    HealthReport.objects.update_or_create(pk=1, defaults=report)
+    cache.set(HEALTH_CHECK_RESULTS_KEY, report, None)
+
+    failing = [result['name'] for result in results if result['count']]
+    logger.info(f"Health checks finished in {report['duration_ms']}ms; failing: {', '.join(failing) or 'none'}")
+    return report
+
+
+def get_health_report():
+    """The last report, or None if the checks have not run yet."""
+    report = cache.get(HEALTH_CHECK_RESULTS_KEY)
+    if report is None:
+        row = HealthReport.objects.filter(pk=1).first()
+        if row is None:
+            return None
+        report = {'checked_at': row.checked_at, 'duration_ms': row.duration_ms, 'results': row.results}
+        # Until the next run refreshes it; a per-process cache would otherwise keep an old report forever
+        cache.set(HEALTH_CHECK_RESULTS_KEY, report, settings.HEALTH_REPORT_CACHE_TIMEOUT)
+    return report
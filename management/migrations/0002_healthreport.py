@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HealthReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checked_at', models.DateTimeField()),
+                ('duration_ms', models.FloatField()),
+                ('results', models.JSONField(default=list)),
+            ],
+        ),
+    ]
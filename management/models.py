@@ -1,3 +1,50 @@
 from django.db import models
 
-# Create your models here.
+
+class MetricRollup(models.Model):
+    """
+    Pre-aggregated counts for the admin dashboards.
+
+    Each row counts the records of one kind (metric) that were created in one
+    hour or day (bucket) and are currently in one state (dimension), so summing
+    a metric over all buckets gives today's totals. Rows are kept up to date
+    from model signals by management.rollups and recomputed nightly.
+    """
+
+    PERIOD_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    metric = models.CharField(max_length=30)
+    dimension = models.CharField(max_length=100, blank=True, default='')
+    count = models.BigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'metric', 'dimension'], name='unique_metric_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['metric', 'period', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.metric}[{self.dimension}] {self.period} {self.bucket:%Y-%m-%d %H:%M}: {self.count}"
+
+
+class HealthReport(models.Model):
+    """
+    The last report of management.health_checks, stored as a single row so
+    web processes see what the beat worker found even without a shared cache.
+    """
+
+    checked_at = models.DateTimeField()
+    duration_ms = models.FloatField()
+    results = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"Health report {self.checked_at:%Y-%m-%d %H:%M}"
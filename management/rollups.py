@@ -0,0 +1,230 @@
+"""
+Incrementally maintained dashboard metrics.
+
+Orders, payments, users and OTPs are counted per creation hour and day and
+per state (the spec's dimension fields), in MetricRollup. Saves and deletes
+move a record's count from its old state to its new one through
+record_change(); bulk queryset.update() calls bypass signals, so the admin
+bulk actions ask for a reconcile of the days they touched, and a nightly task
+recomputes the most recent days from the source tables.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from authentication.models import OTP, CustomUser, DataBundleOrder, Payment
+from .models import MetricRollup
+
+logger = logging.getLogger(__name__)
+
+HOUR = 'hour'
+DAY = 'day'
+PERIODS = (HOUR, DAY)
+
+
+@dataclass(frozen=True)
+class RollupSpec:
+    metric: str
+    model: type
+    fields: tuple
+    amount_field: str = None
+
+    def dimension(self, values):
+        return '|'.join(str(values[field]) for field in self.fields)
+
+
+SPECS = (
+    RollupSpec('orders', DataBundleOrder, ('status', 'telco_id')),
+    RollupSpec('payments', Payment, ('status',), amount_field='amount'),
+    RollupSpec('users', CustomUser, ('role', 'account_status', 'email_verified')),
+    RollupSpec('otps', OTP, ('otp_type', 'status')),
+)
+SPECS_BY_MODEL = {spec.model: spec for spec in SPECS}
+
+
+def bucket_start(value, period):
+    value = timezone.localtime(value)
+    if period == DAY:
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _apply(period, bucket, metric, dimension, count, amount):
+    lookup = {'period': period, 'bucket': bucket, 'metric': metric, 'dimension': dimension}
+    increment = {'count': F('count') + count, 'amount': F('amount') + amount, 'updated_at': timezone.now()}
+    if MetricRollup.objects.filter(**lookup).update(**increment):
+        return
+    try:
+        with transaction.atomic():
+            MetricRollup.objects.create(count=count, amount=amount, **lookup)
+    except IntegrityError:
+        # Another writer created the row first
+        MetricRollup.objects.filter(**lookup).update(**increment)
+
+
+def record_change(instance, created=False, deleted=False, update_fields=None):
+    """Move `instance` between rollup rows after a save or delete."""
+    spec = SPECS_BY_MODEL.get(type(instance))
+    if spec is None or instance.created_at is None:
+        return
+
+    watched = spec.fields + ((spec.amount_field,) if spec.amount_field else ())
+    current = {field: getattr(instance, field) for field in watched}
+
+    if deleted:
+        old, new = current, None
+    elif created:
+        old, new = None, current
+    else:
+        changes = instance.get_field_changes(update_fields)
+        old = dict(current)
+        for name, (old_value, _) in changes.items():
+            attname = instance._meta.get_field(name).attname
+            if attname in old:
+                old[attname] = old_value
+        if old == current:
+            return
+        new = current
+
+    deltas = {}
+    for values, sign in ((old, -1), (new, 1)):
+        if values is None:
+            continue
+        dimension = spec.dimension(values)
+        amount = values[spec.amount_field] if spec.amount_field else 0
+        count_delta, amount_delta = deltas.get(dimension, (0, 0))
+        deltas[dimension] = (count_delta + sign, amount_delta + sign * amount)
+
+    try:
+        with transaction.atomic():
+            for period in PERIODS:
+                bucket = bucket_start(instance.created_at, period)
+                for dimension, (count, amount) in deltas.items():
+                    if count or amount:
+                        _apply(period, bucket, spec.metric, dimension, count, amount)
+    except DatabaseError as e:
+        # The nightly reconcile repairs whatever was missed here
+        logger.error(f"Failed to update {spec.metric} rollup for {instance.pk}: {str(e)}")
+
+
+def _source_rows(spec, period, start, end):
+    trunc = TruncDay if period == DAY else TruncHour
+    queryset = spec.model.objects.all()
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=start)
+    if end is not None:
+        queryset = queryset.filter(created_at__lt=end)
+
+    aggregates = {'count': Count('pk')}
+    if spec.amount_field:
+        aggregates['amount'] = Sum(spec.amount_field)
+    rows = queryset.annotate(bucket=trunc('created_at')).values('bucket', *spec.fields).annotate(**aggregates)
+
+    for row in rows:
+        yield MetricRollup(
+            period=period,
+            bucket=row['bucket'],
+            metric=spec.metric,
+            dimension=spec.dimension(row),
+            count=row['count'],
+            amount=row.get('amount') or 0,
+        )
+
+
+def reconcile(start=None, end=None):
+    """
+    Recompute the rollups for records created in [start, end) from the source
+    tables, replacing what is stored. With no start, everything is rebuilt.
+    """
+    if start is not None:
+        start = bucket_start(start, DAY)
+    if end is not None:
+        end = bucket_start(end, DAY)
+
+    with transaction.atomic():
+        stale = MetricRollup.objects.filter(metric__in=[spec.metric for spec in SPECS])
+        if start is not None:
+            stale = stale.filter(bucket__gte=start)
+        if end is not None:
+            stale = stale.filter(bucket__lt=end)
+        stale.delete()
+
+        rows = [row for spec in SPECS for period in PERIODS for row in _source_rows(spec, period, start, end)]
+        MetricRollup.objects.bulk_create(rows, batch_size=1000)
+
+    logger.info(f"Reconciled {len(rows)} metric rollup rows from {start or 'the beginning'} to {end or 'now'}")
+    return len(rows)
+
+
+def reconcile_dates(dates):
+    """Reconcile whole days, e.g. the ones an admin bulk action touched."""
+    total = 0
+    for day in sorted(set(dates)):
+        start = timezone.make_aware(timezone.datetime(day.year, day.month, day.day))
+        total += reconcile(start, start + timedelta(days=1))
+    return total
+
+
+def _totals():
+    rows = (
+        MetricRollup.objects.filter(period=DAY)
+        .values('metric', 'dimension')
+        .annotate(count=Sum('count'), amount=Sum('amount'))
+    )
+    totals = {}
+    for row in rows:
+        totals.setdefault(row['metric'], []).append((row['dimension'].split('|'), row['count'], row['amount']))
+    return totals
+
+
+def _sum_by(rows, index):
+    counts = {}
+    for parts, count, _ in rows:
+        counts[parts[index]] = counts.get(parts[index], 0) + count
+    return {key: count for key, count in counts.items() if count}
+
+
+def dashboard_metrics():
+    """Totals and breakdowns for the admin dashboards, read from the daily rollups."""
+    totals = _totals()
+    users = totals.get('users', [])
+    orders = totals.get('orders', [])
+    payments = totals.get('payments', [])
+    otps = totals.get('otps', [])
+
+    order_counts = _sum_by(orders, 0)
+    return {
+        'total_users': sum(count for _, count, _ in users),
+        'user_counts_by_role': _sum_by(users, 0),
+        'pending_verification_users': sum(
+            count for (role, status, verified), count, _ in users
+            if status == 'pending_verification' and verified == 'False'
+        ),
+        'total_orders': sum(count for _, count, _ in orders),
+        'order_counts_by_status': order_counts,
+        'orders_by_status': [{'status': status, 'count': count} for status, count in order_counts.items()],
+        'order_counts_by_telco': _sum_by(orders, 1),
+        'total_revenue': sum((amount for (status,), _, amount in payments if status == 'success'), 0),
+        'total_otps': sum(count for _, count, _ in otps),
+        'otp_counts_by_status': _sum_by(otps, 1),
+    }
+
+
+def monthly_counts(metric, start):
+    """Records of `metric` created per calendar month since `start`, oldest first."""
+    rows = (
+        MetricRollup.objects.filter(period=DAY, metric=metric, bucket__gte=bucket_start(start, DAY))
+        .values('bucket')
+        .annotate(count=Sum('count'))
+        .order_by('bucket')
+    )
+    months = {}
+    for row in rows:
+        month = timezone.localtime(row['bucket']).replace(day=1)
+        months[month] = months.get(month, 0) + row['count']
+    return [(month, count) for month, count in months.items() if count]
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from authentication.models import OTP, CustomUser, DataBundleOrder, Payment
+from . import rollups
+
+
+@receiver(post_save, sender=DataBundleOrder)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=CustomUser)
+@receiver(post_save, sender=OTP)
+def update_rollups_on_save(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    rollups.record_change(instance, created=created, update_fields=update_fields)
+
+
+@receiver(post_delete, sender=DataBundleOrder)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_delete, sender=OTP)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    rollups.record_change(instance, deleted=True)
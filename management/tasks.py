@@ -0,0 +1,45 @@
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
+from .models import MetricRollup
+from . import rollups
+from .health_checks import run_health_checks
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(ignore_result=True)
+def reconcile_metric_rollups(dates=None):
+    """
+    Recompute dashboard rollups from the source tables.
+
+    With `dates` (ISO strings) only those days are rebuilt; otherwise the last
+    METRICS_RECONCILE_DAYS days, or all history if no rollups exist yet.
+    """
+    if dates:
+        return rollups.reconcile_dates([parse_date(day) for day in dates])
+    if not MetricRollup.objects.exists():
+        logger.info("No metric rollups yet, rebuilding from all history")
+        return rollups.reconcile()
+    return rollups.reconcile(start=timezone.now() - timedelta(days=settings.METRICS_RECONCILE_DAYS))
+
+
+def queue_rollup_reconcile(queryset):
+    """
+    Reconcile the creation days of `queryset` once the current transaction
+    commits. Call it after a bulk update that changed rolled-up fields, with a
+    queryset that still selects the updated rows.
+    """
+    dates = [day.isoformat() for day in queryset.dates('created_at', 'day')]
+    if dates:
+        transaction.on_commit(lambda: reconcile_metric_rollups.delay(dates))
+
+
+@shared_task(ignore_result=True)
+def run_system_health_checks():
+    """Refresh the cached consistency report shown on the admin dashboard."""
+    run_health_checks()
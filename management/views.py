@@ -35,11 +35,21 @@ from django.db.models.functions import TruncMonth
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required
 from .forms import *
+from .rollups import dashboard_metrics, monthly_counts
+from .health_checks import get_health_report
+from packages.pagination import CursorPaginator
+from packages.facets import facet_counts
+from packages import circuit
+from packages.replicas import replica_safe
+from authentication import ratelimit
+from authentication.mail import delivery_stats, queue_email
 from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
 
 
 # Ensure this path is correct based on your project structure
 @method_decorator(admin_required, name='dispatch')
+@method_decorator(replica_safe, name='dispatch')
 class AdminHomePageView(LoginRequiredMixin,TemplateView):
     template_name = 'management/admin_home_page.html'
 
@@ -60,29 +70,15 @@ class AdminHomePageView(LoginRequiredMixin,TemplateView):
         return context
 
     def get_dashboard_metrics(self):
-        # Count of users by role
-        user_role_counts = CustomUser.objects.values('role').annotate(count=Count('role'))
-        user_counts = {item['role']: item['count'] for item in user_role_counts}
-        
-        # Count of orders by status
-        order_status_counts = DataBundleOrder.objects.values('status').annotate(count=Count('status'))
-        order_counts = {item['status']: item['count'] for item in order_status_counts}
-        
-        # Count of OTPs by status
-        otp_status_counts = OTP.objects.values('status').annotate(count=Count('status'))
-        otp_counts = {item['status']: item['count'] for item in otp_status_counts}
-
-        # Calculate pending verification users
-        pending_verification_users = CustomUser.objects.filter(email_verified=False, account_status='pending_verification').count()
-        
+        metrics = dashboard_metrics()
         return {
-            'total_users': CustomUser.objects.count(),
-            'user_counts_by_role': user_counts,
-            'pending_verification_users': pending_verification_users,
-            'total_orders': DataBundleOrder.objects.count(),
-            'order_counts_by_status': order_counts,
-            'total_otps': OTP.objects.count(),
-            'otp_counts_by_status': otp_counts,
+            'total_users': metrics['total_users'],
+            'user_counts_by_role': metrics['user_counts_by_role'],
+            'pending_verification_users': metrics['pending_verification_users'],
+            'total_orders': metrics['total_orders'],
+            'order_counts_by_status': metrics['order_counts_by_status'],
+            'total_otps': metrics['total_otps'],
+            'otp_counts_by_status': metrics['otp_counts_by_status'],
         }
 
 
@@ -90,6 +86,7 @@ class AdminHomePageView(LoginRequiredMixin,TemplateView):
 
 
 @method_decorator(admin_required, name='dispatch')
+@method_decorator(replica_safe, name='dispatch')
 class AdminDashboardView(LoginRequiredMixin,TemplateView):
     template_name = 'management/admin_dashboard.html'
 
@@ -98,14 +95,26 @@ class AdminDashboardView(LoginRequiredMixin,TemplateView):
         context['title'] = 'Admin Dashboard'
         context['page_header'] = 'Dashboard'
 
-        # Fetch key metrics and analysis
-        context.update(self.get_dashboard_metrics())
+        # Fetch key metrics and analysis; they are only read when the template's
+        # cached metric fragments need rebuilding
+        context['metrics'] = SimpleLazyObject(self.get_dashboard_metrics)
+        context['fragment_cache_timeout'] = settings.DASHBOARD_FRAGMENT_CACHE_TIMEOUT
 
         # Fetch monthly activity analysis
         context.update(self.get_monthly_analysis())
 
         # Perform system health checks
         context.update(self.perform_system_health_checks())
+        context['email_delivery'] = delivery_stats()
+        context['provider_circuits'] = circuit.snapshot()
+        context.update(FulfilmentRecord.objects.aggregate(
+            deferred_fulfilments=Count('id', filter=Q(status='deferred')),
+            unknown_fulfilments=Count('id', filter=Q(status='unknown')),
+        ))
+        context['otp_rate_limit_blocks'] = [
+            {'otp_type': otp_type, 'scope': scope, 'count': count}
+            for (otp_type, scope), count in sorted(ratelimit.blocked_counts().items())
+        ]
         
         # Fetch recent system logs
         context['recent_audit_logs'] = AuditLog.objects.select_related('user').order_by('-created_at')[:10]
@@ -116,86 +125,33 @@ class AdminDashboardView(LoginRequiredMixin,TemplateView):
         return context
 
     def get_dashboard_metrics(self):
-        return {
-            'total_users': CustomUser.objects.count(),
-            'total_orders': DataBundleOrder.objects.count(),
-            'total_revenue': Payment.objects.filter(status='success').aggregate(total=Sum('amount'))['total'] or 0,
-            'orders_by_status': DataBundleOrder.objects.values('status').annotate(count=Count('status')),
-        }
+        # The template shares its breakdown panels with the admin home page
+        return dashboard_metrics()
 
     def get_monthly_analysis(self):
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=180) # Last 6 months
-
-        # Monthly order trends
-        monthly_orders = DataBundleOrder.objects.filter(
-            created_at__gte=start_date
-        ).annotate(
-            month=TruncMonth('created_at')
-        ).values('month').annotate(
-            count=Count('id')
-        ).order_by('month')
-
-        # Monthly user sign-up trends
-        monthly_signups = CustomUser.objects.filter(
-            created_at__gte=start_date
-        ).annotate(
-            month=TruncMonth('created_at')
-        ).values('month').annotate(
-            count=Count('id')
-        ).order_by('month')
-
-        # Format data for charts
-        order_months = [item['month'].strftime('%b %Y') for item in monthly_orders]
-        order_counts = [item['count'] for item in monthly_orders]
-        signup_months = [item['month'].strftime('%b %Y') for item in monthly_signups]
-        signup_counts = [item['count'] for item in monthly_signups]
+        start_date = timezone.now() - timedelta(days=180) # Last 6 months
+
+        monthly_orders = monthly_counts('orders', start_date)
+        monthly_signups = monthly_counts('users', start_date)
 
         return {
-            'order_months': order_months,
-            'order_counts': order_counts,
-            'signup_months': signup_months,
-            'signup_counts': signup_counts,
+            'order_months': [month.strftime('%b %Y') for month, _ in monthly_orders],
+            'order_counts': [count for _, count in monthly_orders],
+            'signup_months': [month.strftime('%b %Y') for month, _ in monthly_signups],
+            'signup_counts': [count for _, count in monthly_signups],
         }
 
     def perform_system_health_checks(self):
-        health_issues = []
-
-        # Check for orders without a corresponding payment
-        orders_without_payment = DataBundleOrder.objects.filter(
-            status__in=['pending', 'processing'],
-            payment__isnull=True
-        ).count()
-        if orders_without_payment > 0:
-            health_issues.append(f"⚠️ {orders_without_payment} pending/processing orders have no associated payment record.")
-
-        # Check for completed orders with failed payments
-        completed_orders_with_failed_payments = DataBundleOrder.objects.filter(
-            status='completed',
-            payment__status='failed'
-        ).count()
-        if completed_orders_with_failed_payments > 0:
-            health_issues.append(f"🚨 {completed_orders_with_failed_payments} completed orders have failed payment statuses. This indicates a data inconsistency.")
-
-        # Check for payments with no order
-        payments_without_order = Payment.objects.filter(order__isnull=True).count()
-        if payments_without_order > 0:
-            health_issues.append(f"🚨 {payments_without_order} payments exist without a corresponding order.")
-
-        # Check for users with active status but unverified emails
-        users_inconsistency = CustomUser.objects.filter(
-            account_status='active', 
-            email_verified=False
-        ).count()
-        if users_inconsistency > 0:
-            health_issues.append(f"🚨 {users_inconsistency} users are marked 'active' but their email is not verified.")
-
-        # Check for missing Telco or Bundle records
-        orders_with_missing_telco = DataBundleOrder.objects.filter(telco__isnull=True).count()
-        if orders_with_missing_telco > 0:
-            health_issues.append(f"🚨 {orders_with_missing_telco} orders have no associated Telco record.")
-
-        return {'health_issues': health_issues}
+        # Checks run in the background (management.tasks.run_system_health_checks); only read the last report here
+        report = get_health_report()
+        if report is None:
+            return {'health_issues': [], 'health_checks': [], 'health_checked_at': None}
+
+        return {
+            'health_issues': [result['message'] for result in report['results'] if result['count']],
+            'health_checks': report['results'],
+            'health_checked_at': report['checked_at'],
+        }
     
 
 @method_decorator(admin_required, name='dispatch')
@@ -215,26 +171,29 @@ class AdminviewAllOrders(LoginRequiredMixin, ListView):
     model = DataBundleOrder
     template_name = 'management/admin_view_all_orders.html'
     context_object_name = 'orders'
-    paginate_by = 20  # Show 20 orders per page
+    page_size = 20  # Show 20 orders per page, keyset paginated in get_context_data
 
     def get_queryset(self):
         return DataBundleOrder.objects.select_related('user', 'telco', 'bundle', 'payment').order_by('-created_at')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        orders = DataBundleOrder.objects.select_related('user', 'telco', 'bundle', 'payment').order_by('-created_at')
-        total_pending_orders = orders.filter(status='pending').count()
-        total_processing_orders = orders.filter(status='processing').count()
-        total_failed_orders = orders.filter(status='failed').count()
-        total_cancelled_orders = orders.filter(status='cancelled').count()
-        total_completed_orders = orders.filter(status='completed').count()
-        
+        metrics = dashboard_metrics()
+        order_counts = metrics['order_counts_by_status']
+
+        page_obj = CursorPaginator(self.object_list, self.page_size, count=metrics['total_orders']).page(
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+        )
+
         context['title'] = 'All Orders'
-        context['total_pending_orders'] = total_pending_orders
-        context['total_processing_orders'] = total_processing_orders
-        context['total_failed_orders'] = total_failed_orders
-        context['total_cancelled_orders'] = total_cancelled_orders 
-        context['total_completed_orders'] = total_completed_orders 
+        context['orders'] = page_obj.object_list
+        context['page_obj'] = page_obj
+        context['total_pending_orders'] = order_counts.get('pending', 0)
+        context['total_processing_orders'] = order_counts.get('processing', 0)
+        context['total_failed_orders'] = order_counts.get('failed', 0)
+        context['total_cancelled_orders'] = order_counts.get('cancelled', 0)
+        context['total_completed_orders'] = order_counts.get('completed', 0)
         context['page_header'] = 'Order Management'
         return context
 
@@ -250,32 +209,31 @@ class AdminViewAllBundle(LoginRequiredMixin,ListView):
         context = super().get_context_data(**kwargs)
         context['page_name'] = 'data_bundles'
         context['list_name'] = 'bundle_lists'
-        context['total_bundles'] = self.get_queryset().count()
-        context['total_active_bundles'] = self.get_queryset().filter(is_active=True).count()
-        context['total_inactive_customer_bundles'] = self.get_queryset().filter(is_active=False, is_agent_bundle=False).count()
-        context['total_active_customer_bundles'] = self.get_queryset().filter(is_active=True, is_agent_bundle=False).count()
-        context['total_agent_active_bundles'] = self.get_queryset().filter(is_active=True, is_agent_bundle=True).count()
-        context['total_inactive_bundles'] = self.get_queryset().filter(is_active=False).count()
-        context['total_inactive_agent_bundles'] = self.get_queryset().filter(is_active=False, is_agent_bundle=True).count()
+
+        counts = facet_counts(self.object_list, {
+            'active': Q(is_active=True),
+            'inactive': Q(is_active=False),
+            'active_customer': Q(is_active=True, is_agent_bundle=False),
+            'inactive_customer': Q(is_active=False, is_agent_bundle=False),
+            'active_agent': Q(is_active=True, is_agent_bundle=True),
+            'inactive_agent': Q(is_active=False, is_agent_bundle=True),
+        }, cache_prefix='admin_bundles')
+        context['total_bundles'] = counts['total']
+        context['total_active_bundles'] = counts['active']
+        context['total_inactive_customer_bundles'] = counts['inactive_customer']
+        context['total_active_customer_bundles'] = counts['active_customer']
+        context['total_agent_active_bundles'] = counts['active_agent']
+        context['total_inactive_bundles'] = counts['inactive']
+        context['total_inactive_agent_bundles'] = counts['inactive_agent']
         return context
     
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        search_query = self.request.GET.get('search', '')
+        queryset = super().get_queryset().select_related('telco')
+        search_query = self.request.GET.get('search', '').strip()
 
         if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(telco__icontains=search_query) |
-                Q(price__icontains=search_query) |
-                Q(is_agent_bundle__icontains=search_query) |
-                Q(is_in_stock__icontains=search_query) |
-                Q(is_limited__icontains=search_query) |
-                Q(is_active__icontains=search_query) |
-                Q(size_mb__icontains=search_query)
-            )
-
+            queryset = queryset.filter(Bundle.search_filter(search_query))
 
         return queryset
     
@@ -308,13 +266,8 @@ class AdminRegisterStaffView(CreateView):
         user.username = f"user_{form.cleaned_data['username']}"
         
         user.save()
-        subject = 'DataHub - Your Login OTP'
-        html_message = render_to_string(
-                        'authentication/emails/otp_login_email.html',
-                        {'user': user,}
-                    )
-        message = f"Dear {user.get_full_name()}, \nYou have been enrolled as a Staff at Datahub . Your Staff ID is {user.pk}."
-        send_mail(user.email, message) 
+        message = f"Dear {user.full_name}, \nYou have been enrolled as a Staff at Datahub . Your Staff ID is {user.pk}."
+        queue_email('staff_enrolled', user.email, 'DataHub - Staff Account Created', body=message)
 
         # Log the user creation
         create_log_entry(
@@ -0,0 +1,296 @@
+"""
+Circuit breakers and bulkheads for outbound provider calls.
+
+    with circuit.guard('datamart'):
+        response = session.post(...)
+        response.raise_for_status()
+
+guard() raises ProviderUnavailable, without calling the provider, when:
+
+- the provider's bulkhead is full: at most `max_concurrent` calls are in
+  flight across all processes (CIRCUIT_BREAKERS), so a slow provider ties up
+  a bounded number of web and worker threads instead of all of them;
+- its circuit is open: once at least CIRCUIT_MIN_CALLS calls in the last
+  CIRCUIT_WINDOW seconds include CIRCUIT_FAILURE_RATE failures (timeouts,
+  connection errors, 5xx) or CIRCUIT_SLOW_CALL_RATE calls slower than
+  `slow_call_ms`, calls are refused for CIRCUIT_OPEN_SECONDS. A single probe
+  call is then let through (half-open); it closes the circuit if it succeeds
+  in time and reopens it otherwise.
+
+Breaker state and counters live in the default cache, so every process sees
+the same circuit; with Redis, bulkhead slots are leases in a sorted set
+updated by one Lua script. Without Redis, or while it is unreachable, each
+process falls back to its own memory, which is weaker but keeps guarding.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+COUNTERS = ('calls', 'failures', 'slow', 'rejected')
+
+# KEYS[1] is the provider's lease set; ARGV is now, lease id, lease seconds, limit.
+# Returns 1 and adds the lease when a slot is free, else 0.
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - tonumber(ARGV[3]))
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[4]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now, ARGV[2])
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[3])))
+return 1
+"""
+
+_local = LocMemCache('circuit-breakers', {})
+_lock = threading.Lock()
+_local_in_flight = defaultdict(int)
+
+
+class ProviderUnavailable(Exception):
+    """A provider call was refused before it was sent."""
+
+    def __init__(self, provider, reason, retry_after=0):
+        self.provider = provider
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"{provider.capitalize()} is temporarily unavailable, please try again shortly")
+
+
+def _config(name):
+    return settings.CIRCUIT_BREAKERS[name]
+
+
+def _shared(operation, *args):
+    """Run a cache operation on the shared cache, or on process memory while it is down."""
+    try:
+        return getattr(cache, operation)(*args)
+    except ValueError:
+        # incr of a missing key: not an outage
+        raise
+    except Exception as e:
+        logger.warning(f"Circuit breaker using local state: {str(e)}")
+        return getattr(_local, operation)(*args)
+
+
+def is_failure(error):
+    """Whether an exception from a provider call says the provider is unhealthy (4xx responses do not)."""
+    if not isinstance(error, requests.RequestException):
+        return False
+    response = error.response
+    return response is None or response.status_code >= 500
+
+
+# ---------- Breaker ----------
+def _state_key(name):
+    return f'circuit:{name}:state'
+
+
+def _counter_key(name, counter, bucket):
+    return f'circuit:{name}:{counter}:{bucket}'
+
+
+def _count(name, counter, now):
+    window = settings.CIRCUIT_WINDOW
+    key = _counter_key(name, counter, int(now // window))
+    _shared('add', key, 0, window * 2)
+    try:
+        _shared('incr', key)
+    except ValueError:
+        # Expired between add and incr
+        _shared('add', key, 1, window * 2)
+
+
+def _window_counts(name, now):
+    """Counters over the last CIRCUIT_WINDOW seconds, weighting the previous bucket by its overlap."""
+    window = settings.CIRCUIT_WINDOW
+    bucket = int(now // window)
+    keys = {
+        (counter, offset): _counter_key(name, counter, bucket - offset)
+        for counter in COUNTERS for offset in (0, 1)
+    }
+    values = _shared('get_many', list(keys.values()))
+    overlap = 1 - (now % window) / window
+    return {
+        counter: values.get(keys[(counter, 0)], 0) + overlap * values.get(keys[(counter, 1)], 0)
+        for counter in COUNTERS
+    }
+
+
+def _open(name, now, reason):
+    state = {'opened_at': now, 'until': now + settings.CIRCUIT_OPEN_SECONDS, 'reason': reason}
+    _shared('set', _state_key(name), state, None)
+    logger.error(f"Circuit for {name} opened for {settings.CIRCUIT_OPEN_SECONDS}s: {reason}")
+
+
+def _close(name, now):
+    # Start the closed circuit with an empty window, or the failures that opened it would trip it again
+    bucket = int(now // settings.CIRCUIT_WINDOW)
+    counters = [_counter_key(name, counter, b) for counter in COUNTERS for b in (bucket, bucket - 1)]
+    _shared('delete_many', [_state_key(name), f'circuit:{name}:probe', *counters])
+    logger.warning(f"Circuit for {name} closed")
+
+
+def _trip_reason(name, now):
+    counts = _window_counts(name, now)
+    calls = counts['calls']
+    if calls < settings.CIRCUIT_MIN_CALLS:
+        return None
+    if counts['failures'] / calls >= settings.CIRCUIT_FAILURE_RATE:
+        return f"{counts['failures'] / calls:.0%} of {calls:.0f} calls failed"
+    if counts['slow'] / calls >= settings.CIRCUIT_SLOW_CALL_RATE:
+        return f"{counts['slow'] / calls:.0%} of {calls:.0f} calls slower than {_config(name)['slow_call_ms']}ms"
+    return None
+
+
+def _admit(name, now):
+    """Returns whether this call is the half-open probe; raises ProviderUnavailable while open."""
+    state = _shared('get', _state_key(name))
+    if state is None:
+        return False
+    if now < state['until']:
+        raise ProviderUnavailable(name, 'circuit open', retry_after=int(state['until'] - now) + 1)
+    # One caller probes; the timeout frees the slot if the probe never reports back
+    if _shared('add', f'circuit:{name}:probe', 1, settings.BULKHEAD_LEASE_SECONDS):
+        return True
+    raise ProviderUnavailable(name, 'circuit half-open')
+
+
+def _record(name, ok, elapsed_ms, probe):
+    now = time.time()
+    slow = elapsed_ms > _config(name)['slow_call_ms']
+    if probe:
+        if ok and not slow:
+            _close(name, now)
+        else:
+            _open(name, now, f"probe {'failed' if not ok else f'took {elapsed_ms:.0f}ms'}")
+            _shared('delete', f'circuit:{name}:probe')
+        return
+
+    _count(name, 'calls', now)
+    if not ok:
+        _count(name, 'failures', now)
+    if slow:
+        _count(name, 'slow', now)
+    if (not ok or slow) and _shared('get', _state_key(name)) is None:
+        reason = _trip_reason(name, now)
+        if reason:
+            _open(name, now, reason)
+
+
+# ---------- Bulkhead ----------
+def _bulkhead_key(name):
+    return f'bulkhead:{name}'
+
+
+def _acquire_local(name, limit):
+    with _lock:
+        if _local_in_flight[name] >= limit:
+            return False
+        _local_in_flight[name] += 1
+        return True
+
+
+def _acquire(name):
+    """A lease id for a free slot (True for a local slot), or None when the bulkhead is full."""
+    limit = _config(name)['max_concurrent']
+    if isinstance(caches['default'], RedisCache):
+        lease = uuid.uuid4().hex
+        try:
+            client = caches['default']._cache.get_client(write=True)
+            args = (time.time(), lease, settings.BULKHEAD_LEASE_SECONDS, limit)
+            return lease if client.eval(_ACQUIRE_SCRIPT, 1, _bulkhead_key(name), *args) else None
+        except Exception as e:
+            logger.warning(f"Bulkhead for {name} falling back to a local slot: {str(e)}")
+    return True if _acquire_local(name, limit) else None
+
+
+def _release(name, lease):
+    if lease is True:
+        with _lock:
+            _local_in_flight[name] -= 1
+        return
+    try:
+        caches['default']._cache.get_client(write=True).zrem(_bulkhead_key(name), lease)
+    except Exception as e:
+        # The lease expires after BULKHEAD_LEASE_SECONDS anyway
+        logger.warning(f"Failed to release {name} bulkhead lease: {str(e)}")
+
+
+def _in_flight(name):
+    if isinstance(caches['default'], RedisCache):
+        try:
+            client = caches['default']._cache.get_client()
+            return client.zcount(_bulkhead_key(name), time.time() - settings.BULKHEAD_LEASE_SECONDS, '+inf')
+        except Exception:
+            pass
+    return _local_in_flight[name]
+
+
+# ---------- Public API ----------
+@contextmanager
+def guard(name):
+    """Run one call to provider `name` ('paystack', 'datamart') inside its bulkhead and breaker."""
+    lease = _acquire(name)
+    if lease is None:
+        _count(name, 'rejected', time.time())
+        raise ProviderUnavailable(name, 'too many calls in flight')
+
+    try:
+        try:
+            probe = _admit(name, time.time())
+        except ProviderUnavailable:
+            _count(name, 'rejected', time.time())
+            raise
+
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            _record(name, not is_failure(e), (time.perf_counter() - started) * 1000, probe)
+            raise
+        _record(name, True, (time.perf_counter() - started) * 1000, probe)
+    finally:
+        _release(name, lease)
+
+
+def is_open(name):
+    """Whether calls to `name` are currently refused by its breaker."""
+    state = _shared('get', _state_key(name))
+    return state is not None and time.time() < state['until']
+
+
+def snapshot():
+    """State of every configured breaker, for the admin dashboard."""
+    now = time.time()
+    result = []
+    for name, config in settings.CIRCUIT_BREAKERS.items():
+        state = _shared('get', _state_key(name))
+        counts = _window_counts(name, now)
+        calls = counts['calls']
+        result.append({
+            'name': name,
+            'state': CLOSED if state is None else OPEN if now < state['until'] else HALF_OPEN,
+            'reason': state['reason'] if state else '',
+            'retry_after': max(0, int(state['until'] - now)) if state else 0,
+            'calls': round(calls),
+            'failure_rate': round(100 * counts['failures'] / calls) if calls else 0,
+            'slow_rate': round(100 * counts['slow'] / calls) if calls else 0,
+            'rejected': round(counts['rejected']),
+            'in_flight': _in_flight(name),
+            'max_concurrent': config['max_concurrent'],
+        })
+    return result
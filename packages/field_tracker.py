@@ -0,0 +1,60 @@
+class FieldTrackerMixin:
+    """
+    Remembers the field values an instance was loaded or last saved with,
+    so changes can be diffed in memory instead of re-fetching the row.
+
+    Put it before models.Model in the bases:
+
+        class Telco(FieldTrackerMixin, models.Model): ...
+
+    post_save receivers call instance.get_field_changes(update_fields) to see
+    what the save changed; the snapshot is refreshed once save() returns.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._snapshot_fields()
+
+    def _snapshot_fields(self, fields=None):
+        # Deferred fields are absent from __dict__ and are left out of the snapshot
+        loaded = self.__dict__
+        if fields is None or not hasattr(self, '_loaded_values'):
+            self._loaded_values = {
+                field.attname: loaded[field.attname]
+                for field in self._meta.concrete_fields
+                if field.attname in loaded
+            }
+            return
+        for field in self._meta.concrete_fields:
+            if (field.name in fields or field.attname in fields) and field.attname in loaded:
+                self._loaded_values[field.attname] = loaded[field.attname]
+
+    def get_field_changes(self, update_fields=None):
+        """
+        Fields whose value differs from the snapshot, as {name: (old, new)}.
+
+        With update_fields only those fields are compared, matching what the
+        save actually wrote. Unsaved instances report no changes.
+        """
+        if self._state.adding:
+            return {}
+
+        changes = {}
+        for field in self._meta.concrete_fields:
+            if update_fields is not None and field.name not in update_fields and field.attname not in update_fields:
+                continue
+            if field.attname not in self._loaded_values or field.attname not in self.__dict__:
+                continue
+            old_value = self._loaded_values[field.attname]
+            new_value = self.__dict__[field.attname]
+            if old_value != new_value:
+                changes[field.name] = (old_value, new_value)
+        return changes
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot_fields(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._snapshot_fields(kwargs.get('fields'))
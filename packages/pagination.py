@@ -0,0 +1,117 @@
+import base64
+import json
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorPage:
+    """One page of a CursorPaginator, iterable like a Paginator page."""
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor, approximate_count=None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.approximate_count = approximate_count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class CursorPaginator:
+    """
+    Keyset pagination over a queryset ordered newest first by (created_at, id).
+
+    A page is fetched with WHERE (created_at, id) < cursor ORDER BY ... LIMIT
+    per_page + 1, so any page costs the same as the first and no COUNT(*) is
+    run; the queryset's filters plus (created_at, id) should be covered by an
+    index. Cursors are opaque tokens for ?after= / ?before=. Pass `count` (a
+    number or a callable) to show an approximate total, e.g. from the rollups
+    or estimated_row_count().
+
+        page = CursorPaginator(orders, 20).page(after=request.GET.get('after'),
+                                                before=request.GET.get('before'))
+    """
+
+    def __init__(self, queryset, per_page, count=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count = count
+
+    @staticmethod
+    def encode_cursor(obj):
+        raw = json.dumps([obj.created_at.isoformat(), obj.pk]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(token):
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            created_at, pk = json.loads(raw)
+            created_at = parse_datetime(created_at)
+        except (ValueError, TypeError) as e:
+            raise InvalidCursor(token) from e
+        if created_at is None:
+            raise InvalidCursor(token)
+        return created_at, pk
+
+    def page(self, after=None, before=None):
+        """The page after `after`, before `before`, or the first page. Bad cursors give the first page."""
+        try:
+            if before:
+                created_at, pk = self.decode_cursor(before)
+                newer = Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+                rows = list(self.queryset.filter(newer).order_by('created_at', 'pk')[:self.per_page + 1])
+                has_previous = len(rows) > self.per_page
+                object_list = rows[:self.per_page][::-1]
+                has_next = True
+            elif after:
+                created_at, pk = self.decode_cursor(after)
+                older = Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+                rows = list(self.queryset.filter(older).order_by('-created_at', '-pk')[:self.per_page + 1])
+                has_next = len(rows) > self.per_page
+                object_list = rows[:self.per_page]
+                has_previous = True
+            else:
+                raise InvalidCursor(None)
+        except InvalidCursor:
+            rows = list(self.queryset.order_by('-created_at', '-pk')[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            object_list = rows[:self.per_page]
+            has_previous = False
+
+        if not object_list:
+            has_next = has_previous = False
+        count = self.count() if callable(self.count) else self.count
+        return CursorPage(
+            object_list,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=self.encode_cursor(object_list[-1]) if has_next else None,
+            previous_cursor=self.encode_cursor(object_list[0]) if has_previous else None,
+            approximate_count=count,
+        )
+
+
+def estimated_row_count(model):
+    """The planner's row estimate for a whole table on PostgreSQL, or None elsewhere."""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+        row = cursor.fetchone()
+    # -1 until the table has been analyzed
+    return row[0] if row and row[0] >= 0 else None
@@ -0,0 +1,148 @@
+"""
+Read-replica routing.
+
+Reads go to the primary ('default') unless code opts in, so nothing moves to
+the replica by accident:
+
+    @method_decorator(replica_safe, name='dispatch')   # a view's GET/HEAD requests
+    with replica_reads(request.user): ...              # one block of code
+    on_replica(queryset)                               # a read-only queryset used later
+
+A user's replica-safe reads stay on the primary for REPLICA_STICKY_SECONDS
+after one of their orders or payments is written (see pin_to_primary), so the
+pages they land on after a purchase never show replica lag. Inside a block,
+reads also stay on the primary once the block writes anything, and while a
+transaction is open on the primary.
+
+Without a 'replica' entry in DATABASES everything reads from the primary. For
+local testing, SQLITE_REPLICA=True adds a second SQLite file, refreshed from
+the primary with `python manage.py sync_sqlite_replica`.
+"""
+import functools
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class _ReadState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+
+
+_state = ContextVar('replica_reads', default=None)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def _pin_key(user_id):
+    return f'replica:pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    """Keep `user_id`'s replica-safe reads on the primary for REPLICA_STICKY_SECONDS."""
+    if user_id is None or not replica_configured():
+        return
+    try:
+        cache.set(_pin_key(user_id), 1, settings.REPLICA_STICKY_SECONDS)
+    except Exception as e:
+        logger.error(f"Failed to pin user {user_id} to the primary: {str(e)}")
+
+
+def is_pinned(user_id):
+    if user_id is None:
+        return False
+    try:
+        return cache.get(_pin_key(user_id)) is not None
+    except Exception:
+        # Without the cache we cannot tell whether the user just wrote; stay on the primary
+        return True
+
+
+def _use_replica(user_id=None):
+    state = _state.get()
+    return (
+        replica_configured()
+        and not (state and state.pinned)
+        and not connections[PRIMARY].in_atomic_block
+        and not is_pinned(user_id)
+    )
+
+
+@contextmanager
+def replica_reads(user=None):
+    """Route the reads in this block to the replica, unless `user` is pinned to the primary."""
+    user_id = getattr(user, 'pk', None)
+    token = _state.set(_ReadState(pinned=not _use_replica(user_id)))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+def on_replica(queryset, user=None):
+    """
+    `queryset` bound to the replica when replica reads are allowed here, for
+    querysets consumed after the current block ends (e.g. a streamed export).
+    Only use it for reads: writes through the returned queryset would go to
+    the replica too.
+    """
+    return queryset.using(REPLICA) if _use_replica(getattr(user, 'pk', None)) else queryset
+
+
+def replica_safe(view_func):
+    """
+    Serve a view's GET and HEAD requests from the replica, template rendering
+    included. The session and user are loaded from the primary first.
+    """
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS or not replica_configured():
+            return view_func(request, *args, **kwargs)
+        user = request.user if request.user.is_authenticated else None
+        with replica_reads(user):
+            response = view_func(request, *args, **kwargs)
+            # TemplateResponses render after the view returns, outside this block
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+    return wrapper
+
+
+class ReplicaRouter:
+    """Sends reads inside replica_reads() blocks to the replica; everything else uses the primary."""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.pinned or connections[PRIMARY].in_atomic_block:
+            return None
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Read what was just written: the rest of the block stays on the primary
+            state.pinned = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {PRIMARY, REPLICA}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary
+        if db == REPLICA:
+            return False
+        return None
@@ -0,0 +1,115 @@
+"""
+Bundle catalog for the storefront pages.
+
+The customer catalog (HomeView, TestHomeView) and the agent catalog
+(AgentHomeView) are built once per catalog version and kept in the cache.
+Bundle and Telco saves bump the version through authentication.signals; admin
+bulk actions that use queryset.update() call invalidate_catalog() themselves.
+"""
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from authentication.models import Bundle, Telco
+
+logger = logging.getLogger(__name__)
+
+CUSTOMER = 'customer'
+AGENT = 'agent'
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+NON_EXPIRY_TELCOS = ('mtn', 'telecel')
+
+
+def _catalog_key(audience, version):
+    return f'catalog:{audience}:{version}'
+
+
+def size_label(size_mb):
+    return f"{size_mb // 1000}GB" if size_mb >= 1000 else f"{size_mb}MB"
+
+
+def validity_label(telco_name):
+    return "Non-Expiry" if telco_name.lower() in NON_EXPIRY_TELCOS else "30 days"
+
+
+def stock_summary(stocks):
+    if all(stocks):
+        return "in-stock"
+    if any(stocks):
+        return "limited-stock"
+    return "out-of-stock"
+
+
+def build_catalog(audience):
+    """Query the bundles for one audience and shape them for the templates."""
+    bundles = (
+        Bundle.objects.select_related('telco')
+        .filter(is_agent_bundle=(audience == AGENT), is_active=True)
+        .order_by('telco__name', 'size_mb')
+    )
+
+    data_plans = {}
+    telco_stock_status = {}
+    for bundle in bundles:
+        provider_name = bundle.telco.name
+        if provider_name not in data_plans:
+            data_plans[provider_name] = []
+            telco_stock_status[provider_name] = []
+
+        data_plans[provider_name].append({
+            'id': bundle.id,
+            'size': size_label(bundle.size_mb),
+            'price': f"{bundle.price:.2f}",
+            'validity': validity_label(provider_name),
+            'code': bundle.telco.code,
+            'is_instock': bundle.is_instock,
+        })
+        telco_stock_status[provider_name].append(bundle.is_instock)
+
+    return {
+        'data_plans': data_plans,
+        'data_plans_json': json.dumps(data_plans),
+        'telco_summary': {name: stock_summary(stocks) for name, stocks in telco_stock_status.items()},
+        'telcos': list(Telco.objects.order_by('name').values('id', 'name', 'code', 'is_active')),
+        'built_at': time.time(),
+    }
+
+
+def _current_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def get_catalog(audience):
+    """Cached catalog for CUSTOMER or AGENT, built on first use after each change."""
+    try:
+        version = _current_version()
+        key = _catalog_key(audience, version)
+        catalog = cache.get(key)
+    except Exception as e:
+        logger.error(f"Catalog cache unavailable, building {audience} catalog directly: {str(e)}")
+        return build_catalog(audience)
+
+    if catalog is None:
+        catalog = build_catalog(audience)
+        try:
+            cache.set(key, catalog, settings.CATALOG_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Failed to cache {audience} catalog: {str(e)}")
+    return catalog
+
+
+def invalidate_catalog():
+    """Start a new catalog version; entries for the old one simply expire."""
+    try:
+        cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+    except Exception as e:
+        logger.error(f"Failed to invalidate bundle catalog: {str(e)}")
@@ -1,17 +1,107 @@
+import threading
+import time
+
 import requests
-import json
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from packages import circuit
+
+
+class ClientMetrics:
+    """Thread-safe per-operation latency counters for outbound API calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, operation, elapsed_ms, ok=True):
+        with self._lock:
+            stats = self._stats.setdefault(operation, {
+                'calls': 0,
+                'errors': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+            })
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if not ok:
+                stats['errors'] += 1
+
+    def snapshot(self):
+        """Return a copy of the counters with the average latency filled in."""
+        with self._lock:
+            result = {}
+            for operation, stats in self._stats.items():
+                result[operation] = dict(stats)
+                result[operation]['avg_ms'] = stats['total_ms'] / stats['calls'] if stats['calls'] else 0.0
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+def build_session(pool_size, max_retries, backoff_factor):
+    """Create a keep-alive session with a bounded connection pool and retry policy."""
+    # urllib3 only retries read errors and 5xx responses for idempotent methods,
+    # so a purchase POST is never re-sent once the request has gone out.
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(502, 503, 504),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 
 class DataMartClient:
-    def __init__(self, api_key):
+    def __init__(self, api_key, base_url=None, session=None, timeout=None):
         self.api_key = api_key
-        self.base_url = 'https://api.datamartgh.shop/api/developer'
+        self.base_url = base_url or getattr(settings, 'DATAMART_API_BASE_URL', 'https://api.datamartgh.shop/api/developer')
         self.headers = {
             'Content-Type': 'application/json',
             'X-API-Key': api_key
         }
+        self.session = session or build_session(
+            pool_size=getattr(settings, 'DATAMART_POOL_SIZE', 10),
+            max_retries=getattr(settings, 'DATAMART_MAX_RETRIES', 2),
+            backoff_factor=getattr(settings, 'DATAMART_BACKOFF_FACTOR', 0.3),
+        )
+        self.timeout = timeout or (
+            getattr(settings, 'DATAMART_CONNECT_TIMEOUT', 3.05),
+            getattr(settings, 'DATAMART_READ_TIMEOUT', 15),
+        )
+        self.metrics = ClientMetrics()
+
+    def _request(self, operation, method, url, headers=None, **kwargs):
+        started = time.perf_counter()
+        ok = False
+        try:
+            headers = {**self.headers, **headers} if headers else self.headers
+            with circuit.guard('datamart'):
+                response = self.session.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+                response.raise_for_status()
+            ok = True
+            return response
+        finally:
+            self.metrics.record(operation, (time.perf_counter() - started) * 1000, ok=ok)
 
-    def purchase_data(self, phone_number, network, capacity):
-        """Purchase a data bundle for the specified phone number."""
+    def purchase_data(self, phone_number, network, capacity, idempotency_key=None):
+        """Purchase a data bundle for the specified phone number.
+
+        `idempotency_key` is sent in the DATAMART_IDEMPOTENCY_HEADER header so
+        the provider can drop a repeated purchase.
+        """
         url = f"{self.base_url}/purchase"
         payload = {
             'phoneNumber': phone_number,
@@ -19,15 +109,15 @@ class DataMartClient:
             'capacity': capacity,
             'gateway': 'wallet'
         }
-        response = requests.post(url, json=payload, headers=self.headers)
-        response.raise_for_status()
+        header = getattr(settings, 'DATAMART_IDEMPOTENCY_HEADER', 'Idempotency-Key')
+        headers = {header: idempotency_key} if idempotency_key and header else None
+        response = self._request('purchase_data', 'POST', url, headers=headers, json=payload)
         return response.json()
 
     def get_order_status(self, order_id):
         """Check the status of an order by its ID."""
         url = f"{self.base_url}/order/{order_id}"  # 👈 confirm endpoint
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
+        response = self._request('get_order_status', 'GET', url)
         data = response.json()
 
         # Extract nested status safely
@@ -35,3 +125,24 @@ class DataMartClient:
             return data["data"]["apiResponse"]["data"]["status"]
         except KeyError:
             return None
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_datamart_client():
+    """Return the process-wide DataMart client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DataMartClient(settings.DATAMART_API_KEY)
+    return _client
+
+
+def get_datamart_metrics():
+    """Latency counters of the shared client, keyed by operation."""
+    if _client is None:
+        return {}
+    return _client.metrics.snapshot()
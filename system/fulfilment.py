@@ -0,0 +1,100 @@
+"""
+Exactly-once DataMart purchases.
+
+Fulfilment can be started by the payment webhook, the payment callback, a
+redelivered Celery task or an admin re-trigger, on any web or worker process.
+Before a purchase is sent, claim() inserts the order's FulfilmentRecord and
+commits it; the unique order column lets exactly one caller win, whichever
+process it runs in, and everyone else gets None and must not call DataMart.
+
+The record's idempotency key goes out with the purchase (see
+DataMartClient.purchase_data), so retries inside the HTTP client cannot
+double-buy either where the provider honours it. The outcome is written back
+with record_sent() or record_failed(); a purchase refused locally by the
+DataMart circuit breaker is record_deferred() and can be claimed again, which
+services.sweep_deferred_fulfilments does once the circuit closes. A record
+left in 'claimed' (the sender died mid-call) or 'unknown' may still have been
+bought: check with DataMart before deleting it in the admin, which lets an
+admin re-trigger the purchase.
+"""
+import logging
+
+import requests
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from urllib3.exceptions import NewConnectionError
+
+from authentication.models import FulfilmentRecord
+
+logger = logging.getLogger(__name__)
+
+# 4xx responses that do not prove the purchase was refused: a timeout, or a
+# conflict that may be the provider rejecting a key it has already seen
+AMBIGUOUS_STATUS_CODES = (408, 409)
+
+
+def idempotency_key(order):
+    return f'datahub:{order.id}'
+
+
+def claim(order, claimed_by):
+    """Commit the order's FulfilmentRecord, or take over a deferred one; None if a purchase was already claimed."""
+    try:
+        with transaction.atomic():
+            return FulfilmentRecord.objects.create(
+                order=order,
+                idempotency_key=idempotency_key(order),
+                claimed_by=claimed_by,
+            )
+    except IntegrityError:
+        pass
+
+    # A deferred purchase was never sent; one caller may claim it again
+    if FulfilmentRecord.objects.filter(order=order, status='deferred').update(
+        status='claimed', claimed_by=claimed_by, updated_at=timezone.now(),
+    ):
+        return FulfilmentRecord.objects.get(order=order)
+
+    existing = FulfilmentRecord.objects.filter(order=order).values_list('status', 'claimed_by').first()
+    logger.warning(f"DataMart purchase for order {order.id} already claimed: {existing}")
+    return None
+
+
+def record_sent(record, provider_order_id):
+    record.status = 'sent'
+    record.provider_order_id = provider_order_id or ''
+    record.save(update_fields=['status', 'provider_order_id', 'updated_at'])
+
+
+def record_deferred(record, error):
+    record.status = 'deferred'
+    record.last_error = str(error)
+    record.save(update_fields=['status', 'last_error', 'updated_at'])
+    logger.warning(f"DataMart purchase for order {record.order_id} deferred: {error.reason}")
+
+
+def _never_sent(error):
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # Connection refused or DNS failure, wrapped by urllib3 in a MaxRetryError
+    reason = getattr(error.args[0], 'reason', None) if isinstance(error, requests.ConnectionError) and error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def record_failed(record, error):
+    """
+    Store why the purchase failed. It is 'failed' only when DataMart certainly
+    did not take it (the connection never opened, or a 4xx refusal);
+    otherwise it may have been bought, and the record is 'unknown'.
+    """
+    response = getattr(error, 'response', None)
+    refused = (
+        _never_sent(error)
+        or (response is not None and 400 <= response.status_code < 500
+            and response.status_code not in AMBIGUOUS_STATUS_CODES)
+    )
+    record.status = 'failed' if refused else 'unknown'
+    record.last_error = str(error)
+    record.save(update_fields=['status', 'last_error', 'updated_at'])
+    if not refused:
+        logger.error(f"Outcome of DataMart purchase for order {record.order_id} is unknown: {str(error)}")
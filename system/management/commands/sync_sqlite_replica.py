@@ -0,0 +1,28 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite database into the SQLite read replica (SQLITE_REPLICA=True). "
+        "Run it again whenever the replica should catch up; in between, it lags like a real one."
+    )
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        replica = settings.DATABASES.get('replica')
+        if replica is None:
+            raise CommandError("No 'replica' database is configured; set SQLITE_REPLICA=True.")
+        if not all(db['ENGINE'] == 'django.db.backends.sqlite3' for db in (primary, replica)):
+            raise CommandError("Both databases must be SQLite; a Postgres replica is kept in sync by streaming replication.")
+
+        source = sqlite3.connect(primary['NAME'])
+        target = sqlite3.connect(replica['NAME'])
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        self.stdout.write(self.style.SUCCESS(f"Copied {primary['NAME']} to {replica['NAME']}"))
@@ -0,0 +1,171 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from authentication.models import DataBundleOrder
+from authentication.transitions import ORDER_TRANSITIONS, transition
+from packages.circuit import ProviderUnavailable
+from .datamart_client import get_datamart_client
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_PROVIDER_STATUSES = ('completed', 'failed', 'cancelled')
+# Provider statuses an order can be moved to; 'pending' means unpaid here and is never one of them
+ORDER_STATUSES = {status for targets in ORDER_TRANSITIONS.values() for status in targets} - {'pending'}
+
+POLLER_LOCK_KEY = 'datamart_poller:lock'
+POLLER_METRICS_KEY = 'datamart_poller:metrics'
+
+
+def next_poll_time(attempts, now=None):
+    """Exponential backoff for the next status check of an order."""
+    now = now or timezone.now()
+    base = settings.DATAMART_POLL_INTERVAL
+    delay = min(base * (2 ** attempts), settings.DATAMART_POLL_MAX_INTERVAL)
+    return now + timedelta(seconds=delay)
+
+
+def _fetch_status(provider_order_id):
+    try:
+        return get_datamart_client().get_order_status(provider_order_id), None
+    except Exception as e:
+        return None, e
+
+
+def apply_provider_status(order, status, now):
+    """Update poll bookkeeping on an order from a fetched provider status.
+
+    The order's own status is left alone; sync_order_status() moves it.
+    Returns True when the order no longer needs polling.
+    """
+    order.poll_attempts += 1
+    order.updated_at = now
+
+    if status:
+        order.provider_status = status[:20]
+
+    if status in TERMINAL_PROVIDER_STATUSES:
+        order.next_poll_at = None
+        return True
+
+    if order.poll_attempts >= settings.DATAMART_POLL_MAX_ATTEMPTS:
+        logger.warning(
+            f"[POLLER] Giving up on order {order.id} after {order.poll_attempts} attempts "
+            f"(last provider status={status})"
+        )
+        order.next_poll_at = None
+        return True
+
+    order.next_poll_at = next_poll_time(order.poll_attempts, now)
+    return False
+
+
+def sync_order_status(order, status):
+    """Move the order to the provider's status when the transition table allows it."""
+    if status not in ORDER_STATUSES or status == order.status:
+        return False
+    return transition(order, status)
+
+
+def poll_batch(orders, executor):
+    """Fetch provider statuses for one batch concurrently and bulk-save the result."""
+    now = timezone.now()
+    results = executor.map(_fetch_status, [order.provider_order_id for order in orders])
+
+    finished = 0
+    errors = 0
+    statuses = []
+    for order, (status, error) in zip(orders, results):
+        if isinstance(error, ProviderUnavailable):
+            # Never sent: check again later without spending one of the order's attempts
+            order.next_poll_at = next_poll_time(order.poll_attempts, now)
+            order.updated_at = now
+            statuses.append(None)
+            continue
+        if error is not None:
+            errors += 1
+            logger.error(f"[POLLER] Failed to fetch status for order {order.id}: {error}")
+        if apply_provider_status(order, status, now):
+            finished += 1
+        statuses.append(status)
+
+    # Bookkeeping is ours alone and goes out in one statement; status changes
+    # race with fulfilment and admins, so each is a compare-and-set
+    DataBundleOrder.objects.bulk_update(
+        orders,
+        ['provider_status', 'poll_attempts', 'next_poll_at', 'updated_at'],
+    )
+    for order, status in zip(orders, statuses):
+        sync_order_status(order, status)
+    return finished, errors
+
+
+def collect_queue_metrics(now=None):
+    """Queue depth of orders waiting on a provider status."""
+    now = now or timezone.now()
+    waiting = DataBundleOrder.objects.filter(next_poll_at__isnull=False)
+    oldest_due = waiting.filter(next_poll_at__lte=now).order_by('next_poll_at').values_list('next_poll_at', flat=True).first()
+    return {
+        'in_flight': waiting.count(),
+        'due': waiting.filter(next_poll_at__lte=now).count(),
+        'oldest_due_lag_seconds': (now - oldest_due).total_seconds() if oldest_due else 0,
+        'measured_at': now.isoformat(),
+    }
+
+
+def sweep_datamart_orders():
+    """Poll every order whose next status check is due, in bounded batches.
+
+    Only one sweep runs at a time; an overlapping call returns None.
+    """
+    lock_timeout = settings.DATAMART_POLL_LOCK_TIMEOUT
+    if not cache.add(POLLER_LOCK_KEY, 1, lock_timeout):
+        logger.info("[POLLER] Previous sweep still running, skipping")
+        return None
+
+    try:
+        now = timezone.now()
+        cutoff = now - timedelta(hours=settings.DATAMART_POLL_MAX_AGE_HOURS)
+        expired = DataBundleOrder.objects.filter(
+            next_poll_at__isnull=False,
+            created_at__lt=cutoff,
+        ).update(next_poll_at=None, updated_at=now)
+        if expired:
+            logger.warning(f"[POLLER] Stopped polling {expired} orders older than {settings.DATAMART_POLL_MAX_AGE_HOURS}h")
+
+        due = list(
+            DataBundleOrder.objects.filter(
+                next_poll_at__lte=now,
+                provider_order_id__isnull=False,
+            ).order_by('next_poll_at').only(
+                'id', 'status', 'provider_order_id', 'provider_status',
+                'poll_attempts', 'next_poll_at', 'updated_at',
+                # Read by the audit log and rollups when a status changes
+                'user', 'telco', 'phone_number', 'created_at',
+            )[:settings.DATAMART_POLL_SWEEP_LIMIT]
+        )
+
+        batch_size = settings.DATAMART_POLL_BATCH_SIZE
+        summary = {'polled': len(due), 'finished': 0, 'errors': 0, 'expired': expired}
+        with ThreadPoolExecutor(max_workers=settings.DATAMART_POLL_CONCURRENCY) as executor:
+            for start in range(0, len(due), batch_size):
+                finished, errors = poll_batch(due[start:start + batch_size], executor)
+                summary['finished'] += finished
+                summary['errors'] += errors
+
+        metrics = collect_queue_metrics()
+        metrics.update(summary)
+        cache.set(POLLER_METRICS_KEY, metrics, None)
+        logger.info(f"[POLLER] Sweep finished: {metrics}")
+        return metrics
+    finally:
+        cache.delete(POLLER_LOCK_KEY)
+
+
+def get_poller_metrics():
+    """Metrics recorded by the last completed sweep."""
+    return cache.get(POLLER_METRICS_KEY)
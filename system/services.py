@@ -1,18 +1,36 @@
 # home/services.py
+import hashlib
+import hmac
+import uuid
+from collections import Counter
+from datetime import timedelta
 import requests
-from authentication.models import DataBundleOrder, Payment, SystemConfiguration
+from authentication.models import DataBundleOrder, FulfilmentRecord, Payment, SystemConfiguration
+from authentication.transitions import transition
+from packages import circuit
+from packages.circuit import ProviderUnavailable
 from django.conf import settings
-from .datamart_client import DataMartClient
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import fulfilment
+from .datamart_client import get_datamart_client
+from .poller import TERMINAL_PROVIDER_STATUSES, next_poll_time
 import logging
 import json
 
 logger = logging.getLogger(__name__)
 
-PAYSTACK_API_BASE_URL = 'https://api.paystack.co'
+# Paystack statuses after which a transaction will never be paid
+PAYSTACK_UNPAID_STATUSES = ('failed', 'abandoned', 'reversed')
+
+
+def _paystack_timeout():
+    return (settings.PAYSTACK_CONNECT_TIMEOUT, settings.PAYSTACK_READ_TIMEOUT)
 
 def initialize_paystack_payment(email, amount, reference, callback_url):
     """Initializes a new transaction with Paystack."""
-    url = f'{PAYSTACK_API_BASE_URL}/transaction/initialize'
+    url = f'{settings.PAYSTACK_API_BASE_URL}/transaction/initialize'
     headers = {
         'Authorization': f'Bearer {settings.TEST_SECRET_KEY}',
         'Content-Type': 'application/json',
@@ -24,21 +42,204 @@ def initialize_paystack_payment(email, amount, reference, callback_url):
         'callback_url': callback_url,
     }
         
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
+    with circuit.guard('paystack'):
+        response = requests.post(url, headers=headers, json=payload, timeout=_paystack_timeout())
+        response.raise_for_status()
     return response.json()
 
 def verify_paystack_payment(reference):
     """Verifies a transaction with Paystack."""
-    url = f'{PAYSTACK_API_BASE_URL}/transaction/verify/{reference}'
+    url = f'{settings.PAYSTACK_API_BASE_URL}/transaction/verify/{reference}'
     headers = {
         'Authorization': f'Bearer {settings.TEST_SECRET_KEY}',
     }
         
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
+    with circuit.guard('paystack'):
+        response = requests.get(url, headers=headers, timeout=_paystack_timeout())
+        response.raise_for_status()
     return response.json()
 
+def verify_paystack_signature(payload, signature):
+    """Check the X-Paystack-Signature header (HMAC-SHA512 of the raw body)."""
+    if not signature or not settings.TEST_SECRET_KEY:
+        return False
+    expected = hmac.new(settings.TEST_SECRET_KEY.encode(), payload, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+def confirm_paystack_charge(reference, amount, paid_at=None):
+    """
+    Mark a payment successful from a verified charge.success event.
+
+    Safe to call repeatedly for the same reference: only the first event
+    for a pending payment changes anything. A charge for a payment already
+    failed (the customer paid after the reconciler gave up on it) still
+    succeeds, and its order is reopened so it is fulfilled as usual.
+
+    Args:
+        reference (str): Paystack transaction reference
+        amount (int): Charged amount in pesewas, as sent by Paystack
+        paid_at (str): ISO timestamp of the charge
+
+    Returns:
+        dict: Result of the operation
+    """
+    payment = Payment.objects.filter(reference=reference).first()
+    if payment is None:
+        logger.warning(f"Paystack charge for unknown reference {reference}")
+        return {'success': False, 'error': 'Payment not found'}
+
+    if payment.status == 'success':
+        logger.info(f"Duplicate Paystack charge event for reference {reference} ignored")
+        return {'success': True, 'duplicate': True, 'payment_id': payment.id}
+
+    expected_amount = int(payment.amount * 100)
+    if amount != expected_amount:
+        logger.error(
+            f"Paystack amount mismatch for reference {reference}: "
+            f"expected {expected_amount}, got {amount}"
+        )
+        return {'success': False, 'error': 'Amount mismatch'}
+
+    paid_at = (parse_datetime(paid_at) if paid_at else None) or timezone.now()
+    # Fulfilment is queued on commit, after the order is reopened
+    with transaction.atomic():
+        won = transition(payment, 'success', from_statuses=('pending', 'failed'), paid_at=paid_at)
+        if (won and payment.order.status == 'failed'
+                and not FulfilmentRecord.objects.filter(order_id=payment.order_id).exists()):
+            if transition(payment.order, 'pending', from_statuses=('failed',)):
+                logger.warning(f"Paystack charge for reference {reference} reopened failed order {payment.order_id}")
+    if not won:
+        # Another event for the same charge won the race, or the payment was already settled
+        if payment.status == 'success':
+            logger.info(f"Duplicate Paystack charge event for reference {reference} ignored")
+            return {'success': True, 'duplicate': True, 'payment_id': payment.id}
+        logger.error(f"Paystack charge for reference {reference} arrived for a {payment.status} payment")
+        return {'success': False, 'error': f'Payment is {payment.status}'}
+
+    logger.info(f"Payment {payment.id} confirmed by Paystack webhook")
+    return {'success': True, 'duplicate': False, 'payment_id': payment.id}
+
+def start_checkout(user, bundle, phone_number, callback_url, ip_address=None, user_agent=''):
+    """
+    Create a pending order and payment, then initialize the Paystack transaction.
+
+    The order and payment are committed before Paystack is called, so no
+    transaction or row lock is held across the HTTP round trip. If the call
+    fails the payment and order are marked failed and the error is re-raised;
+    a payment orphaned by a crash in between is picked up by the
+    reconcile_pending_payments task. While the Paystack circuit is open,
+    ProviderUnavailable is raised before anything is created.
+
+    Returns:
+        dict: authorization_url and reference for the client
+    """
+    if circuit.is_open('paystack'):
+        raise ProviderUnavailable('paystack', 'circuit open')
+
+    reference = str(uuid.uuid4())
+    with transaction.atomic():
+        order = DataBundleOrder.objects.create(
+            user=user,
+            telco=bundle.telco,
+            bundle=bundle,
+            phone_number=phone_number,
+            status='pending',
+            ip_address=ip_address,
+            user_agent=user_agent
+        )
+        payment = Payment.objects.create(
+            order=order,
+            amount=bundle.price,
+            reference=reference,
+            status='pending'
+        )
+
+    try:
+        paystack_response = initialize_paystack_payment(
+            email=user.email,
+            amount=payment.amount,
+            reference=reference,
+            callback_url=callback_url
+        )
+        data = paystack_response.get('data') or {}
+        if not paystack_response.get('status') or not data.get('authorization_url'):
+            raise ValueError(paystack_response.get('message') or "Failed to initialize payment with gateway.")
+    except Exception as e:
+        fail_pending_payment(payment.id, f"Paystack initialization failed: {str(e)}")
+        raise
+
+    # Paystack echoes our reference; only adopt a different one while nothing else has touched the payment
+    actual_reference = data.get('reference') or reference
+    if actual_reference != reference:
+        Payment.objects.filter(id=payment.id, reference=reference, status='pending').update(reference=actual_reference)
+
+    return {'authorization_url': data['authorization_url'], 'reference': actual_reference}
+
+def fail_pending_payment(payment_id, reason):
+    """Mark a still-pending payment and its pending order failed. Returns whether anything changed."""
+    payment = Payment.objects.select_related('order').filter(id=payment_id).first()
+    if payment is None or not transition(payment, 'failed'):
+        return False
+
+    order = payment.order
+    transition(order, 'failed', from_statuses=('pending',))
+
+    logger.warning(f"Payment {payment_id} for order {order.id} failed: {reason}")
+    return True
+
+def reconcile_pending_payment(payment):
+    """
+    Settle one pending payment from Paystack's record of it: confirm it if it
+    was charged, fail it if it never will be, otherwise leave it pending.
+    """
+    try:
+        response = verify_paystack_payment(payment.reference)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code in (400, 404):
+            # Paystack never saw the reference: initialization did not complete
+            fail_pending_payment(payment.id, "reference unknown to Paystack")
+            return 'failed'
+        raise
+
+    data = response.get('data') or {}
+    status = data.get('status')
+    if status == 'success':
+        result = confirm_paystack_charge(payment.reference, data.get('amount'), data.get('paid_at'))
+        return 'success' if result['success'] else 'mismatch'
+    if status in PAYSTACK_UNPAID_STATUSES:
+        fail_pending_payment(payment.id, f"Paystack status '{status}'")
+        return 'failed'
+    return 'pending'
+
+def sweep_pending_payments():
+    """
+    Check payments that are still pending PAYMENT_RECONCILE_AFTER seconds after
+    checkout (no webhook arrived, or checkout died before reaching Paystack).
+    Payments older than PAYMENT_RECONCILE_MAX_AGE_HOURS are left for review.
+    """
+    now = timezone.now()
+    payments = Payment.objects.filter(
+        status='pending',
+        created_at__lt=now - timedelta(seconds=settings.PAYMENT_RECONCILE_AFTER),
+        created_at__gte=now - timedelta(hours=settings.PAYMENT_RECONCILE_MAX_AGE_HOURS),
+    ).order_by('created_at')[:settings.PAYMENT_RECONCILE_BATCH_SIZE]
+
+    outcomes = Counter()
+    for payment in payments:
+        try:
+            outcomes[reconcile_pending_payment(payment)] += 1
+        except ProviderUnavailable as e:
+            # The rest would be refused too; the next sweep picks them up
+            logger.warning(f"Stopped reconciling payments: {e.reason}")
+            break
+        except Exception as e:
+            logger.error(f"Failed to reconcile payment {payment.id}: {str(e)}")
+            outcomes['error'] += 1
+
+    if outcomes:
+        logger.info(f"Reconciled pending payments: {dict(outcomes)}")
+    return dict(outcomes)
+
 def handle_successful_payment(order_id):
     """
     Handle successful payment with admin-controlled API triggering.
@@ -55,18 +256,19 @@ def handle_successful_payment(order_id):
         logger.error(f"Order with ID {order_id} not found")
         return {'success': False, 'error': 'Order not found'}
     
-    # Update order status to completed (always done regardless of API setting)
-    order.status = 'completed'
-    order.save()
+    # Update order status to completed (always done regardless of API setting).
+    # Only the caller that wins this transition goes on to DataMart, so a
+    # redelivered task or a second success event cannot buy the bundle twice.
+    if not transition(order, 'completed', from_statuses=('pending', 'processing')):
+        logger.warning(f"Order {order_id} is already {order.status}; not fulfilling it again")
+        return {'success': False, 'error': f'Order is {order.status}', 'order_status': order.status}
     
     # Update payment status if it exists
-    try:
-        payment = Payment.objects.get(order=order)
-        payment.status = 'success'
-        payment.save()
-        logger.info(f"Payment for order {order_id} marked as successful")
-    except Payment.DoesNotExist:
+    payment = Payment.objects.filter(order=order).first()
+    if payment is None:
         logger.warning(f"No payment record found for order {order_id}")
+    elif transition(payment, 'success'):
+        logger.info(f"Payment for order {order_id} marked as successful")
     
     # Check if auto API trigger is enabled
     is_auto_trigger_enabled = SystemConfiguration.is_auto_api_trigger_enabled()
@@ -92,31 +294,41 @@ def handle_successful_payment(order_id):
     
     return result
 
-def trigger_datamart_api(order):
+def trigger_datamart_api(order, claimed_by='auto'):
+    """Send the order's DataMart purchase, unless one was already claimed (see system.fulfilment)."""
+    record = fulfilment.claim(order, claimed_by)
+    if record is None:
+        return {
+            "success": False,
+            "duplicate": True,
+            "error": "A DataMart purchase was already claimed for this order",
+            "message": "DataMart API call skipped"
+        }
+
     phone_number = order.phone_number
     network_code = order.telco.code
     bundle_size_mb = order.bundle.size_mb
     bundle_size_gb = f"{bundle_size_mb / 1000:g}"  
 
-    print(f"[STEP 1] Preparing DataMart API call for order={order.id}")
-    print(f"[STEP 1.1] Phone={phone_number}, Network={network_code}, Bundle={bundle_size_gb}GB")
+    logger.debug(
+        f"Preparing DataMart purchase for order={order.id}: "
+        f"phone={phone_number}, network={network_code}, bundle={bundle_size_gb}GB"
+    )
 
     try:
-        client = DataMartClient(settings.DATAMART_API_KEY)
-        response = client.purchase_data(phone_number, network_code, bundle_size_gb)
+        client = get_datamart_client()
+        response = client.purchase_data(phone_number, network_code, bundle_size_gb, idempotency_key=record.idempotency_key)
 
-        print(f"[STEP 2] Raw DataMart API Response for order={order.id}: {response}")
+        logger.debug(f"DataMart response for order={order.id}: {response}")
 
         # Extract main "data" block
         data = response.get("data", {})
-        print(f"[STEP 3] Extracted 'data' block: {data}")
 
         # ✅ Grab orderReference from either level
         order_ref = (
             data.get("orderReference")
             or data.get("apiResponse", {}).get("data", {}).get("ref")
         )
-        print(f"[STEP 4] Extracted order_ref={order_ref}")
 
         # ✅ Determine status (prefer inner apiResponse → fall back to orderStatus → top-level status)
         status = (
@@ -125,20 +337,19 @@ def trigger_datamart_api(order):
             or response.get("status")
             or "pending"
         )
-        print(f"[STEP 5] Extracted status={status}")
 
-        # Save values into order
+        # Save values into order and hand it to the status poller
         order.provider_order_id = order_ref
         order.provider_status = status
-        order.save(update_fields=["provider_order_id", "provider_status", "status"])
-
-        print(f"[STEP 6] Order updated -> provider_order_id={order.provider_order_id}, status={order.status}")
-        print(f"[DEBUG] Extracted order_ref={order_ref}, status={status}")
-        print(f"[DEBUG] Saving to order {order.id} -> provider_order_id={order.provider_order_id}, provider_status={order.provider_status}")
-        order.refresh_from_db()
-        print(f"[CHECK DB] After save: provider_order_id={order.provider_order_id}, provider_status={order.provider_status}, status={order.status}")
-
+        order.poll_attempts = 0
+        if order_ref and status not in TERMINAL_PROVIDER_STATUSES:
+            order.next_poll_at = next_poll_time(0)
+        else:
+            order.next_poll_at = None
+        order.save(update_fields=["provider_order_id", "provider_status", "poll_attempts", "next_poll_at", "updated_at"])
+        fulfilment.record_sent(record, order_ref)
 
+        logger.debug(f"Order {order.id} sent to DataMart: provider_order_id={order_ref}, provider_status={status}")
 
         return {
             "success": True,
@@ -146,10 +357,22 @@ def trigger_datamart_api(order):
             "message": "DataMart API call successful"
         }
 
+    except ProviderUnavailable as e:
+        # Nothing was sent: keep the order completed and let the resume sweep send it later
+        fulfilment.record_deferred(record, e)
+        return {
+            "success": False,
+            "deferred": True,
+            "error": str(e),
+            "message": "DataMart API call deferred"
+        }
+
     except Exception as e:
-        print(f"[ERROR] DataMart API call failed for order={order.id}: {str(e)}")
-        order.status = "failed"
-        order.save(update_fields=["status"])
+        logger.exception(f"DataMart API call failed for order={order.id}: {str(e)}")
+        fulfilment.record_failed(record, e)
+        # An unknown outcome may still have been bought: the order stays completed for review
+        if record.status == "failed":
+            transition(order, "failed")
         return {
             "success": False,
             "error": str(e),
@@ -157,6 +380,32 @@ def trigger_datamart_api(order):
         }
 
 
+def sweep_deferred_fulfilments():
+    """
+    Send DataMart purchases deferred while its circuit was open, oldest first,
+    for orders that are still completed. Stops as soon as one is deferred again.
+    """
+    if circuit.is_open('datamart'):
+        return {}
+
+    records = (
+        FulfilmentRecord.objects.filter(status='deferred', order__status='completed')
+        .select_related('order__telco', 'order__bundle')
+        .order_by('created_at')[:settings.FULFILMENT_RESUME_BATCH_SIZE]
+    )
+    outcomes = Counter()
+    for record in records:
+        result = trigger_datamart_api(record.order, claimed_by=record.claimed_by)
+        if result.get('deferred'):
+            outcomes['deferred'] += 1
+            break
+        outcomes['sent' if result['success'] else 'failed'] += 1
+
+    if outcomes:
+        logger.info(f"Resumed deferred fulfilments: {dict(outcomes)}")
+    return dict(outcomes)
+
+
 def manually_trigger_api_for_order(order_id, admin_user):
     """
     Manually trigger DataMart API for a specific order (admin function).
@@ -188,7 +437,7 @@ def manually_trigger_api_for_order(order_id, admin_user):
             'error': 'Order must be completed before triggering API'
         }
     
-    api_result = trigger_datamart_api(order)
+    api_result = trigger_datamart_api(order, claimed_by=admin_user.email)
     
     # Log this manual action
     logger.info(f"Manual API trigger by admin {admin_user.email} for order {order_id}")
@@ -1,61 +1,75 @@
 from celery import shared_task
 from authentication.models import DataBundleOrder
-from .datamart_client import DataMartClient
-from django.conf import settings
+from django.utils import timezone
+from .datamart_client import get_datamart_client
+from .poller import apply_provider_status, sweep_datamart_orders, sync_order_status
+from .services import (
+    confirm_paystack_charge, handle_successful_payment, sweep_deferred_fulfilments, sweep_pending_payments,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
-@shared_task(bind=True, max_retries=None)
-def recheck_datamart_status(self, order_id):
+
+@shared_task(bind=True, ignore_result=True)
+def fulfil_order(self, order_id):
+    """Complete a paid order and hand it to DataMart off the request path.
+
+    Accepted purchases get a next_poll_at and are picked up by poll_datamart_orders.
+    """
+    logger.info(f"[TASK STARTED] fulfil_order for order_id={order_id}")
+    result = handle_successful_payment(order_id)
+    logger.info(f"[TASK COMPLETED] fulfil_order for order_id={order_id}: {result}")
+
+
+@shared_task(ignore_result=True)
+def process_paystack_charge(reference, amount, paid_at=None):
+    """Apply a verified charge.success webhook event to its payment."""
+    result = confirm_paystack_charge(reference, amount, paid_at)
+    logger.info(f"[TASK COMPLETED] process_paystack_charge for reference={reference}: {result}")
+
+
+@shared_task(ignore_result=True)
+def reconcile_pending_payments():
+    """Periodic check of payments left pending with no webhook, against Paystack's records."""
+    return sweep_pending_payments()
+
+
+@shared_task(ignore_result=True)
+def resume_deferred_fulfilments():
+    """Periodic retry of DataMart purchases deferred while its circuit was open."""
+    return sweep_deferred_fulfilments()
+
+
+@shared_task(ignore_result=True)
+def poll_datamart_orders():
+    """Periodic sweep that refreshes the provider status of all in-flight orders."""
+    return sweep_datamart_orders()
+
+
+@shared_task
+def recheck_datamart_status(order_id):
+    """Check a single order's provider status once, outside the periodic sweep."""
     logger.info(f"[TASK STARTED] recheck_datamart_status for order_id={order_id}")
 
     try:
         order = DataBundleOrder.objects.get(id=order_id)
-        logger.debug(
-            f"[DEBUG] Loaded Order {order.id} -> provider_order_id={order.provider_order_id}, status={order.status}"
-        )
     except DataBundleOrder.DoesNotExist:
         logger.warning(f"[TASK STOPPED] Order ID {order_id} no longer exists.")
-        return
+        return None
 
-    # 🔑 If provider_order_id missing, we cannot check status yet
     if not order.provider_order_id:
-        logger.warning(
-            f"[DEBUG] Order {order.id} has no provider_order_id yet. Retrying in 30s..."
-        )
-        raise self.retry(countdown=30)
+        logger.warning(f"[TASK STOPPED] Order {order.id} has no provider_order_id yet.")
+        return None
 
-    client = DataMartClient(settings.DATAMART_API_KEY)
     try:
-        response = client.get_order_status(order.provider_order_id)
-        status = response if isinstance(response, str) else None
-        logger.debug(
-            f"[DEBUG] DataMart returned status='{status}' for order {order.id}"
-        )
+        status = get_datamart_client().get_order_status(order.provider_order_id)
     except Exception as e:
-        logger.error(
-            f"[ERROR] Failed to fetch status for order {order.id}: {str(e)}",
-            exc_info=True,
-        )
-        raise self.retry(countdown=30)
-
-    # 🔄 Update order based on status
-    if status in ["completed", "failed"]:
-        order.status = status
-        order.save(update_fields=["status"])
-        logger.info(f"[TASK COMPLETED] Order {order.id} marked as '{status}' ✅")
-    elif status:
-        if order.status != status:
-            order.status = status
-            order.save(update_fields=["status"])
-            logger.debug(f"[DEBUG] Order {order.id} updated to '{status}'")
-        logger.info(
-            f"[DEBUG] Order {order.id} still pending/processing. Retrying in 30s..."
-        )
-        raise self.retry(countdown=30)
-    else:
-        logger.warning(
-            f"[WARNING] No valid status returned for order {order.id}. Retrying in 30s..."
-        )
-        raise self.retry(countdown=30)
+        logger.error(f"[ERROR] Failed to fetch status for order {order.id}: {str(e)}", exc_info=True)
+        return None
+
+    apply_provider_status(order, status, timezone.now())
+    order.save(update_fields=['provider_status', 'poll_attempts', 'next_poll_at', 'updated_at'])
+    sync_order_status(order, status)
+    logger.info(f"[TASK COMPLETED] Order {order.id} provider status '{status}'")
+    return status
@@ -1,3 +1,96 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from authentication.models import Bundle, CustomUser, DataBundleOrder, FulfilmentRecord, Payment, Telco
+from system.datamart_client import DataMartClient
+from system.tasks import fulfil_order, process_paystack_charge
+
+SECRET = 'sk_test_webhook'
+
+
+def sign(body, secret=SECRET):
+    return hmac.new(secret.encode(), body, hashlib.sha512).hexdigest()
+
+
+@override_settings(TEST_SECRET_KEY=SECRET)
+class PaystackWebhookTests(TestCase):
+    def setUp(self):
+        telco = Telco.objects.create(name='MTN', code='YELLO')
+        bundle = Bundle.objects.create(telco=telco, name='1GB', size_mb=1000, price=Decimal('4.50'))
+        user = CustomUser.objects.create(
+            email='buyer@example.com', full_name='Buyer', phone_number='0240000001', account_status='active',
+        )
+        self.order = DataBundleOrder.objects.create(user=user, telco=telco, bundle=bundle, phone_number='0240000001')
+        self.payment = Payment.objects.create(order=self.order, amount=bundle.price, reference='ref-webhook-1')
+
+        # Run the queued tasks inline
+        for task in (process_paystack_charge, fulfil_order):
+            patcher = mock.patch.object(task, 'delay', side_effect=lambda *args, task=task: task.apply(args=args))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.purchase = mock.patch.object(
+            DataMartClient, 'purchase_data',
+            return_value={'status': 'success', 'data': {'orderReference': 'DM-1', 'orderStatus': 'pending'}},
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def event(self, amount=450):
+        return json.dumps({
+            'event': 'charge.success',
+            'data': {'reference': self.payment.reference, 'amount': amount, 'paid_at': '2026-01-01T10:00:00Z'},
+        }).encode()
+
+    def post(self, body, signature=None):
+        headers = {} if signature is None else {'HTTP_X_PAYSTACK_SIGNATURE': signature}
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('paystack_webhook'), body, content_type='application/json', **headers)
+
+    def test_missing_signature_is_rejected(self):
+        response = self.post(self.event())
+
+        self.assertEqual(response.status_code, 401)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'pending')
+
+    def test_bad_signature_is_rejected(self):
+        body = self.event()
+        response = self.post(body, signature=sign(body, secret='sk_someone_else'))
+
+        self.assertEqual(response.status_code, 401)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'pending')
+        self.purchase.assert_not_called()
+
+    def test_signed_event_confirms_and_fulfils(self):
+        body = self.event()
+        response = self.post(body, signature=sign(body))
+
+        self.assertEqual(response.status_code, 200)
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.payment.status, 'success')
+        self.assertEqual(self.order.status, 'completed')
+        self.purchase.assert_called_once()
+
+    def test_replayed_event_does_not_fulfil_twice(self):
+        body = self.event()
+        for _ in range(2):
+            self.assertEqual(self.post(body, signature=sign(body)).status_code, 200)
+
+        self.purchase.assert_called_once()
+        self.assertEqual(FulfilmentRecord.objects.filter(order=self.order).count(), 1)
+
+    def test_wrong_amount_is_not_confirmed(self):
+        body = self.event(amount=1)
+        self.post(body, signature=sign(body))
+
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'pending')
+        self.purchase.assert_not_called()
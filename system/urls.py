@@ -11,5 +11,6 @@ urlpatterns = [
    path('', TestHomeView.as_view(), name='home'),
    path('payment/', PaymentView.as_view(), name='payment_initiate'),
    path('payment/callback/', PaymentView.as_view(), name='payment_callback'),
+   path('payment/webhook/', PaystackWebhookView.as_view(), name='paystack_webhook'),
    
 ]
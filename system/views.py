@@ -7,23 +7,27 @@ from django.contrib import messages
 from django.db.models import Count, Q
 from django.views.generic import ListView
 from django.views.generic import TemplateView
-from django.core.paginator import Paginator
+from packages.pagination import CursorPaginator
 from authentication.models import *
 from django.shortcuts import render
 from django.views.generic import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 import uuid
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
 from django.urls import reverse
 from django.db import transaction
 from django.views.generic import View, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from authentication.models import Bundle, DataBundleOrder, Payment
-from .services import initialize_paystack_payment, verify_paystack_payment
+from .services import start_checkout, verify_paystack_signature
+from packages.circuit import ProviderUnavailable
 import logging
 from django.conf import settings
-from .tasks import recheck_datamart_status
+from .tasks import process_paystack_charge
+from .catalog import CUSTOMER, get_catalog
 logger = logging.getLogger(__name__)
 
 # Create your views here.
@@ -33,27 +37,11 @@ class HomeView(TemplateView):
     template_name = 'home/home.html'
 
     def get(self, request, *args, **kwargs):
-        bundles = Bundle.objects.select_related('telco').filter(is_agent_bundle=False).order_by('telco__name', 'size_mb')
-        data_plans = {}
-
-        for bundle in bundles:
-            size_display = f"{bundle.size_mb // 1000}GB" if bundle.size_mb >= 1000 else f"{bundle.size_mb}MB"
-            validity = "Non-Expiry" if bundle.telco.name.lower() in ['mtn', 'telecel'] else "30 days"
-
-            provider_name = bundle.telco.name
-            if provider_name not in data_plans:
-                data_plans[provider_name] = []
-
-            data_plans[provider_name].append({
-                'id': bundle.id,
-                'size': size_display,
-                'price': f"GH₵ {bundle.price:.2f}",
-                'validity': validity,
-                'code': bundle.telco.code
-            })
+        catalog = get_catalog(CUSTOMER)
 
         context = {
-            'data_plans': data_plans,
+            'data_plans': catalog['data_plans'],
+            'data_plans_json': catalog['data_plans_json'],
             'paystack_public_key': settings.TEST_PUBLIC_KEY,
             'user': request.user
         }
@@ -107,77 +95,34 @@ class TestHomeView(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        logger.debug("[TestHomeView] Fetching non-agent bundles...")
-        bundles = Bundle.objects.select_related('telco').filter(is_agent_bundle=False).order_by('telco__name', 'size_mb')
-        logger.debug(f"[TestHomeView] Total bundles fetched: {bundles.count()}")
-
-        data_plans = {}
-        telco_stock_status = {}  # <-- new dict for telco stock states
-
-        for bundle in bundles:
-            size_display = f"{bundle.size_mb // 1000}GB" if bundle.size_mb >= 1000 else f"{bundle.size_mb}MB"
-            validity = "Non-Expiry" if bundle.telco.name.lower() in ['mtn', 'telecel'] else "30 days"
-
-            provider_name = bundle.telco.name
-            if provider_name not in data_plans:
-                data_plans[provider_name] = []
-                telco_stock_status[provider_name] = []
-                logger.debug(f"[TestHomeView] Initializing telco entry: {provider_name}")
-
-            # Add bundle info
-            data_plans[provider_name].append({
-                'id': bundle.id,
-                'size': size_display,
-                'price': f"{bundle.price:.2f}",
-                'validity': validity,
-                'code': bundle.telco.code,
-                'is_instock': bundle.is_instock
-            })
-
-            logger.debug(
-                f"[TestHomeView] Bundle added | Telco={provider_name}, Size={size_display}, "
-                f"Price={bundle.price:.2f}, Stock={bundle.is_instock}"
-            )
-
-            # Track stock availability for this telco
-            telco_stock_status[provider_name].append(bundle.is_instock)
-
-        # Determine stock summary per telco
-        telco_summary = {}
-        for telco, stocks in telco_stock_status.items():
-            if all(stocks):
-                telco_summary[telco] = "in-stock"
-            elif any(stocks):
-                telco_summary[telco] = "limited-stock"
-            else:
-                telco_summary[telco] = "out-of-stock"
-
-            logger.debug(f"[TestHomeView] Telco summary | {telco}: {telco_summary[telco]}")
+        catalog = get_catalog(CUSTOMER)
+        logger.debug(f"[TestHomeView] Using customer catalog built at {catalog['built_at']}")
 
-        # Fetch user orders
-        orders = DataBundleOrder.objects.filter(user=self.request.user).order_by('-created_at')
-        logger.debug(f"[TestHomeView] Orders for {self.request.user}: {orders.count()}")
-
-        paginator = Paginator(orders, 15)
-        page_number = self.request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
-        logger.debug(f"[TestHomeView] Paginated orders | Page={page_number}, Objects={len(page_obj)}")
+        # Fetch one page of the user's orders
+        orders = DataBundleOrder.objects.filter(user=self.request.user).select_related('telco', 'bundle', 'payment')
+        page_obj = CursorPaginator(orders, 15).page(
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+        )
+        logger.debug(f"[TestHomeView] Paginated orders | Objects={len(page_obj)}, More={page_obj.has_next}")
 
-        # Fetch today’s recent orders
-        today = timezone.now().date()
-        rec_orders = DataBundleOrder.objects.filter(created_at__date=today).order_by('-created_at')
-        logger.debug(f"[TestHomeView] Recent orders today ({today}): {rec_orders.count()}")
+        # Fetch the user's orders from today; a range on created_at uses the (user, created_at, id) index
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        rec_orders = orders.filter(created_at__gte=today).order_by('-created_at')
 
         # Update context
         context.update({
-            'data_plans': data_plans,
-            'telco_summary': telco_summary,
+            'data_plans': catalog['data_plans'],
+            'telco_summary': catalog['telco_summary'],
             'paystack_public_key': settings.TEST_PUBLIC_KEY,
             'user': self.request.user,
-            'orders': orders,
+            'orders': page_obj.object_list,
             'rec_orders': rec_orders,
             'page_obj': page_obj,
-            'telcos': Telco.objects.all()
+            'telcos': catalog['telcos'],
+            # Catalog fragments in the template are cached per catalog build
+            'catalog_version': catalog['built_at'],
+            'catalog_cache_timeout': settings.CATALOG_CACHE_TIMEOUT,
         })
 
         logger.debug("[TestHomeView] Context successfully prepared.")
@@ -204,54 +149,27 @@ class PaymentView(LoginRequiredMixin, View):
             return JsonResponse({'status': 'error', 'message': 'Missing bundle ID or phone number'}, status=400)
 
         try:
-            with transaction.atomic():
-                bundle = get_object_or_404(Bundle, pk=bundle_id)
-                user = request.user
-
-                # Create order
-                order = DataBundleOrder.objects.create(
-                    user=user,
-                    telco=bundle.telco,
-                    bundle=bundle,
-                    phone_number=phone_number,
-                    status='pending',
-                    ip_address=request.META.get('REMOTE_ADDR'),
-                    user_agent=request.META.get('HTTP_USER_AGENT', '')
-                )
-
-                # Temp reference
-                temp_reference = str(uuid.uuid4())
-
-                # Create payment record
-                payment = Payment.objects.create(
-                    order=order,
-                    amount=bundle.price,
-                    reference=temp_reference,
-                    status='pending'
-                )
-
-                # Build callback
-                callback_url = request.build_absolute_uri(reverse('payment_callback'))
-
-                # Init Paystack
-                paystack_response = initialize_paystack_payment(
-                    email=user.email,
-                    amount=payment.amount,
-                    reference=temp_reference,
-                    callback_url=callback_url
-                )
-
-                # Update payment reference from Paystack
-                actual_reference = paystack_response['data'].get('reference')
-                if actual_reference:
-                    payment.reference = actual_reference
-                    payment.save(update_fields=['reference'])
-
-                return JsonResponse({
-                    'status': 'success',
-                    'authorization_url': paystack_response['data']['authorization_url'],
-                    'reference': actual_reference
-                })
+            bundle = get_object_or_404(Bundle, pk=bundle_id)
+
+            # Order and payment are committed first; Paystack is called outside any transaction
+            checkout = start_checkout(
+                user=request.user,
+                bundle=bundle,
+                phone_number=phone_number,
+                callback_url=request.build_absolute_uri(reverse('payment_callback')),
+                ip_address=request.META.get('REMOTE_ADDR'),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            )
+
+            return JsonResponse({
+                'status': 'success',
+                'authorization_url': checkout['authorization_url'],
+                'reference': checkout['reference']
+            })
+
+        except ProviderUnavailable as e:
+            logger.warning(f"Checkout refused: {e.reason}")
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=503)
 
         except Exception as e:
             logger.error(f"Error initiating payment: {e}", exc_info=True)
@@ -259,52 +177,61 @@ class PaymentView(LoginRequiredMixin, View):
 
     def get(self, request, *args, **kwargs):
         """
-        Handles the GET request from Paystack after a payment attempt.
+        Handles the redirect back from Paystack after a payment attempt.
+
+        Confirmation arrives through the webhook, so this only reports the
+        payment status already stored in the database.
         """
         user = request.user
         reference = request.GET.get('reference')
         if not reference:
-            return redirect(reverse('test_home') + '?payment_status=failed&message=Invalid payment reference')
+            return redirect(reverse('home') + '?payment_status=failed&message=Invalid payment reference')
 
-        try:
-            paystack_response = verify_paystack_payment(reference)
-
-            payment = get_object_or_404(Payment, reference=reference)
-            order = payment.order
-
-            if paystack_response['data']['status'] == 'success':
-                with transaction.atomic():
-                    # Update payment
-                    payment.status = 'success'
-                    payment.paid_at = paystack_response['data']['paid_at']
-                    payment.save()
-
-                    order.save()
-
-                # Redirects by user role
-                if user.role == 'customer':
-                    messages.success(request, f"Payment successful for order {order.id}. Your data bundle will be processed shortly.")
-                    return redirect(reverse('home') + f'?payment_status=success&order_id={order.id}')
-                elif user.role == 'agent':
-                    messages.success(request, f"Payment successful for order {order.id}. The data bundle will be processed shortly.")
-                    return redirect(reverse('agent_home_page') + f'?payment_status=success&order_id={order.id}')
-                else:
-                    messages.success(request, f"Payment successful for order {order.id}. The data bundle will be processed shortly.")
-                    return redirect(reverse('home') + f'?payment_status=success&order_id={order.id}')
+        payment = Payment.objects.select_related('order').filter(reference=reference).first()
+        if payment is None:
+            logger.warning(f"Payment callback for unknown reference {reference}")
+            return redirect(reverse('home') + '?payment_status=failed&message=Invalid payment reference')
+
+        order = payment.order
+        home_url = reverse('agent_home_page') if user.role == 'agent' else reverse('home')
 
+        if payment.status == 'success':
+            if user.role == 'customer':
+                messages.success(request, f"Payment successful for order {order.id}. Your data bundle will be processed shortly.")
             else:
-                with transaction.atomic():
-                    payment.status = 'failed'
-                    payment.save()
+                messages.success(request, f"Payment successful for order {order.id}. The data bundle will be processed shortly.")
+            return redirect(home_url + f'?payment_status=success&order_id={order.id}')
 
-                    order.status = 'failed'
-                    order.save()
+        if payment.status == 'pending':
+            messages.info(request, f"We are confirming your payment for order {order.id}. Your data bundle will be processed once it is confirmed.")
+            return redirect(home_url + f'?payment_status=pending&order_id={order.id}')
 
-                return redirect(reverse('test_home') + '?payment_status=failed')
+        return redirect(home_url + '?payment_status=failed')
 
-        except Exception as e:
-            logger.error(f"Error during payment verification for reference {reference}: {e}", exc_info=True)
-            return redirect(reverse('home') + f'?payment_status=error&message={str(e)}')
+
+@method_decorator(csrf_exempt, name='dispatch')
+class PaystackWebhookView(View):
+    """Receives Paystack events and queues charge.success for processing."""
+
+    def post(self, request, *args, **kwargs):
+        signature = request.headers.get('X-Paystack-Signature', '')
+        if not verify_paystack_signature(request.body, signature):
+            logger.warning("Rejected Paystack webhook with an invalid signature")
+            return HttpResponse(status=401)
+
+        try:
+            event = json.loads(request.body)
+        except ValueError:
+            return HttpResponse(status=400)
+
+        if event.get('event') == 'charge.success':
+            data = event.get('data') or {}
+            reference = data.get('reference')
+            if reference:
+                process_paystack_charge.delay(reference, data.get('amount'), data.get('paid_at'))
+
+        # Acknowledge every authentic event so Paystack stops redelivering it
+        return HttpResponse(status=200)
 
 
 
@@ -332,39 +259,19 @@ class GuestOrderView(View):
                 }
             )
 
-            with transaction.atomic():
-                order = DataBundleOrder.objects.create(
-                    user=guest_user,
-                    telco=bundle.telco,
-                    bundle=bundle,
-                    phone_number=phone_number,
-                    status='pending',
-                    ip_address=request.META.get('REMOTE_ADDR'),
-                    user_agent=request.META.get('HTTP_USER_AGENT', '')
-                )
-                
-                reference = str(uuid.uuid4())
-                
-                payment = Payment.objects.create(
-                    order=order,
-                    amount=bundle.price,
-                    reference=reference,
-                    status='pending'
-                )
-                
-                callback_url = request.build_absolute_uri(reverse('payment_callback'))
-
-                paystack_response = initialize_paystack_payment(
-                    email=guest_user.email,
-                    amount=payment.amount,
-                    reference=reference,
-                    callback_url=callback_url
-                )
-
-                if paystack_response.get('status'):
-                    return JsonResponse({'status': 'success', 'authorization_url': paystack_response['data']['authorization_url']})
-                else:
-                    raise Exception("Failed to initialize payment with gateway.")
+            checkout = start_checkout(
+                user=guest_user,
+                bundle=bundle,
+                phone_number=phone_number,
+                callback_url=request.build_absolute_uri(reverse('payment_callback')),
+                ip_address=request.META.get('REMOTE_ADDR'),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            )
+            return JsonResponse({'status': 'success', 'authorization_url': checkout['authorization_url']})
+
+        except ProviderUnavailable as e:
+            logger.warning(f"Checkout refused: {e.reason}")
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=503)
 
         except Exception as e:
             logger.error(f"Error during guest order creation: {e}", exc_info=True)